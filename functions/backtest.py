@@ -0,0 +1,137 @@
+"""
+Dividend-reinvestment backtests over stored histories.
+
+A position is bought at the first close in the range and held to the last.
+On each ex-date the dividend per share (net of `tax_rate`) is either
+reinvested at that day's close or kept as cash. Every step is a pass over
+whole columns: with reinvestment the value is
+
+    value[t] = close[t] / close[0] * prod(1 + net_dividend[i] / close[i], ex-dates i <= t)
+
+and without it, close[t] / close[0] plus the cash collected so far, both
+per unit invested. Histories come from StockHistoryReader (batched,
+parallel get_all) and dividends from the stocks/{code}.dividends maps
+({'YYYY': {'MM-DD': amount}}), which are read in one get_all.
+"""
+
+import operator
+from datetime import date, timedelta
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from history_reader import StockHistoryReader
+
+# Korean dividend income tax (14% + 1.4% local); pass it as tax_rate for after-tax results
+KR_DIVIDEND_TAX_RATE = 0.154
+# Annualizing shorter ranges gives meaningless CAGRs; they report None
+MIN_CAGR_DAYS = 180
+
+
+def dividend_events(stock: Optional[Dict]) -> List[Tuple[str, float]]:
+    """[(YYYYMMDD, amount per share)] from a stocks/{code} document, oldest first."""
+    events = []
+    for year, month_days in ((stock or {}).get('dividends') or {}).items():
+        for month_day, amount in (month_days or {}).items():
+            events.append((f"{year}{month_day.replace('-', '')}", float(amount)))
+    return sorted(events)
+
+
+def dividend_column(dates: List[str], events: List[Tuple[str, float]]) -> List[float]:
+    """
+    Dividend per share credited on each day. An ex-date that is not a stored
+    trading day is credited on the next one; ex-dates on or before the
+    purchase day (dates[0]) are not earned.
+    """
+    column = [0.0] * len(dates)
+    idx = 0
+    for ex_date, amount in events:
+        if not dates or ex_date <= dates[0]:
+            continue
+        while idx < len(dates) and dates[idx] < ex_date:
+            idx += 1
+        if idx == len(dates):
+            break
+        column[idx] += amount
+    return column
+
+
+def max_drawdown(dates: List[str], values: List[float]) -> Dict:
+    """Largest peak-to-trough fall as a negative fraction, with its peak and trough dates."""
+    if not values:
+        return {'maxDrawdown': 0.0, 'peak': None, 'trough': None}
+    peaks = list(accumulate(values, max))
+    drawdowns = [value / peak - 1 if peak else 0.0 for value, peak in zip(values, peaks)]
+    trough = min(range(len(drawdowns)), key=drawdowns.__getitem__)
+    peak = max(range(trough + 1), key=values.__getitem__)
+    return {'maxDrawdown': drawdowns[trough], 'peak': dates[peak], 'trough': dates[trough]}
+
+
+def simulate(columns: Dict, events: List[Tuple[str, float]], *, reinvest=True, tax_rate=0.0,
+             include_series=False) -> Dict:
+    """Backtest one code's columnar history ({"dates", "close", ...}) against its dividends."""
+    dates, close = columns["dates"], columns["close"]
+    if len(dates) < 2 or not close[0]:
+        return {'code': columns.get("code"), 'error': 'Not enough history in range.'}
+
+    base = close[0]
+    dividends = [amount * (1 - tax_rate) for amount in dividend_column(dates, events)]
+    price_index = [price / base for price in close]
+    if reinvest:
+        factors = [1 + dividend / price if dividend and price else 1.0 for dividend, price in zip(dividends, close)]
+        values = [relative * units for relative, units in zip(price_index, accumulate(factors, operator.mul))]
+    else:
+        cash = accumulate(dividend / base for dividend in dividends)
+        values = [relative + collected for relative, collected in zip(price_index, cash)]
+
+    first_day = date(int(dates[0][:4]), int(dates[0][4:6]), int(dates[0][6:]))
+    last_day = date(int(dates[-1][:4]), int(dates[-1][4:6]), int(dates[-1][6:]))
+    held_days = (last_day - first_day).days
+    ttm_start = (last_day - timedelta(days=365)).strftime("%Y%m%d")
+    ttm_dividends = sum(amount for ex_date, amount in events if ttm_start < ex_date <= dates[-1])
+
+    result = {
+        'code': columns.get("code"),
+        'start': dates[0],
+        'end': dates[-1],
+        'days': len(dates),
+        'totalReturn': round(values[-1] - 1, 6),
+        'priceReturn': round(price_index[-1] - 1, 6),
+        'cagr': (round(values[-1] ** (365.25 / held_days) - 1, 6)
+                 if held_days >= MIN_CAGR_DAYS and values[-1] > 0 else None),
+        'dividendCount': sum(1 for dividend in dividends if dividend),
+        'dividendsPerShare': round(sum(dividends), 4),
+        # Trailing-12-month dividends per share over the purchase price
+        'yieldOnCost': round(ttm_dividends * (1 - tax_rate) / base, 6),
+        'reinvest': reinvest,
+        'taxRate': tax_rate,
+    }
+    drawdown = max_drawdown(dates, values)
+    result.update({**drawdown, 'maxDrawdown': round(drawdown['maxDrawdown'], 6)})
+    if include_series:
+        result['series'] = {'dates': dates, 'value': [round(value, 6) for value in values]}
+    return result
+
+
+class BacktestEngine:
+    """Runs dividend backtests for many codes from one batched read of their history."""
+
+    def __init__(self, db, reader: Optional[StockHistoryReader] = None):
+        self.db = db
+        self.reader = reader or StockHistoryReader(db)
+
+    def load_dividends(self, stock_codes: List[str]) -> Dict[str, List[Tuple[str, float]]]:
+        refs = [self.db.collection('stocks').document(code) for code in stock_codes]
+        return {
+            snapshot.id: dividend_events(snapshot.to_dict() if snapshot.exists else None)
+            for snapshot in self.db.get_all(refs, field_paths=['dividends'])
+        }
+
+    def run(self, stock_codes: Iterable[str], start: date, end: date, **options) -> Dict[str, Dict]:
+        """{code: simulate() result}; options are passed to simulate()."""
+        stock_codes = list(dict.fromkeys(stock_codes))
+        dividends = self.load_dividends(stock_codes)
+        histories = self.reader.read_many(stock_codes, start, end)
+        return {
+            code: simulate(histories[code], dividends.get(code, []), **options)
+            for code in stock_codes
+        }
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the functions module.
+
+Each sample runs in a fresh interpreter: import main, then call one endpoint
+once with an empty request, timing both steps and noting which heavy
+packages the path loaded. Run from the functions directory with the same
+environment the function gets:
+
+    python bench_cold_start.py                          # health_check, 10 samples
+    python bench_cold_start.py --endpoint fetch_stock_data --args force=0 --samples 5
+    python bench_cold_start.py --check-lazy             # exit 1 if health_check loads firebase_admin
+
+fetch_stock_data returns right away on non-trading days, which is the
+scheduler's cheapest path; on trading days it really collects, so point it
+at the emulator (FIRESTORE_EMULATOR_HOST) or a staging project.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Packages whose import dominates a cold start
+HEAVY_MODULES = ("firebase_admin", "google.cloud.firestore", "grpc", "google.events", "httpx")
+
+_SAMPLE = r"""
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+class Request:
+    args = json.loads(sys.argv[2])
+    headers = {}
+    def get_json(self, silent=False):
+        return {}
+
+error = None
+try:
+    getattr(main, sys.argv[1])(Request())
+except Exception as exc:  # pylint: disable=broad-except
+    error = repr(exc)
+finished = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_call_ms": (finished - imported) * 1000,
+    "loaded": [name for name in json.loads(sys.argv[3]) if name in sys.modules],
+    "error": error,
+}))
+"""
+
+
+def run_sample(endpoint, args):
+    output = subprocess.run(
+        [sys.executable, "-c", _SAMPLE, endpoint, json.dumps(args), json.dumps(HEAVY_MODULES)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(values):
+    ordered = sorted(values)
+    p90 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+    return f"median {statistics.median(ordered):8.1f} ms   p90 {p90:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and first-request latency of main.py.")
+    parser.add_argument('--endpoint', default='health_check', help='Function in main.py to call once per sample.')
+    parser.add_argument('--args', nargs='*', default=[], metavar='KEY=VALUE', help='Query arguments for the request.')
+    parser.add_argument('--samples', type=int, default=10, help='Fresh interpreters to start.')
+    parser.add_argument('--check-lazy', action='store_true',
+                        help='Exit 1 if the endpoint loads firebase_admin (use with health_check).')
+    args = parser.parse_args()
+
+    request_args = dict(item.split('=', 1) for item in args.args)
+    samples = [run_sample(args.endpoint, request_args) for _ in range(args.samples)]
+
+    print(f"{args.endpoint} ({args.samples} cold starts)")
+    print(f"  import main   {summarize([s['import_ms'] for s in samples])}")
+    print(f"  first call    {summarize([s['first_call_ms'] for s in samples])}")
+    print(f"  total         {summarize([s['import_ms'] + s['first_call_ms'] for s in samples])}")
+    loaded = sorted({name for s in samples for name in s['loaded']})
+    print(f"  heavy modules loaded: {', '.join(loaded) or 'none'}")
+    errors = sorted({s['error'] for s in samples if s['error']})
+    for error in errors:
+        print(f"  error: {error}")
+
+    if args.check_lazy and 'firebase_admin' in loaded:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
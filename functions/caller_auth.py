@@ -0,0 +1,107 @@
+"""
+Caller checks for HTTP endpoints that write data, spend KIS quota or list users.
+
+Callers send "Authorization: Bearer <token>" with one of:
+  Google-signed OIDC ID token  service accounts (Cloud Scheduler, Cloud Tasks);
+                               the email must be in TRUSTED_INVOKER_EMAILS
+  Firebase ID token            signed-in users carrying the `admin` custom claim
+
+CALLER_AUTH=0 turns the checks off for the emulator and local runs only.
+"""
+
+import logging
+import os
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CallerAuthError(PermissionError):
+    """Rejected caller; `status` is the HTTP status to answer with (401 or 403)."""
+
+    def __init__(self, message: str, status: int = 403):
+        super().__init__(message)
+        self.status = status
+
+
+def auth_enabled() -> bool:
+    return os.environ.get("CALLER_AUTH", "1") != "0"
+
+
+def trusted_invokers(extra: Iterable[str] = ()) -> set:
+    """Service-account emails allowed to call protected endpoints."""
+    emails = os.environ.get("TRUSTED_INVOKER_EMAILS", "").split(",")
+    return {email.strip().lower() for email in (*emails, *extra) if email and email.strip()}
+
+
+def bearer_token(request) -> Optional[str]:
+    header = (request.headers.get("Authorization", "") if request is not None else "").strip()
+    scheme, _, token = header.partition(" ")
+    return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+
+
+def _verify_google_token(token: str, audience: Optional[str]) -> Dict:
+    """Claims of a Google-signed OIDC ID token; raises ValueError when invalid."""
+    from google.auth.transport import requests as google_requests
+    from google.oauth2 import id_token
+
+    return id_token.verify_oauth2_token(token, google_requests.Request(), audience=audience)
+
+
+def _verify_firebase_token(token: str) -> Dict:
+    """Claims of a Firebase ID token; raises when invalid, expired or revoked."""
+    from firebase_admin import auth
+
+    return auth.verify_id_token(token, check_revoked=True)
+
+
+def _service_account(token: str, audience: Optional[str], allowed: set) -> Optional[str]:
+    """Email of a trusted service account holding `token`, or None if it is not one."""
+    try:
+        claims = _verify_google_token(token, audience)
+    except ValueError:
+        return None
+    email = str(claims.get("email") or "").lower()
+    if not claims.get("email_verified") or email not in allowed:
+        raise CallerAuthError(f"Service account {email or '(unknown)'} may not call this endpoint.")
+    return email
+
+
+def require_service_caller(request, audience: Optional[str] = None, extra_invokers: Iterable[str] = ()) -> str:
+    """
+    Accept only a trusted service account's OIDC token (audience checked when
+    given). Returns the caller's email; raises CallerAuthError otherwise.
+    """
+    if not auth_enabled():
+        return "auth-disabled"
+    token = bearer_token(request)
+    if not token:
+        raise CallerAuthError("Missing bearer token.", status=401)
+    email = _service_account(token, audience, trusted_invokers(extra_invokers))
+    if email is None:
+        raise CallerAuthError("Invalid or expired ID token.", status=401)
+    return email
+
+
+def require_admin(request) -> str:
+    """
+    Accept a trusted service account or a Firebase user with the `admin`
+    claim. Returns the service-account email or the user's uid.
+    """
+    if not auth_enabled():
+        return "auth-disabled"
+    token = bearer_token(request)
+    if not token:
+        raise CallerAuthError("Missing bearer token.", status=401)
+
+    email = _service_account(token, None, trusted_invokers())
+    if email is not None:
+        return email
+    try:
+        claims = _verify_firebase_token(token)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("Rejected ID token: %s", exc)
+        raise CallerAuthError("Invalid or expired ID token.", status=401) from exc
+    if claims.get("admin") is not True:
+        raise CallerAuthError("Admin privileges required.")
+    return claims.get("uid") or claims.get("sub")
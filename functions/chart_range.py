@@ -0,0 +1,94 @@
+"""
+Chart-range responses assembled from stocks/{code}/monthly documents.
+
+A range is served as one compact columnar JSON body (gzip-compressed once
+and kept in an in-instance LRU), keyed by the metadata/system update stamp
+so a collection run invalidates every cached range at once.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from history_reader import StockHistoryReader
+from kis_cache import CoalescingCache
+
+# Default window when the request has no start date
+DEFAULT_RANGE_DAYS = 365
+# Longest range one request may ask for
+MAX_RANGE_DAYS = int(os.environ.get("CHART_MAX_RANGE_DAYS", 366 * 10))
+# metadata/system fields whose change means stored data may have changed
+STAMP_FIELDS = ("lastAttemptedUpdate", "lastUpdate", "lastRestatement", "lastJournalReplay", "lastShardUpdate")
+
+
+def parse_date(value: str) -> date:
+    """Accept YYYYMMDD or YYYY-MM-DD."""
+    value = value.strip()
+    fmt = "%Y-%m-%d" if "-" in value else "%Y%m%d"
+    return datetime.strptime(value, fmt).date()
+
+
+def parse_range(start: Optional[str], end: Optional[str], today: date) -> Tuple[date, date]:
+    end_date = parse_date(end) if end else today
+    start_date = parse_date(start) if start else end_date - timedelta(days=DEFAULT_RANGE_DAYS)
+    if start_date > end_date:
+        raise ValueError("start must not be after end.")
+    if (end_date - start_date).days > MAX_RANGE_DAYS:
+        raise ValueError(f"Range is longer than {MAX_RANGE_DAYS} days.")
+    return start_date, end_date
+
+
+class ChartRangeCache:
+    """
+    In-instance cache of encoded chart-range responses. The metadata/system
+    stamp is re-read at most every `stamp_ttl` seconds; when it changes the
+    cache is cleared.
+    """
+
+    def __init__(self, db, max_entries=256, stamp_ttl=30.0, reader=None):
+        self.db = db
+        self.reader = reader or StockHistoryReader(db)
+        self.stamp_ttl = stamp_ttl
+        # Entries only die by stamp change or LRU, so the TTL is effectively infinite
+        self._cache = CoalescingCache(max_entries=max_entries, ttl_seconds=float("inf"))
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._stamp_checked = 0.0
+
+    def stamp(self) -> str:
+        with self._lock:
+            if time.monotonic() - self._stamp_checked < self.stamp_ttl and self._stamp is not None:
+                return self._stamp
+        snapshot = self.db.collection('metadata').document('system').get()
+        data = snapshot.to_dict() if snapshot.exists else {}
+        stamp = "|".join(str(data.get(field)) for field in STAMP_FIELDS)
+        with self._lock:
+            if stamp != self._stamp:
+                self._cache.clear()
+                self.reader.clear()
+                self._stamp = stamp
+            self._stamp_checked = time.monotonic()
+        return stamp
+
+    def get(self, stock_code: str, start: date, end: date) -> Dict:
+        """
+        {"etag", "body", "gzip"} for the range; the body is compact JSON and
+        `gzip` its compressed form.
+        """
+        stamp = self.stamp()
+
+        def load():
+            columns = self.reader.read(stock_code, start, end)
+            body = json.dumps(columns, separators=(",", ":")).encode("utf-8")
+            etag = hashlib.sha1(stamp.encode("utf-8") + body).hexdigest()[:20]
+            return {"etag": f'"{etag}"', "body": body, "gzip": gzip.compress(body, compresslevel=6)}
+
+        return self._cache.get_or_load((stock_code, start, end, stamp), load)
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
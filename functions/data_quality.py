@@ -0,0 +1,135 @@
+"""
+Data-quality checks over columnar daily history.
+
+Every check takes the whole column set for one code ({"dates": [YYYYMMDD],
+"open": [...], ...}, as built by history_reader.to_columns) and works
+column-wise, so a code is scanned in a handful of passes regardless of
+which source the columns came from:
+
+    duplicates   the same date more than once (SQL only; Firestore keys are unique)
+    missing      KRX trading days between the first and last stored day
+                 with no row (only inside market_calendar.covered_years())
+    off_calendar rows stored on weekends or KRX holidays
+    ohlc         low above open/close, high below open/close, or a
+                 non-positive price
+    zero_volume  runs of at least ZERO_VOLUME_STREAK days with volume 0
+    jumps        close-to-close moves beyond JUMP_THRESHOLD
+"""
+
+import os
+from datetime import date, datetime
+from typing import Dict, List
+
+from market_calendar import covered_years, is_trading_day, trading_days_between
+
+# KRX daily price limit is +/-30%; anything beyond it is a data error or an
+# unadjusted corporate action (see restatement.py)
+JUMP_THRESHOLD = float(os.environ.get("QUALITY_JUMP_THRESHOLD", 0.3))
+ZERO_VOLUME_STREAK = int(os.environ.get("QUALITY_ZERO_VOLUME_STREAK", 3))
+# Example dates kept per check and code; counts are always exact
+MAX_SAMPLES = 5
+
+CHECKS = ("duplicates", "missing", "off_calendar", "ohlc", "zero_volume", "jumps")
+
+
+def _to_date(key: str) -> date:
+    return datetime.strptime(key, "%Y%m%d").date()
+
+
+def duplicate_dates(dates: List[str]) -> List[str]:
+    return [current for previous, current in zip(dates, dates[1:]) if current == previous]
+
+
+def missing_trading_days(dates: List[str]) -> List[str]:
+    """Trading days inside [first, last] stored day that have no row."""
+    years = covered_years()
+    if not dates or not years:
+        return []
+    start = max(_to_date(dates[0]), date(years[0], 1, 1))
+    end = min(_to_date(dates[-1]), date(years[-1], 12, 31))
+    if start > end:
+        return []
+    stored = set(dates)
+    return [day.strftime("%Y%m%d") for day in trading_days_between(start, end)
+            if day.strftime("%Y%m%d") not in stored]
+
+
+def off_calendar_days(dates: List[str]) -> List[str]:
+    years = set(covered_years())
+    return [key for key in dict.fromkeys(dates)
+            if int(key[:4]) in years and not is_trading_day(_to_date(key))]
+
+
+def ohlc_violations(columns: Dict) -> List[str]:
+    return [
+        key for key, open_, high, low, close in zip(
+            columns["dates"], columns["open"], columns["high"], columns["low"], columns["close"])
+        if min(open_, high, low, close) <= 0 or low > min(open_, close) or high < max(open_, close)
+    ]
+
+
+def zero_volume_streaks(dates: List[str], volume: List[int], min_length=ZERO_VOLUME_STREAK) -> List[str]:
+    """Runs of zero volume as "first~last" date ranges."""
+    streaks = []
+    run_start = None
+    for idx, value in enumerate(volume + [1]):
+        if value == 0:
+            if run_start is None:
+                run_start = idx
+        elif run_start is not None:
+            if idx - run_start >= min_length:
+                streaks.append(f"{dates[run_start]}~{dates[idx - 1]}")
+            run_start = None
+    return streaks
+
+
+def price_jumps(dates: List[str], close: List[int], threshold=JUMP_THRESHOLD) -> List[str]:
+    """Dates whose close moved more than `threshold` from the previous close."""
+    return [
+        key for key, previous, current in zip(dates[1:], close, close[1:])
+        if previous > 0 and abs(current / previous - 1) > threshold
+    ]
+
+
+def scan_columns(columns: Dict, jump_threshold=JUMP_THRESHOLD, zero_volume_streak=ZERO_VOLUME_STREAK) -> Dict:
+    """
+    Run every check on one code. Returns {"code", "days", "first", "last",
+    "counts": {check: n}, "samples": {check: [dates]}}; checks without
+    findings are left out of counts and samples.
+    """
+    dates = columns["dates"]
+    findings = {
+        "duplicates": duplicate_dates(dates),
+        "missing": missing_trading_days(dates),
+        "off_calendar": off_calendar_days(dates),
+        "ohlc": ohlc_violations(columns),
+        "zero_volume": zero_volume_streaks(dates, columns["volume"], zero_volume_streak),
+        "jumps": price_jumps(dates, columns["close"], jump_threshold),
+    }
+    findings = {check: found for check, found in findings.items() if found}
+    return {
+        "code": columns.get("code"),
+        "days": len(dates),
+        "first": dates[0] if dates else None,
+        "last": dates[-1] if dates else None,
+        "counts": {check: len(found) for check, found in findings.items()},
+        "samples": {check: found[:MAX_SAMPLES] for check, found in findings.items()},
+    }
+
+
+def summarize(results: List[Dict]) -> Dict:
+    """Compact report: totals per check plus only the codes with findings."""
+    totals = {check: 0 for check in CHECKS}
+    flagged = {}
+    for result in results:
+        for check, count in result["counts"].items():
+            totals[check] += count
+        if result["counts"]:
+            flagged[result["code"]] = {key: result[key] for key in ("first", "last", "counts", "samples")}
+    return {
+        "codes": len(results),
+        "days": sum(result["days"] for result in results),
+        "flagged": len(flagged),
+        "totals": totals,
+        "issues": dict(sorted(flagged.items())),
+    }
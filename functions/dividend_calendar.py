@@ -0,0 +1,93 @@
+"""
+Market-wide ex-dividend calendar.
+
+Each dividendCalendar/{YYYY-MM} document lists every ex-date in that month
+across all stocks, so a calendar view is a single read:
+
+    {'month': '2025-01',
+     'entries': {'475080_24': {'code', 'name', 'date', 'amount', 'period'}}}
+
+Entries are keyed by "{code}_{DD}" so one stock's change touches only its
+own keys (merge writes, DELETE_FIELD for removals).
+"""
+
+from collections import defaultdict
+from typing import Dict, Optional
+
+CALENDAR_COLLECTION = 'dividendCalendar'
+
+
+def calendar_ref(db, month_id):
+    return db.collection(CALENDAR_COLLECTION).document(month_id)
+
+
+def stock_entries(stock_code: str, stock: Optional[Dict]) -> Dict[str, Dict[str, Dict]]:
+    """
+    {month_id: {entry_key: entry}} for one stocks/{code} document, read from
+    its dividends map ({'YYYY': {'MM-DD': amount}}).
+    """
+    entries: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+    if not stock:
+        return entries
+    for year, month_days in (stock.get('dividends') or {}).items():
+        for month_day, amount in (month_days or {}).items():
+            month, day = month_day.split('-')
+            entries[f"{year}-{month}"][f"{stock_code}_{day}"] = {
+                'code': stock_code,
+                'name': stock.get('name'),
+                'date': f"{year}-{month}-{day}",
+                'amount': amount,
+                'period': stock.get('period'),
+            }
+    return entries
+
+
+def build_calendar_docs(stocks: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Calendar documents for {code: stock_doc}, built in one pass."""
+    docs: Dict[str, Dict] = {}
+    for stock_code, stock in stocks.items():
+        for month_id, entries in stock_entries(stock_code, stock).items():
+            docs.setdefault(month_id, {'month': month_id, 'entries': {}})['entries'].update(entries)
+    return docs
+
+
+def write_calendar_docs(db, docs: Dict[str, Dict], batch_size=400) -> int:
+    """Merge calendar documents; other stocks' entries are left alone."""
+    from firebase_admin import firestore
+
+    batch = db.batch()
+    batch_count = 0
+    for month_id, doc in docs.items():
+        batch.set(calendar_ref(db, month_id), {**doc, 'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+        batch_count += 1
+        if batch_count >= batch_size:
+            batch.commit()
+            batch = db.batch()
+            batch_count = 0
+    if batch_count:
+        batch.commit()
+    return len(docs)
+
+
+def apply_dividend_change(db, stock_code: str, before: Optional[Dict], after: Optional[Dict]) -> int:
+    """
+    Update the calendar for one stocks/{code} write. Only months whose
+    entries differ are written; returns the number of calendar docs touched.
+    """
+    from firebase_admin import firestore
+
+    old_entries = stock_entries(stock_code, before)
+    new_entries = stock_entries(stock_code, after)
+
+    updates: Dict[str, Dict] = {}
+    for month_id in set(old_entries) | set(new_entries):
+        old_month = old_entries.get(month_id, {})
+        new_month = new_entries.get(month_id, {})
+        changed = {key: entry for key, entry in new_month.items() if old_month.get(key) != entry}
+        removed = {key: firestore.DELETE_FIELD for key in old_month if key not in new_month}
+        if changed or removed:
+            updates[month_id] = {'month': month_id, 'entries': {**changed, **removed}}
+
+    if updates:
+        write_calendar_docs(db, updates)
+    return len(updates)
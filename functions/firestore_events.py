@@ -0,0 +1,41 @@
+"""
+Decoding of Firestore trigger payloads (protobuf DocumentEventData, as
+delivered to functions_framework.cloud_event handlers).
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+
+def _decode_value(value):
+    """Convert a google.events Firestore Value message to a Python value."""
+    kind = value._pb.WhichOneof('value_type')
+    if kind is None or kind == 'null_value':
+        return None
+    if kind == 'integer_value':
+        return int(value.integer_value)
+    if kind == 'map_value':
+        return {key: _decode_value(item) for key, item in value.map_value.fields.items()}
+    if kind == 'array_value':
+        return [_decode_value(item) for item in value.array_value.values]
+    return getattr(value, kind)
+
+
+def parse_document_event(data: bytes) -> Tuple[List[str], Optional[Dict], Optional[Dict]]:
+    """
+    Return (path segments, before, after) for a document event, e.g.
+    (['users', uid, 'lines', lineId], {...}, None) for a delete. before is
+    None on create, after is None on delete.
+    """
+    from google.events.cloud import firestore as firestoredata
+
+    payload = firestoredata.DocumentEventData()
+    payload._pb.ParseFromString(data)
+
+    def _fields(document):
+        if not document.name:
+            return None
+        return {key: _decode_value(value) for key, value in document.fields.items()}
+
+    document = payload.value if payload.value.name else payload.old_value
+    parts = document.name.split('/documents/', 1)[-1].split('/')
+    return parts, _fields(payload.old_value), _fields(payload.value)
@@ -0,0 +1,128 @@
+"""
+Batched reader for stocks/{code}/monthly/{YYYY-MM} history.
+
+A (code, start, end) range maps to the exact month document IDs, which are
+fetched with get_all in chunks (chunks run in parallel across codes) and
+decoded into sorted columnar arrays. Months before the current KST month
+no longer change day to day, so they are memoized in-process; call
+clear() after rewriting history (re-encode, restatements).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+
+from market_calendar import today_kst
+from ohlcv_codec import FIELDS, decode_month
+
+MonthKey = Tuple[str, str]
+
+
+def month_ids(start: date, end: date) -> List[str]:
+    """YYYY-MM document IDs covering [start, end]."""
+    ids = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        ids.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return ids
+
+
+def to_columns(stock_code: str, days_by_month: Dict[str, Dict], start_key="", end_key="99999999") -> Dict:
+    """{"code", "dates": [YYYYMMDD], "open": [...], ...} for days within [start_key, end_key]."""
+    rows = []
+    for month_id, days in days_by_month.items():
+        prefix = month_id.replace("-", "")
+        for day, values in days.items():
+            key = prefix + day
+            if start_key <= key <= end_key:
+                rows.append((key, values))
+    rows.sort(key=lambda row: row[0])
+
+    columns = {"code": stock_code, "dates": [key for key, _ in rows]}
+    for field in FIELDS:
+        columns[field] = [values[field] for _, values in rows]
+    return columns
+
+
+class StockHistoryReader:
+    """Reads monthly OHLCV documents with few, batched RPCs."""
+
+    def __init__(self, db, chunk_size=None, max_workers=None, max_memo_months=None):
+        self.db = db
+        # get_all takes many refs per RPC; chunks keep each response bounded
+        self.chunk_size = int(chunk_size or os.environ.get("HISTORY_GET_ALL_CHUNK", 100))
+        self.max_workers = int(max_workers or os.environ.get("HISTORY_READ_WORKERS", 8))
+        self.max_memo_months = int(max_memo_months or os.environ.get("HISTORY_MEMO_MONTHS", 20000))
+        self._memo: "OrderedDict[MonthKey, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.rpc_count = 0
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+
+    def _monthly_ref(self, stock_code, month_id):
+        return self.db.collection('stocks').document(stock_code).collection('monthly').document(month_id)
+
+    def _fetch_chunk(self, keys: List[MonthKey]) -> Dict[MonthKey, Dict]:
+        refs = [self._monthly_ref(code, month_id) for code, month_id in keys]
+        key_by_path = {ref.path: key for ref, key in zip(refs, keys)}
+        with self._lock:
+            self.rpc_count += 1
+        fetched = {key: {} for key in keys}
+        for snapshot in self.db.get_all(refs):
+            if snapshot.exists:
+                fetched[key_by_path[snapshot.reference.path]] = decode_month(snapshot.to_dict())
+        return fetched
+
+    def read_months(self, keys: Iterable[MonthKey]) -> Dict[MonthKey, Dict]:
+        """{(code, YYYY-MM): {day: {field: value}}}; missing months map to {}."""
+        keys = list(dict.fromkeys(keys))
+        current_month = today_kst().strftime("%Y-%m")
+
+        result = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._memo:
+                    self._memo.move_to_end(key)
+                    result[key] = self._memo[key]
+                else:
+                    missing.append(key)
+
+        chunks = [missing[i:i + self.chunk_size] for i in range(0, len(missing), self.chunk_size)]
+        if len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+                fetched_chunks = list(pool.map(self._fetch_chunk, chunks))
+        else:
+            fetched_chunks = [self._fetch_chunk(chunk) for chunk in chunks]
+
+        with self._lock:
+            for fetched in fetched_chunks:
+                for key, days in fetched.items():
+                    result[key] = days
+                    if key[1] < current_month:
+                        self._memo[key] = days
+                        self._memo.move_to_end(key)
+            while len(self._memo) > self.max_memo_months:
+                self._memo.popitem(last=False)
+        return result
+
+    def read_many(self, stock_codes: Iterable[str], start: date, end: date) -> Dict[str, Dict]:
+        """Columnar history for several codes over the same range: {code: columns}."""
+        stock_codes = list(dict.fromkeys(stock_codes))
+        ids = month_ids(start, end)
+        months = self.read_months((code, month_id) for code in stock_codes for month_id in ids)
+        start_key, end_key = start.strftime("%Y%m%d"), end.strftime("%Y%m%d")
+        return {
+            code: to_columns(code, {month_id: months[(code, month_id)] for month_id in ids}, start_key, end_key)
+            for code in stock_codes
+        }
+
+    def read(self, stock_code: str, start: date, end: date) -> Dict:
+        """Columnar history for one code."""
+        return self.read_many([stock_code], start, end)[stock_code]
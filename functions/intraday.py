@@ -0,0 +1,158 @@
+"""
+Intraday quote ingestion.
+Polls current prices for tracked codes, drops unchanged ticks and writes at
+most one update per code per write interval to stocks/{code}/intraday/latest,
+so Firestore writes stay bounded however often KIS is polled.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from market_calendar import is_market_open, now_kst
+
+logger = logging.getLogger(__name__)
+
+FIRESTORE_BATCH_LIMIT = 400
+
+# Upper bound on one poll_intraday invocation, whatever ?duration asks for
+MAX_RUN_SECONDS = float(os.environ.get("INTRADAY_MAX_DURATION", 300))
+
+# Fields that identify a distinct tick; anything else is derived
+TICK_KEY_FIELDS = ("price", "volume")
+
+
+def intraday_doc_ref(db, code):
+    return db.collection('stocks').document(code).collection('intraday').document('latest')
+
+
+class IntradayPoller:
+    """
+    Polls KIS current prices and writes throttled, batched snapshots.
+
+    Kept at module scope by the caller so coalescing state (last tick and last
+    write per code) carries over between warm invocations.
+    """
+
+    def __init__(self, client, db, *, poll_interval=None, concurrency=None, write_interval=None):
+        self.client = client
+        self.db = db
+        self.poll_interval = float(poll_interval or os.environ.get("INTRADAY_POLL_INTERVAL", 5))
+        self.concurrency = int(concurrency or os.environ.get("INTRADAY_CONCURRENCY", 8))
+        self.write_interval = float(write_interval or os.environ.get("INTRADAY_WRITE_INTERVAL", 60))
+        self._lock = threading.Lock()
+        self._last_ticks: Dict[str, tuple] = {}
+        self._pending: Dict[str, Dict] = {}
+        self._last_write: Dict[str, float] = {}
+        self.stats = {"polls": 0, "ticks": 0, "coalesced": 0, "writes": 0, "errors": 0}
+
+    def _fetch(self, code) -> Optional[Dict]:
+        try:
+            return self.client.get_current_price(code)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Intraday fetch failed for %s: %s", code, exc)
+            return None
+
+    def poll_once(self, codes: List[str]) -> int:
+        """Fetch quotes concurrently; returns how many codes produced a new tick."""
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(codes)))) as pool:
+            quotes = list(pool.map(self._fetch, codes))
+
+        stamp = now_kst()
+        changed = 0
+        with self._lock:
+            self.stats["polls"] += 1
+            for code, quote in zip(codes, quotes):
+                if not quote:
+                    self.stats["errors"] += 1
+                    continue
+                key = tuple(quote.get(field) for field in TICK_KEY_FIELDS)
+                if self._last_ticks.get(code) == key:
+                    self.stats["coalesced"] += 1
+                    continue
+                self._last_ticks[code] = key
+                self._pending[code] = {
+                    **quote,
+                    "date": stamp.strftime("%Y%m%d"),
+                    "time": stamp.strftime("%H%M%S"),
+                }
+                changed += 1
+            self.stats["ticks"] += changed
+        return changed
+
+    def flush(self, force=False) -> int:
+        """
+        Write pending ticks whose code has not been written within the write
+        interval (or all of them when `force`). Returns the number of writes.
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = {
+                code: tick for code, tick in self._pending.items()
+                if force or now - self._last_write.get(code, float("-inf")) >= self.write_interval
+            }
+            for code in due:
+                del self._pending[code]
+
+        if not due:
+            return 0
+
+        from firebase_admin import firestore
+
+        written = 0
+        items = list(due.items())
+        for start in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+            chunk = items[start:start + FIRESTORE_BATCH_LIMIT]
+            batch = self.db.batch()
+            for code, tick in chunk:
+                batch.set(intraday_doc_ref(self.db, code), {
+                    **tick,
+                    'updated_at': firestore.SERVER_TIMESTAMP,
+                })
+            try:
+                batch.commit()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Intraday batch write failed (%d codes): %s", len(chunk), exc)
+                with self._lock:
+                    # Re-queue unless a newer tick arrived meanwhile
+                    for code, tick in chunk:
+                        self._pending.setdefault(code, tick)
+                    self.stats["errors"] += len(chunk)
+                continue
+            with self._lock:
+                for code, _ in chunk:
+                    self._last_write[code] = now
+                self.stats["writes"] += len(chunk)
+            written += len(chunk)
+        return written
+
+    def forget(self, codes: Iterable[str]):
+        """Drop tick state of codes that left the universe, so no pending tick is written for them."""
+        with self._lock:
+            for code in codes:
+                self._last_ticks.pop(code, None)
+                self._pending.pop(code, None)
+                self._last_write.pop(code, None)
+
+    def run(self, codes: List[str], duration: float, respect_market_hours=True) -> Dict:
+        """
+        Poll for up to `duration` seconds. Ticks still inside their write
+        interval stay pending for the next invocation, except after the close.
+        """
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            if respect_market_hours and not is_market_open():
+                break
+            started = time.monotonic()
+            self.poll_once(codes)
+            self.flush()
+            remaining = self.poll_interval - (time.monotonic() - started)
+            if remaining > 0 and time.monotonic() + remaining < deadline:
+                time.sleep(remaining)
+            elif remaining > 0:
+                break
+        self.flush(force=respect_market_hours and not is_market_open())
+        return dict(self.stats)
@@ -0,0 +1,274 @@
+"""
+asyncio-native KIS client.
+Same surface as KISClient (token, get_daily_price, get_current_price) on a
+single pooled httpx connection (HTTP/2 where the server negotiates it), with
+an async rate limiter and bulk helpers that yield results as they complete.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from kis_common import (
+    CURRENT_PRICE_PATH,
+    DAILY_PRICE_PATH,
+    TOKEN_PATH,
+    TR_CURRENT_PRICE,
+    TR_DAILY_PRICE,
+    base_url,
+    current_price_params,
+    daily_price_params,
+    load_credentials,
+    parse_current_price,
+    parse_daily_price,
+    parse_daily_series,
+    quote_headers,
+    token_expires_at,
+    token_request_body,
+)
+from kis_cache import daily_series_key, daily_series_ttl, kis_response_cache
+from retry_policy import (
+    FATAL,
+    KIS_CIRCUIT_MAX_WAIT,
+    RETRY,
+    CircuitOpenError,
+    RetryPolicy,
+    is_rate_limited,
+    kis_circuit_breaker,
+)
+
+logger = logging.getLogger(__name__)
+
+# Failures that cost one code its result instead of aborting the whole gather:
+# transport/status errors, an open circuit, non-JSON bodies or a missing token
+# (ValueError), and malformed payloads (KeyError/TypeError)
+QUOTE_ERRORS = (httpx.HTTPError, CircuitOpenError, ValueError, KeyError, TypeError)
+
+
+class AsyncRateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, bursting to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncKISClient:
+    """
+    Async counterpart of KISClient. Use as an async context manager:
+
+        async with AsyncKISClient() as client:
+            async for code, data in client.iter_daily_prices(codes):
+                ...
+    """
+
+    def __init__(self, is_prod=True, access_token=None, *, rate_per_second=None,
+                 max_connections=None, timeout=10.0):
+        self.app_key, self.app_secret = load_credentials()
+        self.base_url = base_url(is_prod)
+        self.access_token = access_token
+        # A token handed in is used as-is for the run
+        self._token_expires_at = float("inf") if access_token else 0.0
+        self.retry_policy = RetryPolicy.from_env()
+        # KIS allows ~20 req/s on real accounts and ~2 req/s on VTS (모의투자)
+        default_rate = 18 if is_prod else 2
+        self.rate_limiter = AsyncRateLimiter(
+            rate_per_second or float(os.environ.get("KIS_RATE_PER_SECOND", default_rate))
+        )
+        self.max_connections = int(max_connections or os.environ.get("KIS_MAX_CONNECTIONS", 10))
+        self.timeout = timeout
+        self._http: Optional[httpx.AsyncClient] = None
+        self._token_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=True,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _request(self, method, path, **kwargs) -> httpx.Response:
+        """Async mirror of KISClient._request_with_retry."""
+        if self._http is None:
+            raise RuntimeError("AsyncKISClient must be used inside 'async with'.")
+
+        policy = self.retry_policy
+        delay = 0.0
+        for attempt in range(1, policy.max_attempts + 1):
+            waited = 0.0
+            wait = kis_circuit_breaker.wait_time()
+            while wait > 0:
+                if waited + wait > KIS_CIRCUIT_MAX_WAIT:
+                    raise CircuitOpenError("KIS circuit breaker is open")
+                await asyncio.sleep(wait)
+                waited += wait
+                wait = kis_circuit_breaker.wait_time()
+
+            response = None
+            recorded = False
+            try:
+                await self.rate_limiter.acquire()
+                response = await self._http.request(method, path, **kwargs)
+                if not is_rate_limited(response) and response.status_code < 400:
+                    kis_circuit_breaker.record_success()
+                    recorded = True
+                    return response
+                decision = policy.classify(response=response)
+                if decision == FATAL:
+                    # KIS answered, so it is reachable; the request itself is bad
+                    kis_circuit_breaker.record_success()
+                    recorded = True
+                    response.raise_for_status()
+                error = httpx.HTTPStatusError(
+                    f"KIS returned {response.status_code}", request=response.request, response=response
+                )
+            except httpx.TransportError as exc:
+                decision = RETRY
+                error = exc
+            finally:
+                if not recorded:
+                    # Settle the call on any exit (cancellation included) so a
+                    # half-open probe never stays in flight
+                    kis_circuit_breaker.record_failure()
+
+            if attempt == policy.max_attempts:
+                raise error
+            delay = policy.next_delay(delay, decision, response)
+            logger.warning(
+                "KIS async %s %s failed (attempt %d/%d, %s), retrying in %.1fs: %s",
+                method.upper(), path, attempt, policy.max_attempts, decision, delay, error,
+            )
+            await asyncio.sleep(delay)
+
+    async def ensure_token(self) -> str:
+        """
+        Return a valid access token, fetching a new one when missing or about
+        to expire; concurrent coroutines share one fetch.
+        """
+        async with self._token_lock:
+            if not self.access_token or time.time() >= self._token_expires_at:
+                response = await self._request(
+                    "post",
+                    TOKEN_PATH,
+                    headers={"content-type": "application/json"},
+                    json=token_request_body(self.app_key, self.app_secret),
+                )
+                res_data = response.json()
+                access_token = res_data.get("access_token")
+                if not access_token:
+                    raise ValueError("Access token not found in API response.")
+                self.access_token = access_token
+                self._token_expires_at = token_expires_at(res_data)
+                logger.info("Successfully fetched KIS API access token.")
+        return self.access_token
+
+    async def _quote(self, path, tr_id, params) -> Dict:
+        await self.ensure_token()
+        headers = quote_headers(self.access_token, self.app_key, self.app_secret, tr_id)
+        response = await self._request("get", path, headers=headers, params=params)
+        return response.json()
+
+    async def get_daily_price(self, stock_code) -> Optional[Dict]:
+        try:
+            res_data = await self._quote(DAILY_PRICE_PATH, TR_DAILY_PRICE, daily_price_params(stock_code))
+            return parse_daily_price(res_data, stock_code)
+        except QUOTE_ERRORS as e:
+            logger.error(f"Failed to get daily price for {stock_code}: {e}")
+            return None
+
+    async def get_daily_series(self, stock_code) -> Optional[List[Dict]]:
+        """Recent adjusted daily series, newest first (see KISClient.get_daily_series)."""
+        try:
+            res_data = await self._quote(DAILY_PRICE_PATH, TR_DAILY_PRICE, daily_price_params(stock_code))
+            return parse_daily_series(res_data, stock_code)
+        except QUOTE_ERRORS as e:
+            logger.error(f"Failed to get daily series for {stock_code}: {e}")
+            return None
+
+    async def get_current_price(self, stock_code) -> Optional[Dict]:
+        try:
+            res_data = await self._quote(CURRENT_PRICE_PATH, TR_CURRENT_PRICE, current_price_params(stock_code))
+            return parse_current_price(res_data, stock_code)
+        except QUOTE_ERRORS as e:
+            logger.error(f"Failed to get current price for {stock_code}: {e}")
+            return None
+
+    async def iter_daily_prices(self, stock_codes: Iterable[str]) -> AsyncIterator[Tuple[str, Optional[Dict]]]:
+        """Yield (code, daily_data) pairs in completion order."""
+        await self.ensure_token()
+
+        async def fetch(code):
+            return code, await self.get_daily_price(code)
+
+        for future in asyncio.as_completed([fetch(code) for code in stock_codes]):
+            yield await future
+
+    async def gather_daily_prices(self, stock_codes: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Fetch all codes concurrently and return {code: daily_data}."""
+        return {code: data async for code, data in self.iter_daily_prices(stock_codes)}
+
+    async def gather_daily_series(self, stock_codes: Iterable[str]) -> Dict[str, Optional[List[Dict]]]:
+        """Fetch all codes concurrently and return {code: daily series}."""
+        stock_codes = list(stock_codes)
+        if not stock_codes:
+            return {}
+        await self.ensure_token()
+        series = await asyncio.gather(*(self.get_daily_series(code) for code in stock_codes))
+        return dict(zip(stock_codes, series))
+
+
+def fetch_daily_prices(stock_codes, access_token=None, is_prod=True,
+                       cache_stats: Optional[Dict[str, int]] = None) -> Dict[str, Optional[Dict]]:
+    """
+    Blocking helper for synchronous callers such as fetch_stock_data. Goes
+    through the same response cache as KISClient.get_daily_series: cached
+    codes are not requested, and fetched series are stored for later callers
+    (e.g. a restatement pass). `cache_stats` receives the hit/miss counts.
+    """
+    stock_codes = list(dict.fromkeys(stock_codes))
+    url = base_url(is_prod)
+    keys = {code: daily_series_key(url, DAILY_PRICE_PATH, code) for code in stock_codes}
+    series = {code: kis_response_cache.get(keys[code], counters=cache_stats) for code in stock_codes}
+    missing = [code for code, value in series.items() if value is None]
+
+    async def _run():
+        async with AsyncKISClient(is_prod=is_prod, access_token=access_token) as client:
+            return await client.gather_daily_series(missing)
+
+    if missing:
+        ttl = daily_series_ttl()
+        for code, value in asyncio.run(_run()).items():
+            kis_response_cache.put(keys[code], value, ttl)
+            series[code] = value
+    return {code: value[0] if value else None for code, value in series.items()}
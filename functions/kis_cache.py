@@ -0,0 +1,151 @@
+"""
+Response cache with in-flight request coalescing for KIS quote lookups.
+Entries expire after a TTL and are evicted least-recently-used first;
+concurrent callers asking for the same key share one loader call.
+
+Daily series are keyed by trading date and, once the session is over, kept
+until the next one opens (daily_series_ttl), so a restatement pass after the
+collection run is served from memory however long the run took. Callers
+reserve() room for the whole universe so no code is evicted mid-run.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Optional
+
+from market_calendar import is_market_open, latest_trading_day, next_session_open, now_kst
+
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class CoalescingCache:
+    """Thread-safe TTL + LRU cache whose misses are single-flighted per key."""
+
+    def __init__(self, max_entries=2048, ttl_seconds=300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._in_flight: Dict[Hashable, _InFlight] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reserve(self, entries: int):
+        """Grow max_entries to at least `entries` (never shrinks)."""
+        with self._lock:
+            self.max_entries = max(self.max_entries, int(entries))
+
+    def _store(self, key, value, ttl_seconds):
+        self._entries[key] = (time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: Hashable, counters: Optional[Dict[str, int]] = None):
+        """Cached value for `key`, or None; counted as a hit or a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count("hits", counters)
+                return entry[1]
+            self._count("misses", counters)
+            return None
+
+    def put(self, key: Hashable, value, ttl_seconds: Optional[float] = None):
+        """Store a value loaded outside get_or_load (e.g. by a batched async fetch)."""
+        if value is None:
+            return
+        with self._lock:
+            self._store(key, value, ttl_seconds)
+
+    def _count(self, outcome, counters):
+        self._stats[outcome] += 1
+        if counters is not None:
+            counters[outcome] = counters.get(outcome, 0) + 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], object],
+                    counters: Optional[Dict[str, int]] = None, ttl_seconds: Optional[float] = None):
+        """
+        Return the cached value for `key`, or call `loader` once for all
+        concurrent callers. None results are shared but not cached, so a
+        failed lookup is retried by the next caller. `counters`, if given,
+        receives the same hit/miss/coalesced counts as the cache itself;
+        `ttl_seconds` overrides the cache's TTL for this entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count("hits", counters)
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self._count("coalesced", counters)
+                owner = False
+            else:
+                flight = self._in_flight[key] = _InFlight()
+                self._count("misses", counters)
+                owner = True
+
+        if not owner:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if flight.error is None and flight.value is not None:
+                    self._store(key, flight.value, ttl_seconds)
+            flight.event.set()
+        return flight.value
+
+
+# Shared by every KIS client in the process (sync and async), so warm invocations reuse it
+kis_response_cache = CoalescingCache(
+    max_entries=int(os.environ.get("KIS_CACHE_MAX_ENTRIES", 2048)),
+    ttl_seconds=float(os.environ.get("KIS_CACHE_TTL_SECONDS", 300)),
+)
+
+
+def daily_series_key(base: str, path: str, stock_code: str, moment: Optional[datetime] = None):
+    """Cache key of a daily series: (endpoint, code, latest trading date)."""
+    trading_date = latest_trading_day((moment or now_kst()).date()).strftime("%Y%m%d")
+    return (base, path, stock_code, trading_date)
+
+
+def daily_series_ttl(moment: Optional[datetime] = None) -> float:
+    """
+    Lifetime of a daily series. While the session is open today's bar still
+    moves, so the cache's short TTL applies; otherwise the series is final
+    until the next session opens.
+    """
+    moment = moment or now_kst()
+    if is_market_open(moment):
+        return kis_response_cache.ttl_seconds
+    return max(kis_response_cache.ttl_seconds, (next_session_open(moment) - moment).total_seconds())
@@ -0,0 +1,139 @@
+"""
+Endpoints, headers and response parsing shared by the sync and async KIS clients.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROD_BASE_URL = "https://openapi.koreainvestment.com:9443"
+VTS_BASE_URL = "https://openapivts.koreainvestment.com:29443"
+
+TOKEN_PATH = "/oauth2/tokenP"
+DAILY_PRICE_PATH = "/uapi/domestic-stock/v1/quotations/inquire-daily-price"
+CURRENT_PRICE_PATH = "/uapi/domestic-stock/v1/quotations/inquire-price"
+
+# Tokens are renewed this many seconds before KIS expires them
+TOKEN_REFRESH_MARGIN = 600
+
+TR_DAILY_PRICE = "FHKST01010400" # Transaction ID for daily price inquiry
+TR_CURRENT_PRICE = "FHKST01010100" # Transaction ID for current price inquiry
+
+
+def base_url(is_prod=True) -> str:
+    return PROD_BASE_URL if is_prod else VTS_BASE_URL
+
+
+def load_credentials():
+    """Return (app_key, app_secret) from the environment."""
+    app_key = os.environ.get("KIS_APP_KEY")
+    app_secret = os.environ.get("KIS_APP_SECRET")
+    if not app_key or not app_secret:
+        raise ValueError("KIS_APP_KEY and KIS_APP_SECRET environment variables must be set.")
+    return app_key, app_secret
+
+
+def token_request_body(app_key, app_secret) -> Dict:
+    return {
+        "grant_type": "client_credentials",
+        "appkey": app_key,
+        "appsecret": app_secret
+    }
+
+
+def token_expires_at(res_data, now=None) -> float:
+    """
+    Epoch seconds at which to renew a token from a tokenP response: its
+    expires_in (24h when absent) less TOKEN_REFRESH_MARGIN.
+    """
+    expires_in = int(res_data.get("expires_in") or 86400)
+    return (time.time() if now is None else now) + expires_in - TOKEN_REFRESH_MARGIN
+
+
+def quote_headers(access_token, app_key, app_secret, tr_id) -> Dict:
+    """Common headers for quotation endpoints."""
+    if not access_token:
+        raise ValueError("Access token is not available.")
+    return {
+        "Content-Type": "application/json",
+        "authorization": f"Bearer {access_token}",
+        "appkey": app_key,
+        "appsecret": app_secret,
+        "tr_id": tr_id,
+        "custtype": "P"
+    }
+
+
+def daily_price_params(stock_code) -> Dict:
+    return {
+        "FID_COND_MRKT_DIV_CODE": "J", # J: 주식
+        "FID_INPUT_ISCD": stock_code,
+        "FID_PERIOD_DIV_CODE": "D", # D: 일별
+        "FID_ORG_ADJ_PRC": "1" # 1: 수정주가
+    }
+
+
+def current_price_params(stock_code) -> Dict:
+    return {
+        "FID_COND_MRKT_DIV_CODE": "J", # J: 주식
+        "FID_INPUT_ISCD": stock_code,
+    }
+
+
+def _checked_output(res_data, stock_code, label):
+    if res_data.get("rt_cd") != "0":
+        error_msg = res_data.get('msg1', 'Unknown API error')
+        logger.error(f"KIS API error for {stock_code}: {error_msg}")
+        return None
+
+    output = res_data.get("output")
+    if not output:
+        logger.warning(f"No {label} data found for {stock_code}.")
+        return None
+    return output
+
+
+def parse_daily_row(row) -> Dict:
+    """Convert one inquire-daily-price output row to our OHLCV dict."""
+    return {
+        "date": row.get("stck_bsop_date"), # 영업 일자
+        "open": int(row.get("stck_oprc", 0)), # 시가
+        "high": int(row.get("stck_hgpr", 0)), # 고가
+        "low": int(row.get("stck_lwpr", 0)), # 저가
+        "close": int(row.get("stck_clpr", 0)), # 종가
+        "volume": int(row.get("acml_vol", 0)) # 거래량
+    }
+
+
+def parse_daily_price(res_data, stock_code) -> Optional[Dict]:
+    """Most recent day from an inquire-daily-price response, or None."""
+    series = parse_daily_series(res_data, stock_code)
+    # output is a list of recent daily data, we need the first (most recent)
+    return series[0] if series else None
+
+
+def parse_daily_series(res_data, stock_code) -> Optional[List[Dict]]:
+    """Every day (newest first, about 30) from an inquire-daily-price response, or None."""
+    output = _checked_output(res_data, stock_code, "daily price")
+    if not output:
+        return None
+    return [parse_daily_row(row) for row in output if row.get("stck_bsop_date")]
+
+
+def parse_current_price(res_data, stock_code) -> Optional[Dict]:
+    """Quote from an inquire-price response, or None."""
+    output = _checked_output(res_data, stock_code, "current price")
+    if not output:
+        return None
+    return {
+        "price": int(output.get("stck_prpr", 0)), # 현재가
+        "open": int(output.get("stck_oprc", 0)), # 시가
+        "high": int(output.get("stck_hgpr", 0)), # 고가
+        "low": int(output.get("stck_lwpr", 0)), # 저가
+        "volume": int(output.get("acml_vol", 0)), # 누적 거래량
+        "change": int(output.get("prdy_vrss", 0)), # 전일 대비
+        "changeRate": float(output.get("prdy_ctrt", 0)), # 전일 대비율
+    }
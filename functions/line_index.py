@@ -0,0 +1,110 @@
+"""
+Per-stock index of a user's horizontal lines.
+
+Lines live one per document in users/{uid}/lines/{lineId}. The index keeps a
+copy of each stock's lines in users/{uid}/lineIndex/{stockCode} as a map
+keyed by lineId, so a chart overlay needs a single document read.
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+
+from firestore_events import parse_document_event
+
+# Fields copied from the line document; timestamps stay on the source doc
+INDEXED_LINE_FIELDS = ('price', 'color', 'style', 'width', 'memo')
+
+
+def line_index_ref(db, uid, stock_code):
+    return db.collection('users').document(uid).collection('lineIndex').document(stock_code)
+
+
+def index_entry(line: Dict) -> Dict:
+    """The subset of a line document stored in the index."""
+    return {field: line.get(field) for field in INDEXED_LINE_FIELDS}
+
+
+def build_line_index_docs(lines: Iterable[Tuple[str, Dict]]) -> Dict[str, Dict]:
+    """
+    Group (line_id, line_doc) pairs by stock code into index documents:
+    {stockCode: {'stockCode': stockCode, 'lines': {lineId: entry}}}.
+    """
+    docs: Dict[str, Dict] = {}
+    for line_id, line in lines:
+        stock_code = line.get('stockCode')
+        if not stock_code:
+            continue
+        doc = docs.setdefault(stock_code, {'stockCode': stock_code, 'lines': {}})
+        doc['lines'][line_id] = index_entry(line)
+    return docs
+
+
+def apply_line_change(db, uid, line_id, before: Optional[Dict], after: Optional[Dict]):
+    """
+    Mirror one users/{uid}/lines/{lineId} write into the index. `before` and
+    `after` are the line documents (None when created or deleted). Both writes
+    are merges, so a redelivered event leaves the index unchanged.
+    """
+    from firebase_admin import firestore
+
+    old_code = (before or {}).get('stockCode')
+    new_code = (after or {}).get('stockCode')
+
+    batch = db.batch()
+    if old_code and old_code != new_code:
+        batch.set(line_index_ref(db, uid, old_code), {
+            'lines': {line_id: firestore.DELETE_FIELD},
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+    if new_code:
+        batch.set(line_index_ref(db, uid, new_code), {
+            'stockCode': new_code,
+            'lines': {line_id: index_entry(after)},
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+    batch.commit()
+
+
+def rebuild_user_line_index(db, uid) -> int:
+    """
+    Recompute every index doc of one user from the lines subcollection and
+    drop index docs for stocks that no longer have lines. Returns the number
+    of index docs written.
+    """
+    from firebase_admin import firestore
+
+    user_ref = db.collection('users').document(uid)
+    lines = ((snap.id, snap.to_dict()) for snap in user_ref.collection('lines').stream())
+    docs = build_line_index_docs(lines)
+
+    batch = db.batch()
+    batch_count = 0
+    for stock_code, doc in docs.items():
+        batch.set(line_index_ref(db, uid, stock_code), {**doc, 'updated_at': firestore.SERVER_TIMESTAMP})
+        batch_count += 1
+        if batch_count >= 400:
+            batch.commit()
+            batch = db.batch()
+            batch_count = 0
+    for stale_ref in user_ref.collection('lineIndex').list_documents():
+        if stale_ref.id not in docs:
+            batch.delete(stale_ref)
+            batch_count += 1
+            if batch_count >= 400:
+                batch.commit()
+                batch = db.batch()
+                batch_count = 0
+    if batch_count:
+        batch.commit()
+    return len(docs)
+
+
+def parse_line_event(data: bytes) -> Tuple[Optional[str], Optional[str], Optional[Dict], Optional[Dict]]:
+    """
+    Decode a Firestore event for users/{uid}/lines/{lineId} into
+    (uid, line_id, before, after). uid and line_id are None for events on
+    any other path.
+    """
+    parts, before, after = parse_document_event(data)
+    if len(parts) != 4 or parts[0] != 'users' or parts[2] != 'lines':
+        return None, None, None, None
+    return parts[1], parts[3], before, after
@@ -8,53 +8,175 @@ import requests
 import json
 import os
 import logging
+import math
+import threading
 import time
 from datetime import datetime
-from typing import List
-from firebase_admin import initialize_app, firestore
-
-# Initialize Firebase Admin SDK
-# This is done automatically when deployed to Cloud Functions.
-# For local testing, you need to have the GOOGLE_APPLICATION_CREDENTIALS env var set.
-try:
-    initialize_app()
-except ValueError:
-    # If it's already initialized, do nothing.
-    pass
-
-db = firestore.client()
+from typing import Dict, List
+
+from backtest import BacktestEngine
+from caller_auth import CallerAuthError, require_admin, require_service_caller
+from chart_range import ChartRangeCache, parse_range
+from dividend_calendar import apply_dividend_change
+from firestore_events import parse_document_event
+from intraday import MAX_RUN_SECONDS as INTRADAY_MAX_DURATION, IntradayPoller
+from kis_common import (
+    CURRENT_PRICE_PATH,
+    DAILY_PRICE_PATH,
+    TOKEN_PATH,
+    TR_CURRENT_PRICE,
+    TR_DAILY_PRICE,
+    base_url,
+    current_price_params,
+    daily_price_params,
+    load_credentials,
+    parse_current_price,
+    parse_daily_series,
+    quote_headers,
+    token_expires_at,
+    token_request_body,
+)
+from kis_cache import daily_series_key, daily_series_ttl, kis_response_cache
+from line_index import apply_line_change, parse_line_event, rebuild_user_line_index
+from market_calendar import is_market_open, is_trading_day, today_kst
+from retry_policy import (
+    FATAL,
+    KIS_CIRCUIT_MAX_WAIT,
+    KISRateLimitError,
+    RetryPolicy,
+    is_rate_limited,
+    kis_error_code,
+    kis_circuit_breaker,
+)
+from ohlcv_codec import encoding_from_env, write_day
+from restatement import RestatementEngine
+from screener import Screener
+from search_index import apply_stock_change, rebuild_search_index
+from stock_config import StockUniverse, parse_codes, parse_shard, shard_codes
+from task_queue import create_task_queue
+from write_journal import create_write_journal, journal_entry, replay_journal
+
 logger = logging.getLogger(__name__)
 
+# --- Lazy state ---
+# Nothing below is built at import time: firebase_admin/gRPC load on the first
+# Firestore access and the KIS token is fetched on the first KIS call, so
+# health_check and skipped scheduler runs stay cheap on a cold start.
+# Everything is module-level once built, so warm invocations reuse it.
+
+_db = None
+_init_lock = threading.Lock()
+# Target code resolution, cached across warm invocations
+stock_universe = None
+# Encoded chart ranges, reused by warm get_chart_range invocations
+chart_cache = None
+# Shared by every endpoint that calls KIS; keeps the access token warm
+kis_client = None
+# Created on first poll_intraday call; keeps the tick state warm
+intraday_poller = None
+# Holds fetched bars whose Firestore write failed
+write_journal = None
+# Feature snapshot for screen_stocks, refreshed after each collection run
+screener = None
+
+
+def get_db():
+    """
+    Firestore client, created on first use. Initializes the Firebase Admin SDK
+    (automatic credentials when deployed; GOOGLE_APPLICATION_CREDENTIALS locally).
+    """
+    global _db
+    if _db is None:
+        with _init_lock:
+            if _db is None:
+                from firebase_admin import firestore, initialize_app
+                try:
+                    initialize_app()
+                except ValueError:
+                    # If it's already initialized, do nothing.
+                    pass
+                _db = firestore.client()
+    return _db
+
+
+def on_universe_change(previous: List[str], codes: List[str]):
+    """Bring in-instance state tied to the target codes in line with a changed universe."""
+    kis_response_cache.reserve(len(codes))
+    if screener is not None:
+        screener.invalidate()
+    removed = set(previous) - set(codes)
+    if intraday_poller is not None and removed:
+        intraday_poller.forget(removed)
+
+
+def get_stock_universe():
+    global stock_universe
+    if stock_universe is None:
+        stock_universe = StockUniverse(get_db())
+        stock_universe.subscribe(on_universe_change)
+    return stock_universe
+
+
+def get_chart_cache():
+    global chart_cache
+    if chart_cache is None:
+        chart_cache = ChartRangeCache(
+            get_db(),
+            max_entries=int(os.environ.get("CHART_CACHE_MAX_ENTRIES", 256)),
+            stamp_ttl=float(os.environ.get("CHART_CACHE_STAMP_TTL", 30)),
+        )
+    return chart_cache
+
+
+def get_kis_client():
+    """Shared KISClient with a valid access token (fetched or refreshed here)."""
+    global kis_client
+    if kis_client is None:
+        kis_client = KISClient(is_prod=True)
+    kis_client.ensure_token()
+    return kis_client
 
-def get_target_stock_codes() -> List[str]:
-    """Resolve target stock codes from env or Firestore."""
-    env_value = os.environ.get("TARGET_STOCK_CODES") or os.environ.get("STOCK_CODES")
-    if env_value:
-        codes = [code.strip() for code in env_value.split(",") if code.strip()]
-        if codes:
-            logger.info("Loaded %d stock codes from environment.", len(codes))
-            return codes
 
+def get_write_journal():
+    global write_journal
+    if write_journal is None:
+        write_journal = create_write_journal(get_db())
+    return write_journal
+
+
+def get_screener():
+    global screener
+    if screener is None:
+        screener = Screener(get_db())
+    return screener
+
+
+def get_target_stock_codes(shard_index: int = 0, shard_count: int = 1) -> List[str]:
+    """Resolve target stock codes (cached), optionally restricted to one shard."""
+    codes = get_stock_universe().get()
+    if shard_count > 1:
+        codes = shard_codes(codes, shard_count, shard_index)
+        logger.info("Shard %d/%d covers %d stock codes.", shard_index, shard_count, len(codes))
+    return codes
+
+
+def load_latest_stored_dates() -> Dict[str, str]:
+    """
+    Latest stored trading date (YYYYMMDD) per code, from metadata/system.latestDates.
+    One document read per run replaces a per-code lookup of the monthly docs.
+    """
     try:
-        config_doc = db.collection('metadata').document('config').get()
-        if config_doc.exists:
-            data = config_doc.to_dict() or {}
-            raw_codes = data.get('stockCodes') or data.get('targetStockCodes') or data.get('stocks')
-            if isinstance(raw_codes, list):
-                codes = [str(code).strip() for code in raw_codes if str(code).strip()]
-            elif isinstance(raw_codes, str):
-                codes = [code.strip() for code in raw_codes.split(',') if code.strip()]
-            else:
-                codes = []
-
-            if codes:
-                logger.info("Loaded %d stock codes from Firestore metadata/config.", len(codes))
-                return codes
+        snapshot = get_db().collection('metadata').document('system').get()
+        if snapshot.exists:
+            latest = (snapshot.to_dict() or {}).get('latestDates') or {}
+            return {str(code): str(value) for code, value in latest.items()}
     except Exception as exc:  # pylint: disable=broad-except
-        logger.warning("Failed to load stock codes from Firestore: %s", exc)
+        logger.warning("Failed to load latest stored dates: %s", exc)
+    return {}
 
-    logger.error("No stock codes configured. Set TARGET_STOCK_CODES env var or metadata/config.stockCodes.")
-    return []
+
+def _is_truthy(value) -> bool:
+    return str(value).strip().lower() in {"1", "true", "yes", "on"}
 
 # --- KIS API Client ---
 
@@ -62,44 +184,83 @@ class KISClient:
     """
     A client for interacting with the Korea Investment & Securities (KIS) API.
     """
-    def __init__(self, is_prod=True):
-        self.app_key = os.environ.get("KIS_APP_KEY")
-        self.app_secret = os.environ.get("KIS_APP_SECRET")
-        if not self.app_key or not self.app_secret:
-            raise ValueError("KIS_APP_KEY and KIS_APP_SECRET environment variables must be set.")
+    def __init__(self, is_prod=True, access_token=None):
+        self.app_key, self.app_secret = load_credentials()
+        self.base_url = base_url(is_prod)
+        self.retry_policy = RetryPolicy.from_env()
+        # The token is fetched on first use, not here
+        self._access_token = access_token
+        # A token handed in is used as-is for the run
+        self._token_expires_at = float("inf") if access_token else 0.0
+        self._token_lock = threading.Lock()
+
+    @property
+    def access_token(self):
+        return self.ensure_token()
 
-        self.base_url = "https://openapi.koreainvestment.com:9443" if is_prod else "https://openapivts.koreainvestment.com:29443"
-        self.access_token = None
-        self._get_access_token()
+    def ensure_token(self):
+        """Return a valid access token, fetching a new one when missing or about to expire."""
+        with self._token_lock:
+            if not self._access_token or time.time() >= self._token_expires_at:
+                self._get_access_token()
+            return self._access_token
 
-    def _request_with_retry(self, method, url, *, retries=3, backoff=2, timeout=10, **kwargs):
-        """Issue an HTTP request with basic retry/backoff."""
-        for attempt in range(1, retries + 1):
+    def _request_with_retry(self, method, url, *, timeout=10, **kwargs):
+        """
+        Issue an HTTP request under the shared retry policy and circuit breaker.
+        Rate-limit replies (HTTP 429 or KIS msg_cd such as EGW00201) are retried
+        even when KIS answers them with HTTP 200.
+        """
+        policy = self.retry_policy
+        delay = 0.0
+        for attempt in range(1, policy.max_attempts + 1):
+            # Bounded, so a long outage fails each code with CircuitOpenError instead of hanging
+            kis_circuit_breaker.before_request(max_wait=KIS_CIRCUIT_MAX_WAIT)
+            response = None
+            recorded = False
             try:
                 response = requests.request(method, url, timeout=timeout, **kwargs)
+                if is_rate_limited(response):
+                    raise KISRateLimitError(
+                        f"KIS rate limit ({kis_error_code(response) or response.status_code})",
+                        response=response,
+                    )
                 response.raise_for_status()
+                kis_circuit_breaker.record_success()
+                recorded = True
                 return response
             except requests.exceptions.RequestException as exc:
-                if attempt == retries:
+                decision = policy.classify(exc, response)
+                recorded = True
+                if decision == FATAL:
+                    # KIS answered, so it is reachable; the request itself is bad
+                    kis_circuit_breaker.record_success()
                     raise
+                kis_circuit_breaker.record_failure()
+                if attempt == policy.max_attempts:
+                    raise
+                delay = policy.next_delay(delay, decision, response)
                 logger.warning(
-                    "KIS %s request failed (attempt %d/%d): %s",
+                    "KIS %s request failed (attempt %d/%d, %s), retrying in %.1fs: %s",
                     method.upper(),
                     attempt,
-                    retries,
+                    policy.max_attempts,
+                    decision,
+                    delay,
                     exc,
                 )
-                time.sleep(backoff ** (attempt - 1))
+            finally:
+                if not recorded:
+                    # Any other exception still settles the call; a half-open
+                    # probe that never reports would block every later caller
+                    kis_circuit_breaker.record_failure()
+            time.sleep(delay)
 
     def _get_access_token(self):
         """Fetches and sets the access token."""
-        url = f"{self.base_url}/oauth2/tokenP"
+        url = f"{self.base_url}{TOKEN_PATH}"
         headers = {"content-type": "application/json"}
-        body = {
-            "grant_type": "client_credentials",
-            "appkey": self.app_key,
-            "appsecret": self.app_secret
-        }
+        body = token_request_body(self.app_key, self.app_secret)
         try:
             response = self._request_with_retry(
                 "post",
@@ -108,109 +269,122 @@ class KISClient:
                 data=json.dumps(body),
             )
             res_data = response.json()
-            self.access_token = res_data.get("access_token")
-            if not self.access_token:
+            access_token = res_data.get("access_token")
+            if not access_token:
                 raise ValueError("Access token not found in API response.")
+            self._access_token = access_token
+            # Tokens last 24h; renewed TOKEN_REFRESH_MARGIN seconds early
+            self._token_expires_at = token_expires_at(res_data)
             logger.info("Successfully fetched KIS API access token.")
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get access token: {e}")
             raise
 
-    def get_daily_price(self, stock_code):
+    def _quote(self, path, tr_id, params):
+        """GET a quotation endpoint and return the decoded JSON body."""
+        headers = quote_headers(self.access_token, self.app_key, self.app_secret, tr_id)
+        response = self._request_with_retry(
+            "get",
+            f"{self.base_url}{path}",
+            headers=headers,
+            params=params,
+        )
+        return response.json()
+
+    def get_daily_price(self, stock_code, cache_stats=None):
         """
         Fetches the latest daily price data for a given stock code.
         Returns the data for the most recent trading day.
         """
-        if not self.access_token:
-            raise ValueError("Access token is not available.")
-
-        url = f"{self.base_url}/uapi/domestic-stock/v1/quotations/inquire-daily-price"
-        headers = {
-            "Content-Type": "application/json",
-            "authorization": f"Bearer {self.access_token}",
-            "appkey": self.app_key,
-            "appsecret": self.app_secret,
-            "tr_id": "FHKST01010400", # Transaction ID for daily price inquiry
-            "custtype": "P"
-        }
-        params = {
-            "FID_COND_MRKT_DIV_CODE": "J", # J: 주식
-            "FID_INPUT_ISCD": stock_code,
-            "FID_PERIOD_DIV_CODE": "D", # D: 일별
-            "FID_ORG_ADJ_PRC": "1" # 1: 수정주가
-        }
+        series = self.get_daily_series(stock_code, cache_stats=cache_stats)
+        return series[0] if series else None
 
-        try:
-            response = self._request_with_retry(
-                "get",
-                url,
-                headers=headers,
-                params=params,
-            )
-            res_data = response.json()
-
-            if res_data.get("rt_cd") != "0":
-                error_msg = res_data.get('msg1', 'Unknown API error')
-                logger.error(f"KIS API error for {stock_code}: {error_msg}")
-                return None
-
-            # output is a list of recent daily data, we need the first (most recent)
-            output = res_data.get("output")
-            if not output:
-                logger.warning(f"No daily price data found for {stock_code}.")
-                return None
+    def get_daily_series(self, stock_code, cache_stats=None):
+        """
+        Fetches the recent adjusted daily series (newest first, about 30 days).
 
-            latest_data = output[0]
-            return {
-                "date": latest_data.get("stck_bsop_date"), # 영업 일자
-                "open": int(latest_data.get("stck_oprc", 0)), # 시가
-                "high": int(latest_data.get("stck_hgpr", 0)), # 고가
-                "low": int(latest_data.get("stck_lwpr", 0)), # 저가
-                "close": int(latest_data.get("stck_clpr", 0)), # 종가
-                "volume": int(latest_data.get("acml_vol", 0)) # 거래량
-            }
+        Responses are cached per (endpoint, code, trading date) until the next
+        session opens and concurrent lookups of the same code share one
+        request; `cache_stats` collects the hit/miss/coalesced counts for the caller.
+        """
+        return kis_response_cache.get_or_load(
+            daily_series_key(self.base_url, DAILY_PRICE_PATH, stock_code),
+            lambda: self._fetch_daily_series(stock_code),
+            counters=cache_stats,
+            ttl_seconds=daily_series_ttl(),
+        )
 
+    def _fetch_daily_series(self, stock_code):
+        try:
+            res_data = self._quote(DAILY_PRICE_PATH, TR_DAILY_PRICE, daily_price_params(stock_code))
+            return parse_daily_series(res_data, stock_code)
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get daily price for {stock_code}: {e}")
             return None
 
-# --- Cloud Function ---
+    def get_current_price(self, stock_code):
+        """
+        Fetches the current (intraday) quote for a given stock code.
+        Returns None when KIS reports an error or no data.
+        """
+        try:
+            res_data = self._quote(CURRENT_PRICE_PATH, TR_CURRENT_PRICE, current_price_params(stock_code))
+            return parse_current_price(res_data, stock_code)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to get current price for {stock_code}: {e}")
+            return None
 
-@functions_framework.http
-def fetch_stock_data(request):
+# --- Collection ---
+
+def collect_stock_codes(client, stock_codes, *, force=False, run_date=None, latest_dates=None) -> Dict:
     """
-    HTTP Cloud Function to fetch and store daily stock data.
-    Triggered by Cloud Scheduler.
+    Fetch and store the latest daily bar for each code.
+    Returns run stats, including the codes whose stored date advanced.
     """
-    logger.info("Cloud Function triggered to fetch stock data.")
-
-    try:
-        client = KISClient(is_prod=True)
-    except (ValueError, requests.exceptions.RequestException) as e:
-        logger.error(f"Failed to initialize KISClient: {e}")
-        return {"status": "error", "message": "Failed to initialize KISClient"}, 500
-
-    stock_codes = get_target_stock_codes()
-    if not stock_codes:
-        return {
-            "status": "error",
-            "message": "No stock codes configured for scheduler execution."
-        }, 500
-
     success_count = 0
     error_count = 0
+    skipped_count = 0
+    journaled_count = 0
+    if latest_dates is None:
+        latest_dates = load_latest_stored_dates()
+    updated_dates = {}
+    run_date_str = (run_date or today_kst()).strftime("%Y%m%d")
 
-    for code in stock_codes:
+    # Codes already collected today (e.g. scheduler retry) need no KIS call
+    pending_codes = [
+        code for code in stock_codes
+        if force or latest_dates.get(code, "") < run_date_str
+    ]
+    skipped_count += len(stock_codes) - len(pending_codes)
+
+    cache_stats = {"hits": 0, "misses": 0, "coalesced": 0}
+    # Room for every code, so a later restatement pass finds all of them cached
+    kis_response_cache.reserve(len(stock_codes))
+    prefetched = None
+    if os.environ.get("KIS_CLIENT_MODE", "sync") == "async" and pending_codes:
+        # One event loop drives all requests concurrently; writes stay sequential
+        from kis_async import fetch_daily_prices
+        prefetched = fetch_daily_prices(pending_codes, access_token=client.access_token, cache_stats=cache_stats)
+
+    for code in pending_codes:
         logger.info(f"Processing stock: {code}")
-        daily_data = client.get_daily_price(code)
+        if prefetched is not None:
+            daily_data = prefetched.get(code)
+        else:
+            daily_data = client.get_daily_price(code, cache_stats=cache_stats)
 
         if not daily_data or not daily_data.get("date"):
             logger.error(f"Could not retrieve valid data for {code}.")
             error_count += 1
             continue
 
+        date_str = daily_data["date"] # YYYYMMDD
+        if not force and latest_dates.get(code, "") >= date_str:
+            logger.info(f"{code} already stored through {latest_dates[code]}; skipping write.")
+            skipped_count += 1
+            continue
+
         try:
-            date_str = daily_data["date"] # YYYYMMDD
             year = date_str[:4]
             month = date_str[4:6]
             day = date_str[6:8]
@@ -220,37 +394,74 @@ def fetch_stock_data(request):
             firestore_data = {key: val for key, val in daily_data.items() if key != "date"}
 
             # Get the monthly document reference
-            doc_ref = db.collection('stocks').document(code).collection('monthly').document(year_month_doc_id)
+            doc_ref = get_db().collection('stocks').document(code).collection('monthly').document(year_month_doc_id)
 
-            # Update the 'days' map with the new day's data using dot notation.
-            # This will create or update the field for the specific day.
-            doc_ref.set({
-                'days': {
-                    day: firestore_data
-                }
-            }, merge=True)
+            # Add the day to the monthly document in the configured encoding.
+            # Map/array encodings merge just this day; packed rewrites the blob.
+            write_day(get_db(), doc_ref, day, firestore_data, encoding_from_env())
 
             logger.info(f"Successfully updated Firestore for {code} on {date_str}.")
             success_count += 1
+            updated_dates[code] = date_str
 
         except Exception as e:
             logger.error(f"Failed to update Firestore for {code}: {e}")
             error_count += 1
+            # Keep the fetched bar so the next run can store it without KIS
+            entry = journal_entry(code, date_str, firestore_data, str(e))
+            try:
+                get_write_journal().append(entry)
+                journaled_count += 1
+            except Exception as journal_error:  # pylint: disable=broad-except
+                # Every journal rejected it; the log line is the last copy of the bar
+                logger.error(f"Failed to journal {code} on {date_str}: {journal_error}; "
+                             f"entry: {json.dumps(entry, ensure_ascii=False)}")
+
+    return {
+        'success_count': success_count,
+        'error_count': error_count,
+        'skipped_count': skipped_count,
+        'journaled_count': journaled_count,
+        'total_stocks': len(stock_codes),
+        'updated_dates': updated_dates,
+        'cache': cache_stats,
+    }
 
-    # Update metadata
+
+def write_run_metadata(stats: Dict, extra: Dict = None):
+    """Record a run's outcome in metadata/system."""
+    from firebase_admin import firestore
+
+    success_count = stats['success_count']
+    error_count = stats['error_count']
+    skipped_count = stats['skipped_count']
+    queued_count = stats.get('queued_count', 0)
+    if error_count:
+        update_status = 'partial_failure'
+    else:
+        # Queued shards report through shardRuns once their workers finish
+        update_status = 'queued' if queued_count else 'success'
     try:
-        meta_ref = db.collection('metadata').document('system')
+        meta_ref = get_db().collection('metadata').document('system')
         metadata_payload = {
             'lastAttemptedUpdate': firestore.SERVER_TIMESTAMP,
-            'updateStatus': 'success' if error_count == 0 else 'partial_failure',
+            'updateStatus': update_status,
             'lastRunStats': {
                 'success_count': success_count,
                 'error_count': error_count,
-                'total_stocks': len(stock_codes)
+                'skipped_count': skipped_count,
+                'queued_count': queued_count,
+                'journaled_count': stats.get('journaled_count', 0),
+                'total_stocks': stats['total_stocks'],
+                'cache': stats.get('cache', {}),
             }
         }
-        if error_count == 0 and success_count > 0:
+        if stats['updated_dates']:
+            metadata_payload['latestDates'] = stats['updated_dates']
+        if error_count == 0 and success_count + skipped_count > 0:
             metadata_payload['lastSuccessfulUpdate'] = firestore.SERVER_TIMESTAMP
+        if extra:
+            metadata_payload.update(extra)
 
         meta_ref.set(metadata_payload, merge=True)
         logger.info("Successfully updated metadata.")
@@ -258,7 +469,253 @@ def fetch_stock_data(request):
         logger.error(f"Failed to update metadata: {e}")
 
 
-    summary = f"Stock data fetch completed. Success: {success_count}, Failed: {error_count}"
+def run_shard(payload: Dict, client=None) -> Dict:
+    """Worker body: collect one shard of codes described by `payload`."""
+    if client is None:
+        # Each worker instance keeps its own cached token; none travels in the payload
+        client = get_kis_client()
+    run_date = datetime.strptime(payload['runDate'], "%Y%m%d").date() if payload.get('runDate') else None
+    stats = collect_stock_codes(
+        client,
+        parse_codes(payload.get('codes') or []),
+        force=bool(payload.get('force')),
+        run_date=run_date,
+        latest_dates=payload.get('latestDates'),
+    )
+    stats['shard'] = payload.get('shard')
+    return stats
+
+
+def record_shard_run(stats: Dict):
+    """
+    Worker side of a queued shard: the coordinator returned before the shard
+    ran, so the worker stores its own stored dates and counts under
+    metadata/system.shardRuns.{shard}.
+    """
+    from firebase_admin import firestore
+
+    payload = {
+        'shardRuns': {
+            str(stats.get('shard')): {
+                'success_count': stats['success_count'],
+                'error_count': stats['error_count'],
+                'skipped_count': stats['skipped_count'],
+                'journaled_count': stats.get('journaled_count', 0),
+                'total_stocks': stats['total_stocks'],
+                'finishedAt': firestore.SERVER_TIMESTAMP,
+            }
+        }
+    }
+    if stats['updated_dates']:
+        payload['latestDates'] = stats['updated_dates']
+        # Part of the chart cache stamp; the coordinator's own write came before this data
+        payload['lastShardUpdate'] = firestore.SERVER_TIMESTAMP
+    get_db().collection('metadata').document('system').set(payload, merge=True)
+
+
+def coordinate_shards(client, stock_codes, shard_count, *, force=False, run_date=None) -> Dict:
+    """
+    Split the universe into shards, dispatch them through the task queue and
+    aggregate the per-shard stats. Stored dates are read once and handed to
+    the workers, so they do not re-read metadata/system.
+    """
+    latest_dates = load_latest_stored_dates()
+    payloads = []
+    for index in range(shard_count):
+        codes = shard_codes(stock_codes, shard_count, index)
+        if not codes:
+            continue
+        payloads.append({
+            'shard': index,
+            'codes': codes,
+            'force': force,
+            'runDate': (run_date or today_kst()).strftime("%Y%m%d"),
+            'latestDates': {code: latest_dates[code] for code in codes if code in latest_dates},
+        })
+
+    queue = create_task_queue(lambda payload: run_shard(payload, client=client))
+    results = queue.dispatch(payloads)
+
+    totals = {
+        'success_count': 0,
+        'error_count': 0,
+        'skipped_count': 0,
+        'journaled_count': 0,
+        'queued_count': 0,
+        'total_stocks': len(stock_codes),
+        'updated_dates': {},
+        'cache': {"hits": 0, "misses": 0, "coalesced": 0},
+        'shards': [],
+    }
+    for payload, result in zip(payloads, results):
+        if result.get('error'):
+            # Whole shard failed before reporting; count every code as failed
+            totals['error_count'] += len(payload['codes'])
+            totals['shards'].append({'shard': payload['shard'], 'error': result['error']})
+            continue
+        if result.get('queued'):
+            totals['queued_count'] += len(payload['codes'])
+            totals['shards'].append({'shard': payload['shard'], 'queued': len(payload['codes'])})
+            continue
+        for key in ('success_count', 'error_count', 'skipped_count', 'journaled_count'):
+            totals[key] += int(result.get(key, 0))
+        totals['updated_dates'].update(result.get('updated_dates') or {})
+        for key, count in (result.get('cache') or {}).items():
+            totals['cache'][key] = totals['cache'].get(key, 0) + int(count)
+        totals['shards'].append({
+            'shard': payload['shard'],
+            'success_count': result.get('success_count', 0),
+            'error_count': result.get('error_count', 0),
+            'skipped_count': result.get('skipped_count', 0),
+        })
+    return totals
+
+def replay_pending_writes() -> Dict:
+    """
+    Store journaled bars from earlier failed writes and advance latestDates
+    for codes whose replayed day is newer than what metadata/system records.
+    """
+    from firebase_admin import firestore
+
+    result = replay_journal(get_db(), get_write_journal(), encoding_from_env())
+    if result['replayed_count']:
+        latest_dates = load_latest_stored_dates()
+        advanced = {code: date_str for code, date_str in result['replayed'].items()
+                    if date_str > latest_dates.get(code, "")}
+        payload = {'lastJournalReplay': firestore.SERVER_TIMESTAMP}
+        if advanced:
+            payload['latestDates'] = advanced
+        get_db().collection('metadata').document('system').set(payload, merge=True)
+    return result
+
+def refresh_screener(stock_codes, *, reread=False) -> int:
+    """Recompute screener features for codes whose stored data changed."""
+    if not stock_codes:
+        return 0
+    try:
+        refreshed = get_screener().refresh(stock_codes, reread=reread)
+        logger.info(f"Refreshed screener features for {refreshed} codes.")
+        return refreshed
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(f"Failed to refresh screener features: {e}")
+        return 0
+
+def restate_codes(client, stock_codes, *, dry_run=False) -> Dict:
+    """
+    Compare each code's recent KIS adjusted series with stored days and
+    rewrite history for codes with a new adjustment factor. The series comes
+    from the same cache as get_daily_price, so after a collection run this
+    needs no extra KIS calls.
+    """
+    from firebase_admin import firestore
+
+    engine = RestatementEngine(get_db(), encoding_from_env())
+    kis_response_cache.reserve(len(stock_codes))
+    restated, inconsistent, errors = [], [], []
+    for code in stock_codes:
+        series = client.get_daily_series(code)
+        if not series:
+            errors.append(code)
+            continue
+        try:
+            summary = engine.restate(code, series, dry_run=dry_run)
+        except ValueError as e:
+            logger.warning(f"Restatement skipped for {code}: {e}")
+            inconsistent.append(code)
+            continue
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Restatement failed for {code}: {e}")
+            errors.append(code)
+            continue
+        if summary:
+            restated.append(summary)
+
+    if restated and not dry_run:
+        # Part of the chart cache stamp, so cached ranges are dropped
+        get_db().collection('metadata').document('system').set(
+            {'lastRestatement': firestore.SERVER_TIMESTAMP}, merge=True
+        )
+    return {'restated': restated, 'inconsistent': inconsistent, 'errors': errors, 'checked': len(stock_codes)}
+
+# --- Cloud Function ---
+
+@functions_framework.http
+def fetch_stock_data(request):
+    """
+    HTTP Cloud Function to fetch and store daily stock data.
+    Triggered by Cloud Scheduler.
+
+    ?mode=coordinator&shards=N fans the universe out to N shard workers
+    (see fetch_stock_shard); the default mode collects in-process.
+    ?force=1 and the mode/shard overrides need an admin caller (see
+    caller_auth); the scheduler's plain runs take their settings from the
+    environment.
+    """
+    logger.info("Cloud Function triggered to fetch stock data.")
+
+    args = request.args if request is not None else {}
+    force = _is_truthy(args.get("force"))
+    if force or any(args.get(name) for name in ("mode", "shards", "shard")):
+        try:
+            require_admin(request)
+        except CallerAuthError as e:
+            return {"status": "error", "message": str(e)}, e.status
+    run_date = today_kst()
+    if not force and not is_trading_day(run_date):
+        message = f"{run_date.isoformat()} is not a KRX trading day; skipping collection."
+        logger.info(message)
+        return {"status": "skipped", "message": message}, 200
+
+    # Bars from earlier failed writes go first; they need no KIS calls
+    try:
+        replay = replay_pending_writes()
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(f"Failed to replay write journal: {e}")
+        replay = {'replayed_count': 0, 'failed_count': 0}
+
+    try:
+        client = get_kis_client()
+    except (ValueError, requests.exceptions.RequestException) as e:
+        logger.error(f"Failed to initialize KISClient: {e}")
+        return {"status": "error", "message": "Failed to initialize KISClient"}, 500
+
+    try:
+        shard_index, shard_count = parse_shard(args.get("shard") or os.environ.get("SCHEDULER_SHARD"))
+        mode = args.get("mode") or os.environ.get("COLLECTOR_MODE", "single")
+        fan_out = int(args.get("shards") or os.environ.get("SHARD_COUNT", "4"))
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}, 400
+
+    stock_codes = get_target_stock_codes(shard_index, shard_count)
+    if not stock_codes:
+        return {
+            "status": "error",
+            "message": "No stock codes configured for scheduler execution."
+        }, 500
+
+    restated_codes = []
+    if mode == "coordinator" and fan_out > 1:
+        try:
+            stats = coordinate_shards(client, stock_codes, fan_out, force=force, run_date=run_date)
+        except ValueError as e:
+            logger.error(f"Failed to dispatch shards: {e}")
+            return {"status": "error", "message": str(e)}, 500
+        write_run_metadata(stats, {'lastRunShards': stats['shards']})
+    else:
+        stats = collect_stock_codes(client, stock_codes, force=force, run_date=run_date)
+        write_run_metadata(stats)
+        if _is_truthy(os.environ.get("RESTATE_AFTER_FETCH")):
+            restated_codes = [summary['code'] for summary in restate_codes(client, stock_codes)['restated']]
+
+    changed_codes = set(stats['updated_dates']) | set(replay.get('replayed') or {}) | set(restated_codes)
+    refresh_screener(sorted(changed_codes), reread=bool(restated_codes))
+
+    summary = (
+        f"Stock data fetch completed. Success: {stats['success_count']}, "
+        f"Skipped: {stats['skipped_count']}, Failed: {stats['error_count']}, "
+        f"Queued: {stats.get('queued_count', 0)}, "
+        f"Journaled: {stats['journaled_count']}, Replayed: {replay['replayed_count']}"
+    )
     logger.info(summary)
 
     return {
@@ -266,6 +723,337 @@ def fetch_stock_data(request):
         "message": summary
     }, 200
 
+@functions_framework.http
+def fetch_stock_shard(request):
+    """
+    Worker endpoint for coordinator mode. Expects a JSON shard payload
+    ({"shard", "codes", "runDate", "latestDates", "force"}) from Cloud Tasks,
+    authenticated by an OIDC token of SHARD_TASKS_SERVICE_ACCOUNT (or a
+    TRUSTED_INVOKER_EMAILS account), and records and returns its stats.
+    """
+    try:
+        require_service_caller(
+            request,
+            audience=os.environ.get("SHARD_WORKER_URL"),
+            extra_invokers=[os.environ.get("SHARD_TASKS_SERVICE_ACCOUNT", "")],
+        )
+    except CallerAuthError as e:
+        return {"status": "error", "message": str(e)}, e.status
+
+    payload = request.get_json(silent=True) or {}
+    if not payload.get('codes'):
+        return {"status": "error", "message": "Shard payload has no codes."}, 400
+
+    try:
+        stats = run_shard(payload)
+    except (ValueError, requests.exceptions.RequestException) as e:
+        logger.error(f"Shard {payload.get('shard')} failed: {e}")
+        # 500 makes Cloud Tasks retry the shard
+        return {"status": "error", "message": str(e)}, 500
+
+    try:
+        record_shard_run(stats)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(f"Failed to record shard {stats.get('shard')}: {e}")
+    refresh_screener(sorted(stats['updated_dates']))
+    return stats, 200
+
+@functions_framework.http
+def get_chart_range(request):
+    """
+    HTTP Cloud Function returning one stock's OHLCV over a date range as a
+    columnar JSON body: ?code=475080&start=20240101&end=20241231.
+    Supports If-None-Match (304) and gzip.
+    """
+    args = request.args if request is not None else {}
+    try:
+        codes = parse_codes(args.get("code") or "")
+        if len(codes) != 1:
+            raise ValueError("Exactly one valid stock code is required.")
+        stock_code = codes[0]
+        start, end = parse_range(args.get("start"), args.get("end"), today_kst())
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}, 400
+
+    try:
+        entry = get_chart_cache().get(stock_code, start, end)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(f"Failed to load chart range for {stock_code}: {e}")
+        return {"status": "error", "message": "Failed to load chart data."}, 500
+
+    headers = {
+        "ETag": entry["etag"],
+        "Cache-Control": "public, max-age=60",
+        "Vary": "Accept-Encoding",
+        "Access-Control-Allow-Origin": "*",
+    }
+    if_none_match = request.headers.get("If-None-Match", "") if request is not None else ""
+    if entry["etag"] in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}:
+        return "", 304, headers
+
+    headers["Content-Type"] = "application/json"
+    accept_encoding = request.headers.get("Accept-Encoding", "") if request is not None else ""
+    if "gzip" in accept_encoding.lower():
+        headers["Content-Encoding"] = "gzip"
+        return entry["gzip"], 200, headers
+    return entry["body"], 200, headers
+
+@functions_framework.http
+def backtest_dividends(request):
+    """
+    HTTP Cloud Function that backtests buying and holding each code with
+    dividends reinvested on ex-dates: ?codes=475080,475720&start=20230101&end=20251231.
+    ?reinvest=0 keeps dividends as cash, ?tax=0.154 applies dividend tax,
+    ?series=1 adds the daily value series. Anyone may backtest up to
+    BACKTEST_MAX_CODES codes over BACKTEST_MAX_YEARS years; larger requests
+    (up to BACKTEST_ADMIN_MAX_CODES codes) need an admin caller (see caller_auth).
+    """
+    args = request.args if request is not None else {}
+    try:
+        stock_codes = parse_codes(args.get("codes") or args.get("code") or "")
+        if not stock_codes:
+            raise ValueError("At least one valid stock code is required.")
+        admin_max_codes = int(os.environ.get("BACKTEST_ADMIN_MAX_CODES", 500))
+        if len(stock_codes) > admin_max_codes:
+            raise ValueError(f"At most {admin_max_codes} codes per request.")
+        start, end = parse_range(args.get("start"), args.get("end"), today_kst())
+        tax_rate = float(args.get("tax") or 0)
+        if not 0 <= tax_rate < 1:
+            raise ValueError("tax must be in [0, 1).")
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}, 400
+
+    # Reads grow with codes x months, so only small requests are public
+    max_codes = int(os.environ.get("BACKTEST_MAX_CODES", 20))
+    max_days = round(float(os.environ.get("BACKTEST_MAX_YEARS", 5)) * 366)
+    if len(stock_codes) > max_codes or (end - start).days > max_days:
+        try:
+            require_admin(request)
+        except CallerAuthError as e:
+            return {
+                "status": "error",
+                "message": f"{e} Requests over {max_codes} codes or {max_days} days need an admin caller.",
+            }, e.status
+
+    # Shares the chart cache's reader, so its memo and invalidation apply here too
+    cache = get_chart_cache()
+    engine = BacktestEngine(get_db(), reader=cache.reader)
+    try:
+        # Drops the reader's memoized months after a collection, restatement or replay
+        cache.stamp()
+        results = engine.run(
+            stock_codes, start, end,
+            reinvest=args.get("reinvest") is None or _is_truthy(args.get("reinvest")),
+            tax_rate=tax_rate,
+            include_series=_is_truthy(args.get("series")),
+        )
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(f"Backtest failed: {e}")
+        return {"status": "error", "message": "Failed to run backtest."}, 500
+    return {"status": "success", "start": start.isoformat(), "end": end.isoformat(), "results": results}, 200
+
+@functions_framework.http
+def restate_adjusted_prices(request):
+    """
+    HTTP Cloud Function that restates stored history after splits and other
+    corporate actions. By default it is a dry run that only reports the
+    detected factors; ?dry_run=0 rewrites history. ?code=... limits it to
+    some codes. Writes, and runs over the whole universe, need an admin
+    caller (see caller_auth).
+    """
+    args = request.args if request is not None else {}
+    dry_run = args.get("dry_run") is None or _is_truthy(args.get("dry_run"))
+    explicit_codes = parse_codes(args.get("code") or "")
+    if not dry_run or not explicit_codes:
+        try:
+            require_admin(request)
+        except CallerAuthError as e:
+            return {"status": "error", "message": str(e)}, e.status
+
+    stock_codes = explicit_codes or get_target_stock_codes()
+    if not stock_codes:
+        return {"status": "error", "message": "No stock codes configured."}, 500
+
+    try:
+        client = get_kis_client()
+    except (ValueError, requests.exceptions.RequestException) as e:
+        logger.error(f"Failed to initialize KISClient: {e}")
+        return {"status": "error", "message": "Failed to initialize KISClient"}, 500
+
+    result = restate_codes(client, stock_codes, dry_run=dry_run)
+    if not dry_run:
+        refresh_screener([summary['code'] for summary in result['restated']], reread=True)
+    return {"status": "success", **result}, 200
+
+@functions_framework.http
+def screen_stocks(request):
+    """
+    HTTP Cloud Function that screens the whole universe by precomputed
+    features: ?where=ttmYield > 0.05 and close < ma200&sort=-ttmYield&limit=50
+    &fields=name,close,ttmYield. See screener.FEATURE_FIELDS for field names.
+    """
+    args = request.args if request is not None else {}
+    try:
+        limit = max(1, min(int(args.get("limit") or 50), int(os.environ.get("SCREENER_MAX_LIMIT", 500))))
+        fields = [field.strip() for field in (args.get("fields") or "").split(",") if field.strip()]
+        snapshot = get_screener().snapshot(get_target_stock_codes())
+        result = snapshot.screen(
+            where=args.get("where") or None,
+            sort=args.get("sort") or None,
+            limit=limit,
+            fields=fields or None,
+        )
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}, 400
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(f"Screen failed: {e}")
+        return {"status": "error", "message": "Failed to run screen."}, 500
+    return {"status": "success", "universe": len(snapshot), **result}, 200
+
+@functions_framework.http
+def poll_intraday(request):
+    """
+    HTTP Cloud Function for intraday quotes, triggered every minute during
+    the session. Polls for INTRADAY_RUN_SECONDS (or ?duration=, capped at
+    INTRADAY_MAX_DURATION) and writes throttled updates to
+    stocks/{code}/intraday/latest. ?force=1 (poll outside the session) and
+    ?duration= need an admin caller (see caller_auth).
+    """
+    global intraday_poller
+
+    args = request.args if request is not None else {}
+    force = _is_truthy(args.get("force"))
+    if force or args.get("duration"):
+        try:
+            require_admin(request)
+        except CallerAuthError as e:
+            return {"status": "error", "message": str(e)}, e.status
+    try:
+        duration = float(args.get("duration") or os.environ.get("INTRADAY_RUN_SECONDS", 50))
+        if not math.isfinite(duration):
+            raise ValueError
+    except ValueError:
+        return {"status": "error", "message": "duration must be a number of seconds."}, 400
+    duration = min(max(duration, 0.0), INTRADAY_MAX_DURATION)
+    if not force and not is_market_open():
+        return {"status": "skipped", "message": "KRX regular session is closed."}, 200
+
+    stock_codes = get_target_stock_codes()
+    if not stock_codes:
+        return {"status": "error", "message": "No stock codes configured."}, 500
+
+    if intraday_poller is None:
+        try:
+            intraday_poller = IntradayPoller(get_kis_client(), get_db())
+        except (ValueError, requests.exceptions.RequestException) as e:
+            logger.error(f"Failed to initialize KISClient: {e}")
+            return {"status": "error", "message": "Failed to initialize KISClient"}, 500
+
+    stats = intraday_poller.run(stock_codes, duration, respect_market_hours=not force)
+    return {"status": "success", "stats": stats}, 200
+
+@functions_framework.cloud_event
+def sync_line_index(cloud_event):
+    """
+    Firestore trigger (document.written on users/{uid}/lines/{lineId}) that keeps
+    users/{uid}/lineIndex/{stockCode} in step with the user's lines.
+    """
+    uid, line_id, before, after = parse_line_event(cloud_event.data)
+    if uid is None:
+        logger.warning(f"sync_line_index: ignoring event for {cloud_event.get('subject')}")
+        return
+    apply_line_change(get_db(), uid, line_id, before, after)
+    logger.info(f"sync_line_index: users/{uid}/lines/{line_id} -> {(after or before or {}).get('stockCode')}")
+
+@functions_framework.cloud_event
+def sync_dividend_calendar(cloud_event):
+    """
+    Firestore trigger (document.written on stocks/{code}) that keeps the
+    dividendCalendar/{YYYY-MM} entries of that stock in step with its dividends.
+    """
+    parts, before, after = parse_document_event(cloud_event.data)
+    if len(parts) != 2 or parts[0] != 'stocks':
+        logger.warning(f"sync_dividend_calendar: ignoring event for {cloud_event.get('subject')}")
+        return
+    touched = apply_dividend_change(get_db(), parts[1], before, after)
+    if touched:
+        logger.info(f"sync_dividend_calendar: {parts[1]} updated {touched} calendar months")
+
+@functions_framework.cloud_event
+def sync_search_index(cloud_event):
+    """
+    Firestore trigger (document.written on stocks/{code}) that moves one
+    stock's searchIndex terms when it is added, removed or renamed.
+    """
+    parts, before, after = parse_document_event(cloud_event.data)
+    if len(parts) != 2 or parts[0] != 'stocks':
+        logger.warning(f"sync_search_index: ignoring event for {cloud_event.get('subject')}")
+        return
+    stock_code = parts[1]
+    # Same fallback as load_stock_names: a stock without a name is found by its code
+    before_name = (before.get('name') or stock_code) if before is not None else None
+    after_name = (after.get('name') or stock_code) if after is not None else None
+    if before_name == after_name:
+        return
+    shards = apply_stock_change(get_db(), stock_code, before_name, after_name)
+    logger.info(f"sync_search_index: {stock_code} changed, updated {shards} search shards")
+
+@functions_framework.http
+def reindex_search(request):
+    """
+    HTTP Cloud Function that rebuilds the whole searchIndex from the stocks
+    collection (admin callers only). Triggers keep it current stock by stock;
+    use this after bulk changes or to re-split grown shards.
+    """
+    try:
+        require_admin(request)
+    except CallerAuthError as e:
+        return {"status": "error", "message": str(e)}, e.status
+    shards = rebuild_search_index(get_db())
+    return {"status": "success", "shards": shards}, 200
+
+@functions_framework.http
+def rebuild_line_index(request):
+    """
+    HTTP Cloud Function that recomputes lineIndex docs from the lines
+    subcollection, for one user (?uid=...) or for every user. Use it after
+    backfills or if trigger events were lost. Admin callers only (see
+    caller_auth); the reply carries counts, never user IDs.
+    """
+    try:
+        require_admin(request)
+    except CallerAuthError as e:
+        return {"status": "error", "message": str(e)}, e.status
+
+    args = request.args if request is not None else {}
+    uid = args.get("uid")
+    user_ids = [uid] if uid else [ref.id for ref in get_db().collection('users').list_documents()]
+
+    index_docs = 0
+    failed = 0
+    for user_id in user_ids:
+        try:
+            index_docs += rebuild_user_line_index(get_db(), user_id)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error(f"Failed to rebuild line index for {user_id}: {exc}")
+            failed += 1
+    status = "error" if failed else "success"
+    return {"status": status, "users": len(user_ids), "indexDocs": index_docs, "failed": failed}, (500 if failed else 200)
+
+@functions_framework.http
+def replay_write_journal(request):
+    """
+    HTTP Cloud Function that stores journaled bars from failed daily writes
+    right away instead of waiting for the next fetch_stock_data run.
+    """
+    try:
+        result = replay_pending_writes()
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(f"Failed to replay write journal: {e}")
+        return {"status": "error", "message": str(e)}, 500
+    status = "success" if result['failed_count'] == 0 else "partial_failure"
+    return {"status": status, **result}, 200
+
 @functions_framework.http
 def health_check(request):
     """Simple health check endpoint"""
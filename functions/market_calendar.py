@@ -0,0 +1,132 @@
+"""
+KRX trading calendar with offline holiday tables.
+Used to skip scheduler runs on weekends/holidays without calling KIS.
+"""
+
+import logging
+import os
+from datetime import date, datetime, time, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+KST = timezone(timedelta(hours=9), name="KST")
+
+# Regular session (정규장) hours
+MARKET_OPEN = time(9, 0)
+MARKET_CLOSE = time(15, 30)
+
+# KRX 휴장일 (weekends excluded). Includes substitute and temporary holidays
+# plus the year-end closing day (12-31).
+KRX_HOLIDAYS = {
+    2024: {
+        "01-01", "02-09", "02-12", "03-01", "04-10", "05-01", "05-06", "05-15",
+        "06-06", "08-15", "09-16", "09-17", "09-18", "10-01", "10-03", "10-09",
+        "12-25", "12-31",
+    },
+    2025: {
+        "01-01", "01-27", "01-28", "01-29", "01-30", "03-03", "05-01", "05-05",
+        "05-06", "06-03", "06-06", "08-15", "10-03", "10-06", "10-07", "10-08",
+        "10-09", "12-25", "12-31",
+    },
+    2026: {
+        "01-01", "02-16", "02-17", "02-18", "03-02", "05-01", "05-05", "05-25",
+        "06-03", "08-17", "09-24", "09-25", "10-05", "10-09", "12-25", "12-31",
+    },
+    2027: {
+        "01-01", "02-05", "02-08", "03-01", "05-05", "05-13", "08-16", "09-14",
+        "09-15", "09-16", "10-04", "10-11", "12-27", "12-31",
+    },
+}
+
+
+def _parse_extra_holidays(raw):
+    """Ad-hoc closures from KRX_EXTRA_HOLIDAYS (comma separated YYYYMMDD)."""
+    extra = set()
+    for token in raw.split(","):
+        token = token.strip()
+        if not token:
+            continue
+        try:
+            extra.add(datetime.strptime(token, "%Y%m%d").date())
+        except ValueError:
+            logger.error("Ignoring malformed KRX_EXTRA_HOLIDAYS entry %r (expected YYYYMMDD).", token)
+    return frozenset(extra)
+
+
+# Parsed once; a bad entry is logged here instead of failing every calendar check
+EXTRA_HOLIDAYS = _parse_extra_holidays(os.environ.get("KRX_EXTRA_HOLIDAYS", ""))
+
+# Years outside the table already warned about in this process
+_warned_years = set()
+
+
+def covered_years():
+    """Years for which the offline holiday table is authoritative."""
+    return sorted(KRX_HOLIDAYS)
+
+
+def now_kst() -> datetime:
+    return datetime.now(KST)
+
+
+def today_kst() -> date:
+    return now_kst().date()
+
+
+def is_holiday(day: date) -> bool:
+    """
+    KRX holiday check. Outside covered_years() only weekends and
+    KRX_EXTRA_HOLIDAYS are known, so the first such lookup per year logs
+    a warning to extend KRX_HOLIDAYS.
+    """
+    if day in EXTRA_HOLIDAYS:
+        return True
+    if day.year not in KRX_HOLIDAYS and day.year not in _warned_years:
+        _warned_years.add(day.year)
+        logger.warning("No KRX holiday table for %d; holidays are treated as trading days "
+                       "until KRX_HOLIDAYS is extended (or set KRX_EXTRA_HOLIDAYS).", day.year)
+    return day.strftime("%m-%d") in KRX_HOLIDAYS.get(day.year, ())
+
+
+def is_trading_day(day: date) -> bool:
+    """True if KRX holds a regular session on `day`."""
+    return day.weekday() < 5 and not is_holiday(day)
+
+
+def previous_trading_day(day: date) -> date:
+    """Latest trading day strictly before `day`."""
+    day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def latest_trading_day(day: date) -> date:
+    """`day` itself if it is a trading day, otherwise the one before it."""
+    return day if is_trading_day(day) else previous_trading_day(day)
+
+
+def trading_days_between(start: date, end: date):
+    """Trading days in [start, end], in order."""
+    day = start
+    while day <= end:
+        if is_trading_day(day):
+            yield day
+        day += timedelta(days=1)
+
+
+def is_market_open(moment: datetime = None) -> bool:
+    """True during the regular session of a trading day (KST)."""
+    moment = (moment or now_kst()).astimezone(KST)
+    return is_trading_day(moment.date()) and MARKET_OPEN <= moment.time() <= MARKET_CLOSE
+
+
+def next_session_open(moment: datetime = None) -> datetime:
+    """Start of the first regular session after `moment` (KST)."""
+    moment = (moment or now_kst()).astimezone(KST)
+    day = moment.date()
+    if not (is_trading_day(day) and moment.time() < MARKET_OPEN):
+        day += timedelta(days=1)
+        while not is_trading_day(day):
+            day += timedelta(days=1)
+    return datetime.combine(day, MARKET_OPEN, tzinfo=KST)
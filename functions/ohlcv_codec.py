@@ -0,0 +1,144 @@
+"""
+Encodings for daily OHLCV entries in stocks/{code}/monthly/{YYYY-MM} documents.
+
+  map    (legacy, no `enc` field)  days: {"02": {open, high, low, close, volume}}
+  array  (enc = 1)                 days: {"02": [open, high, low, close, volume]}
+  packed (enc = 2)                 packed: <bytes>, one column per field
+
+Readers should always go through decode_month(), which accepts any of the
+three forms, including documents where later daily merges added `days`
+entries on top of a packed blob.
+"""
+
+import os
+import struct
+from typing import Dict
+
+FIELDS = ("open", "high", "low", "close", "volume")
+
+ENCODING_MAP = "map"
+ENCODING_ARRAY = "array"
+ENCODING_PACKED = "packed"
+ENCODINGS = (ENCODING_MAP, ENCODING_ARRAY, ENCODING_PACKED)
+
+ENCODING_FIELD = "enc"
+ENCODING_VERSIONS = {ENCODING_MAP: 0, ENCODING_ARRAY: 1, ENCODING_PACKED: 2}
+
+PACKED_FIELD = "packed"
+# Every top-level field an encoding may own
+ENCODED_FIELDS = (ENCODING_FIELD, 'days', PACKED_FIELD)
+
+# Blob layout: version (B), day count (B), then columns:
+# day-of-month (B*n), open/high/low/close (I*n each), volume (Q*n)
+PACKED_VERSION = 1
+_PACKED_HEADER = struct.Struct("<BB")
+
+
+def encoding_from_env(default=ENCODING_MAP) -> str:
+    encoding = os.environ.get("MONTHLY_ENCODING", default).lower()
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown MONTHLY_ENCODING {encoding!r}; expected one of {ENCODINGS}.")
+    return encoding
+
+
+def day_values(day_data) -> Dict[str, int]:
+    """Normalize one stored day (map or array form) to a field dict."""
+    if isinstance(day_data, dict):
+        return {field: int(day_data.get(field, 0)) for field in FIELDS}
+    return {field: int(value) for field, value in zip(FIELDS, day_data)}
+
+
+def _pack(days: Dict[str, Dict[str, int]]) -> bytes:
+    ordered = sorted(days)
+    count = len(ordered)
+    columns = [[int(day) for day in ordered]]
+    for field in FIELDS:
+        columns.append([int(days[day][field]) for day in ordered])
+    body = struct.pack(f"<{count}B{count * 4}I{count}Q", *[v for column in columns for v in column])
+    return _PACKED_HEADER.pack(PACKED_VERSION, count) + body
+
+
+def _unpack(blob: bytes) -> Dict[str, Dict[str, int]]:
+    version, count = _PACKED_HEADER.unpack_from(blob)
+    if version != PACKED_VERSION:
+        raise ValueError(f"Unsupported packed OHLCV version {version}.")
+    values = struct.unpack_from(f"<{count}B{count * 4}I{count}Q", blob, _PACKED_HEADER.size)
+    day_numbers = values[:count]
+    columns = [values[count * (i + 1):count * (i + 2)] for i in range(len(FIELDS))]
+    return {
+        f"{day:02d}": {field: columns[i][idx] for i, field in enumerate(FIELDS)}
+        for idx, day in enumerate(day_numbers)
+    }
+
+
+def encode_month(days: Dict[str, Dict[str, int]], encoding=ENCODING_MAP) -> Dict:
+    """Build monthly document fields from {day: {field: value}}."""
+    days = {day: day_values(values) for day, values in days.items()}
+    if encoding == ENCODING_MAP:
+        return {'days': days}
+    if encoding == ENCODING_ARRAY:
+        return {
+            ENCODING_FIELD: ENCODING_VERSIONS[ENCODING_ARRAY],
+            'days': {day: [values[field] for field in FIELDS] for day, values in days.items()},
+        }
+    if encoding == ENCODING_PACKED:
+        return {ENCODING_FIELD: ENCODING_VERSIONS[ENCODING_PACKED], PACKED_FIELD: _pack(days)}
+    raise ValueError(f"Unknown encoding {encoding!r}.")
+
+
+def decode_month(doc: Dict) -> Dict[str, Dict[str, int]]:
+    """Return {day: {field: value}} from a monthly document in any encoding."""
+    doc = doc or {}
+    days = {}
+    if doc.get(PACKED_FIELD):
+        days.update(_unpack(bytes(doc[PACKED_FIELD])))
+    for day, day_data in (doc.get('days') or {}).items():
+        days[day] = day_values(day_data)
+    return days
+
+
+def document_encoding(doc: Dict) -> str:
+    version = (doc or {}).get(ENCODING_FIELD, 0)
+    for name, number in ENCODING_VERSIONS.items():
+        if number == version:
+            return name
+    raise ValueError(f"Unknown monthly encoding version {version!r}.")
+
+
+def day_update(day: str, values: Dict[str, int], encoding=ENCODING_MAP) -> Dict:
+    """
+    Fields for a `set(..., merge=True)` that adds one day, including the
+    `enc` marker of the encoding written (removed for map). Not available for
+    the packed encoding, which needs a read-modify-write (see write_day).
+    """
+    values = day_values(values)
+    if encoding == ENCODING_MAP:
+        from firebase_admin import firestore
+
+        return {ENCODING_FIELD: firestore.DELETE_FIELD, 'days': {day: values}}
+    if encoding == ENCODING_ARRAY:
+        return {
+            ENCODING_FIELD: ENCODING_VERSIONS[ENCODING_ARRAY],
+            'days': {day: [values[field] for field in FIELDS]},
+        }
+    raise ValueError("The packed encoding cannot be updated with a merge.")
+
+
+def write_day(db, doc_ref, day: str, values: Dict[str, int], encoding=ENCODING_MAP):
+    """Store one day in a monthly document using the requested encoding."""
+    if encoding != ENCODING_PACKED:
+        doc_ref.set(day_update(day, values, encoding), merge=True)
+        return
+
+    from firebase_admin import firestore
+
+    @firestore.transactional
+    def _update(transaction):
+        snapshot = doc_ref.get(transaction=transaction)
+        days = decode_month(snapshot.to_dict() if snapshot.exists else {})
+        days[day] = day_values(values)
+        # Merge so unrelated fields survive; merged `days` entries are now in the blob
+        transaction.set(doc_ref, {**encode_month(days, ENCODING_PACKED), 'days': firestore.DELETE_FIELD},
+                        merge=True)
+
+    _update(db.transaction())
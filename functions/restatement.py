@@ -0,0 +1,174 @@
+"""
+Restatement of stored history after splits, rights issues and other
+corporate actions.
+
+KIS returns adjusted prices (FID_ORG_ADJ_PRC=1), but only the newest day is
+stored each run, so older days stay on the pre-event basis. Comparing the
+recent KIS series with stored values reveals the event: days before it
+differ by a common factor, days after it match. Every stored month up to
+the last mismatching day is then rescaled column by column and rewritten
+in batches; months after the event are left alone.
+"""
+
+import logging
+import statistics
+from typing import Dict, List, Optional
+
+from history_reader import StockHistoryReader, to_columns
+from ohlcv_codec import FIELDS, encode_month
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ("open", "high", "low", "close")
+# Adjusted KIS prices are rounded to whole won; allow that much slack per day
+RELATIVE_TOLERANCE = 0.005
+
+
+def _matches(expected: float, actual: int) -> bool:
+    return abs(expected - actual) <= max(1.0, abs(actual) * RELATIVE_TOLERANCE)
+
+
+def detect_adjustment(stored: Dict, series: List[Dict]) -> Optional[Dict]:
+    """
+    Compare stored columns ({"dates", "close", ...}) with a KIS daily series
+    (newest first). Returns None when they agree, otherwise
+    {"boundary": YYYYMMDD of the newest mismatching day, "factor",
+     "volume_factor", "dates": overlapping dates checked}.
+    Raises ValueError when the mismatches do not share one factor.
+    """
+    stored_by_date = {
+        date: {field: stored[field][idx] for field in FIELDS}
+        for idx, date in enumerate(stored["dates"])
+    }
+    overlap = [row for row in series if row.get("date") in stored_by_date and row["close"] > 0]
+    mismatched = [
+        row for row in overlap
+        if not all(_matches(stored_by_date[row["date"]][field], row[field]) for field in PRICE_FIELDS)
+    ]
+    if not mismatched:
+        return None
+
+    boundary = max(row["date"] for row in mismatched)
+    before = [row for row in overlap if row["date"] <= boundary]
+    factor = statistics.median(row["close"] / stored_by_date[row["date"]]["close"]
+                               for row in before if stored_by_date[row["date"]]["close"])
+    for row in before:
+        old = stored_by_date[row["date"]]
+        if not all(_matches(old[field] * factor, row[field]) for field in PRICE_FIELDS):
+            raise ValueError(
+                f"Stored {row['date']} does not match KIS at factor {factor:.6f}; "
+                "more than one adjustment in the window or inconsistent data."
+            )
+
+    volume_ratios = [row["volume"] / stored_by_date[row["date"]]["volume"]
+                     for row in before if stored_by_date[row["date"]]["volume"]]
+    volume_factor = statistics.median(volume_ratios) if volume_ratios else 1.0
+    if abs(volume_factor - 1.0) <= RELATIVE_TOLERANCE:
+        # KIS left volume unadjusted
+        volume_factor = 1.0
+
+    return {
+        "boundary": boundary,
+        "factor": factor,
+        "volume_factor": volume_factor,
+        "dates": [row["date"] for row in overlap],
+    }
+
+
+def restate_columns(columns: Dict, factor: float, volume_factor: float, boundary: str,
+                    overrides: Dict[str, Dict]) -> Dict:
+    """
+    Rescale every day up to `boundary` in columnar data; days present in
+    `overrides` (the KIS series) take KIS's own values.
+    """
+    dates = columns["dates"]
+    cutoff = sum(1 for date in dates if date <= boundary)
+    restated = {"code": columns.get("code"), "dates": dates}
+    for field in FIELDS:
+        scale = volume_factor if field == "volume" else factor
+        values = columns[field]
+        restated[field] = [round(value * scale) for value in values[:cutoff]] + list(values[cutoff:])
+    for idx, date in enumerate(dates[:cutoff]):
+        if date in overrides:
+            for field in FIELDS:
+                restated[field][idx] = overrides[date][field]
+    return restated
+
+
+class RestatementEngine:
+    """Detects adjustment events per code and rewrites the affected months."""
+
+    def __init__(self, db, encoding, reader: Optional[StockHistoryReader] = None, batch_size=400):
+        self.db = db
+        self.encoding = encoding
+        self.reader = reader or StockHistoryReader(db)
+        self.batch_size = batch_size
+
+    def _month_ids(self, stock_code, last_month_id):
+        monthly = self.db.collection('stocks').document(stock_code).collection('monthly')
+        return sorted(ref.id for ref in monthly.list_documents() if ref.id <= last_month_id)
+
+    def check(self, stock_code: str, series: List[Dict]) -> Optional[Dict]:
+        """Detect an adjustment for one code against its stored recent months."""
+        if not series:
+            return None
+        window = sorted({f"{row['date'][:4]}-{row['date'][4:6]}" for row in series if row.get("date")})
+        months = self.reader.read_months((stock_code, month_id) for month_id in window)
+        stored = to_columns(stock_code, {month_id: days for (_, month_id), days in months.items()})
+        return detect_adjustment(stored, series)
+
+    def restate(self, stock_code: str, series: List[Dict], dry_run=False) -> Optional[Dict]:
+        """
+        Detect and apply an adjustment for one code. Returns a summary with
+        the factor and months rewritten, or None when nothing changed.
+        """
+        from firebase_admin import firestore
+
+        event = self.check(stock_code, series)
+        if event is None:
+            return None
+
+        boundary = event["boundary"]
+        month_ids = self._month_ids(stock_code, f"{boundary[:4]}-{boundary[4:6]}")
+        months = self.reader.read_months((stock_code, month_id) for month_id in month_ids)
+        overrides = {row["date"]: row for row in series if row.get("date")}
+
+        summary = {
+            "code": stock_code,
+            "boundary": boundary,
+            "factor": round(event["factor"], 6),
+            "volumeFactor": round(event["volume_factor"], 6),
+            "months": len(month_ids),
+            "dryRun": dry_run,
+        }
+        if dry_run:
+            return summary
+
+        monthly = self.db.collection('stocks').document(stock_code).collection('monthly')
+        batch = self.db.batch()
+        batch_count = 0
+        for month_id in month_ids:
+            columns = to_columns(stock_code, {month_id: months[(stock_code, month_id)]})
+            restated = restate_columns(columns, event["factor"], event["volume_factor"], boundary, overrides)
+            days = {
+                date[6:]: {field: restated[field][idx] for field in FIELDS}
+                for idx, date in enumerate(restated["dates"])
+            }
+            batch.set(monthly.document(month_id), encode_month(days, self.encoding))
+            batch_count += 1
+            if batch_count >= self.batch_size:
+                batch.commit()
+                batch = self.db.batch()
+                batch_count = 0
+
+        # Audit record, written with the last batch
+        event_ref = self.db.collection('stocks').document(stock_code).collection('restatements').document(boundary)
+        batch.set(event_ref, {**summary, 'detectedAt': firestore.SERVER_TIMESTAMP})
+        batch.commit()
+        self.reader.clear()
+
+        logger.info(
+            "Restated %s: %d months up to %s by factor %.6f (volume %.6f)",
+            stock_code, len(month_ids), boundary, event["factor"], event["volume_factor"],
+        )
+        return summary
@@ -0,0 +1,214 @@
+"""
+Retry policy and circuit breaker for KIS API calls.
+Classifies failures as retryable, rate-limited or fatal and spaces retries
+with decorrelated jitter. A shared circuit breaker pauses every caller while
+KIS is degraded instead of letting each worker hammer it.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# KIS reports throttling inside the JSON body (often with HTTP 500)
+# EGW00201: 초당 거래건수 초과, EGW00133: 접근토큰 발급 잠시 후 다시 시도 (1분당 1회)
+KIS_RATE_LIMIT_CODES = {"EGW00201", "EGW00133"}
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# Decision values returned by RetryPolicy.classify
+RETRY = "retry"
+RATE_LIMITED = "rate_limited"
+FATAL = "fatal"
+
+
+class KISRateLimitError(requests.exceptions.HTTPError):
+    """Raised when KIS keeps rejecting calls with a rate-limit code."""
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised when the circuit breaker refuses a call."""
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def parse_retry_after(response) -> Optional[float]:
+    """Return the Retry-After delay in seconds, if the response carries one."""
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # HTTP-date form is not used by KIS; ignore it rather than guess
+        return None
+
+
+def kis_error_code(response) -> Optional[str]:
+    """Extract KIS `msg_cd` from a JSON body, or None if absent/not JSON."""
+    if response is None:
+        return None
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    return body.get("msg_cd")
+
+
+def is_rate_limited(response) -> bool:
+    """True if the response is a KIS (or HTTP 429) rate-limit rejection."""
+    if response is None:
+        return False
+    if response.status_code == 429:
+        return True
+    return kis_error_code(response) in KIS_RATE_LIMIT_CODES
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed KIS call is retried and how long to wait.
+    Delays follow the "decorrelated jitter" scheme:
+        sleep = min(max_delay, uniform(base_delay, previous_sleep * 3))
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=20.0, rate_limit_delay=1.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_delay = rate_limit_delay
+
+    @classmethod
+    def from_env(cls):
+        """Build a policy from KIS_RETRY_* environment variables."""
+        return cls(
+            max_attempts=int(_env_float("KIS_RETRY_MAX_ATTEMPTS", 4)),
+            base_delay=_env_float("KIS_RETRY_BASE_DELAY", 0.5),
+            max_delay=_env_float("KIS_RETRY_MAX_DELAY", 20.0),
+            rate_limit_delay=_env_float("KIS_RATE_LIMIT_DELAY", 1.0),
+        )
+
+    def classify(self, exc=None, response=None) -> str:
+        """Classify a failure as RETRY, RATE_LIMITED or FATAL."""
+        if response is None and isinstance(exc, requests.exceptions.HTTPError):
+            response = exc.response
+
+        if is_rate_limited(response):
+            return RATE_LIMITED
+        if response is not None:
+            return RETRY if response.status_code in RETRYABLE_STATUS_CODES else FATAL
+        if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return RETRY
+        return FATAL
+
+    def next_delay(self, previous_delay: float, decision: str, response=None) -> float:
+        """Return the sleep before the next attempt."""
+        retry_after = parse_retry_after(response)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+
+        floor = self.rate_limit_delay if decision == RATE_LIMITED else self.base_delay
+        upper = max(floor, previous_delay * 3)
+        return min(self.max_delay, random.uniform(floor, upper))
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker shared by every KIS caller in the process.
+
+    closed    -> calls flow; consecutive failures are counted
+    open      -> all callers wait until the cool-down elapses
+    half-open -> one probe call is let through; success closes the circuit
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def wait_time(self) -> float:
+        """
+        Seconds the caller must wait before issuing a request (0 = go ahead).
+        Moves an expired open circuit to half-open and admits a single probe.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return 0.0
+
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self._state == self.OPEN and remaining > 0:
+                return remaining
+
+            if not self._probe_in_flight:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = True
+                return 0.0
+            # Another caller is probing; check back shortly
+            return min(1.0, self.reset_timeout)
+
+    def before_request(self, max_wait: Optional[float] = None):
+        """Block while the circuit is open. Raises CircuitOpenError past max_wait."""
+        waited = 0.0
+        while True:
+            delay = self.wait_time()
+            if delay <= 0:
+                return
+            if max_wait is not None and waited + delay > max_wait:
+                raise CircuitOpenError("KIS circuit breaker is open")
+            logger.warning("KIS circuit open; pausing %.1fs", delay)
+            time.sleep(delay)
+            waited += delay
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.error("KIS circuit opened after %d consecutive failures.", self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+# Longest a caller blocks on an open circuit before failing with CircuitOpenError;
+# covers one cool-down plus a probe so a single KIS hiccup does not fail a code
+KIS_CIRCUIT_MAX_WAIT = _env_float("KIS_CIRCUIT_MAX_WAIT", 60.0)
+
+# Process-wide breaker so every KISClient (and every worker thread) shares it
+kis_circuit_breaker = CircuitBreaker(
+    failure_threshold=int(_env_float("KIS_CIRCUIT_FAILURE_THRESHOLD", 5)),
+    reset_timeout=_env_float("KIS_CIRCUIT_RESET_TIMEOUT", 30.0),
+)
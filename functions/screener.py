@@ -0,0 +1,376 @@
+"""
+Cross-sectional stock screener.
+
+Per-code features (latest close, moving averages, 52-week range, trailing
+dividend yield, ...) are computed from stored history once and kept in
+screener/features_{shard} documents ({'features': {code: {field: value}}},
+shard = crc32(code) % FEATURE_SHARDS), so loading the whole universe is one
+get_all. In memory they form a FeatureSnapshot: one list per field, one row
+per code. Screens are expressions over field names, evaluated column by
+column into a boolean mask:
+
+    ttmYield > 0.05 and close < ma200
+    fromHigh52w > -0.1 and (avgVolume20 * close) >= 1e9
+    period == '월말'
+
+After each collection run only the codes whose data changed are recomputed
+and merged (refresh()).
+"""
+
+import ast
+import logging
+import operator
+import os
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional
+
+from backtest import dividend_events
+from history_reader import StockHistoryReader
+from market_calendar import today_kst
+
+logger = logging.getLogger(__name__)
+
+SCREENER_COLLECTION = 'screener'
+FEATURE_SHARDS = int(os.environ.get("SCREENER_FEATURE_SHARDS", 8))
+# Calendar days of history read per code: enough for ma200 and the 52-week range
+HISTORY_DAYS = 400
+MOVING_AVERAGES = (20, 60, 120, 200)
+MAX_EXPRESSION_LENGTH = 500
+
+FEATURE_FIELDS = (
+    "name", "period", "lastDate", "close", "change", "volume", "avgVolume20",
+    *(f"ma{window}" for window in MOVING_AVERAGES),
+    "high52w", "low52w", "fromHigh52w", "return1m", "return1y",
+    "ttmDividends", "ttmYield", "dividendCount12m",
+)
+# Text-valued fields: comparable, but never arithmetic operands
+STRING_FIELDS = frozenset({"name", "period", "lastDate"})
+
+
+# --- Features ---
+
+def _mean_tail(values: List[float], window: int) -> Optional[float]:
+    return sum(values[-window:]) / window if len(values) >= window else None
+
+
+def _ratio(numerator, denominator) -> Optional[float]:
+    return round(numerator / denominator - 1, 6) if numerator is not None and denominator else None
+
+
+def compute_features(stock: Optional[Dict], columns: Dict) -> Optional[Dict]:
+    """Feature row for one code from its stocks/{code} document and recent columnar history."""
+    dates, close = columns["dates"], columns["close"]
+    if not dates:
+        return None
+    last = datetime.strptime(dates[-1], "%Y%m%d").date()
+    year_ago = (last - timedelta(days=365)).strftime("%Y%m%d")
+    start_52w = next(idx for idx, key in enumerate(dates) if key > year_ago)
+    high52w = max(columns["high"][start_52w:])
+    low52w = min(columns["low"][start_52w:])
+    ttm = [amount for ex_date, amount in dividend_events(stock) if year_ago < ex_date <= dates[-1]]
+    ttm_dividends = sum(ttm)
+
+    row = {
+        "name": (stock or {}).get("name") or columns.get("code"),
+        "period": (stock or {}).get("period"),
+        "lastDate": dates[-1],
+        "close": close[-1],
+        "change": _ratio(close[-1], close[-2]) if len(close) > 1 else None,
+        "volume": columns["volume"][-1],
+        "avgVolume20": _mean_tail(columns["volume"], 20),
+        "high52w": high52w,
+        "low52w": low52w,
+        "fromHigh52w": _ratio(close[-1], high52w),
+        "return1m": _ratio(close[-1], close[-22]) if len(close) > 21 else None,
+        # Only when the history reaches back a full year
+        "return1y": _ratio(close[-1], close[start_52w - 1]) if start_52w > 0 else None,
+        "ttmDividends": ttm_dividends,
+        "ttmYield": round(ttm_dividends / close[-1], 6) if close[-1] else None,
+        "dividendCount12m": len(ttm),
+    }
+    for window in MOVING_AVERAGES:
+        average = _mean_tail(close, window)
+        row[f"ma{window}"] = round(average, 4) if average is not None else None
+    return row
+
+
+# --- Expressions ---
+
+_COMPARISONS = {
+    ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Eq: operator.eq, ast.NotEq: operator.ne,
+}
+_ARITHMETIC = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+
+
+def _is_numeric(node) -> bool:
+    """Whether a (whitelisted) node always evaluates to numbers: numeric constants, numeric fields, arithmetic."""
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, (int, float)) and not isinstance(node.value, bool)
+    if isinstance(node, ast.Name):
+        return node.id in FEATURE_FIELDS and node.id not in STRING_FIELDS
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.op, ast.USub) and _is_numeric(node.operand)
+    if isinstance(node, ast.BinOp):
+        return type(node.op) in _ARITHMETIC and _is_numeric(node.left) and _is_numeric(node.right)
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "abs"
+
+
+def _require_numeric(*nodes):
+    for node in nodes:
+        if not _is_numeric(node):
+            raise ValueError(f"Arithmetic needs numeric operands, not {ast.unparse(node)!r}.")
+
+
+def _elementwise(func, left, right, n):
+    """Apply func over two vectors (or scalars, broadcast); None and bad operands give None."""
+    left = left if isinstance(left, list) else [left] * n
+    right = right if isinstance(right, list) else [right] * n
+    result = []
+    for a, b in zip(left, right):
+        try:
+            result.append(None if a is None or b is None else func(a, b))
+        except (TypeError, ZeroDivisionError):
+            result.append(None)
+    return result
+
+
+@lru_cache(maxsize=256)
+def compile_expression(text: str) -> Callable[[Dict[str, List], int], List]:
+    """
+    Compile a screen expression into fn(columns, n) -> vector. Only field
+    names, numbers, strings, + - * /, comparisons (chains too), and/or/not,
+    abs() and parentheses are accepted; anything else raises ValueError.
+    Arithmetic, unary minus and abs() take numeric fields and numbers only,
+    so strings never reach * or +.
+    """
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"Expression is longer than {MAX_EXPRESSION_LENGTH} characters.")
+    try:
+        tree = ast.parse(text, mode="eval").body
+    except SyntaxError as exc:
+        raise ValueError(f"Invalid expression: {exc.msg}") from exc
+
+    def build(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)) \
+                and not isinstance(node.value, bool):
+            value = node.value
+            return lambda columns, n: value
+        if isinstance(node, ast.Name):
+            if node.id not in FEATURE_FIELDS:
+                raise ValueError(f"Unknown field {node.id!r}.")
+            name = node.id
+            return lambda columns, n: columns[name]
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            operand = build(node.operand)
+            _require_numeric(node.operand)
+            return lambda columns, n: _elementwise(lambda a, _: -a, operand(columns, n), 0, n)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            operand = build(node.operand)
+            return lambda columns, n: [not value for value in _truth(operand(columns, n), n)]
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+            func, left, right = _ARITHMETIC[type(node.op)], build(node.left), build(node.right)
+            _require_numeric(node.left, node.right)
+            return lambda columns, n: _elementwise(func, left(columns, n), right(columns, n), n)
+        if isinstance(node, ast.Compare) and all(type(op) in _COMPARISONS for op in node.ops):
+            operands = [build(node.left)] + [build(comparator) for comparator in node.comparators]
+            funcs = [_COMPARISONS[type(op)] for op in node.ops]
+
+            def compare(columns, n):
+                values = [operand(columns, n) for operand in operands]
+                mask = [True] * n
+                for func, left, right in zip(funcs, values, values[1:]):
+                    mask = [m and bool(r) for m, r in zip(mask, _elementwise(func, left, right, n))]
+                return mask
+            return compare
+        if isinstance(node, ast.BoolOp):
+            parts = [build(value) for value in node.values]
+            combine = all if isinstance(node.op, ast.And) else any
+            return lambda columns, n: [
+                combine(row) for row in zip(*(_truth(part(columns, n), n) for part in parts))
+            ]
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "abs" \
+                and len(node.args) == 1 and not node.keywords:
+            operand = build(node.args[0])
+            _require_numeric(node.args[0])
+            return lambda columns, n: _elementwise(lambda a, _: abs(a), operand(columns, n), 0, n)
+        raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}.")
+
+    return build(tree)
+
+
+def _truth(value, n) -> List[bool]:
+    return [bool(item) for item in value] if isinstance(value, list) else [bool(value)] * n
+
+
+def _vector(value, n) -> List:
+    return value if isinstance(value, list) else [value] * n
+
+
+# --- Snapshot ---
+
+class FeatureSnapshot:
+    """Columnar feature table: `codes` plus one list per field, aligned by row."""
+
+    def __init__(self, rows: Dict[str, Dict]):
+        self.codes: List[str] = sorted(rows)
+        self.index = {code: idx for idx, code in enumerate(self.codes)}
+        self.columns = {field: [rows[code].get(field) for code in self.codes] for field in FEATURE_FIELDS}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def upsert(self, rows: Dict[str, Dict]):
+        for code, row in rows.items():
+            idx = self.index.get(code)
+            if idx is None:
+                self.index[code] = len(self.codes)
+                self.codes.append(code)
+                for field in FEATURE_FIELDS:
+                    self.columns[field].append(row.get(field))
+            else:
+                for field in FEATURE_FIELDS:
+                    self.columns[field][idx] = row.get(field)
+
+    def evaluate(self, expression: str) -> List:
+        return _vector(compile_expression(expression)(self.columns, len(self.codes)), len(self.codes))
+
+    def screen(self, where: Optional[str] = None, sort: Optional[str] = None, limit=50,
+               fields: Optional[Iterable[str]] = None, codes: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Rows matching `where`, ordered by `sort` (an expression; prefix "-" for
+        descending, missing values last). `codes` restricts the candidates.
+        Returns {'matched', 'results': [{'code', field: value}]}.
+        """
+        n = len(self.codes)
+        mask = _truth(compile_expression(where)(self.columns, n), n) if where else [True] * n
+        if codes is not None:
+            allowed = set(codes)
+            mask = [m and code in allowed for m, code in zip(mask, self.codes)]
+        selected = [idx for idx, keep in enumerate(mask) if keep]
+
+        if sort:
+            descending = sort.startswith("-")
+            keys = self.evaluate(sort.lstrip("-+"))
+            present = [idx for idx in selected if keys[idx] is not None]
+            missing = [idx for idx in selected if keys[idx] is None]
+            selected = sorted(present, key=keys.__getitem__, reverse=descending) + missing
+
+        fields = list(fields) if fields else list(FEATURE_FIELDS)
+        unknown = [field for field in fields if field not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}.")
+        return {
+            'matched': len(selected),
+            'results': [
+                {'code': self.codes[idx], **{field: self.columns[field][idx] for field in fields}}
+                for idx in selected[:limit]
+            ],
+        }
+
+
+# --- Storage ---
+
+def feature_shard(stock_code: str) -> int:
+    return zlib.crc32(stock_code.encode()) % FEATURE_SHARDS
+
+
+def feature_ref(db, shard: int):
+    return db.collection(SCREENER_COLLECTION).document(f"features_{shard}")
+
+
+def load_feature_rows(db) -> Dict[str, Dict]:
+    rows = {}
+    for snapshot in db.get_all([feature_ref(db, shard) for shard in range(FEATURE_SHARDS)]):
+        if snapshot.exists:
+            rows.update((snapshot.to_dict() or {}).get('features') or {})
+    return rows
+
+
+def write_feature_rows(db, rows: Dict[str, Optional[Dict]]):
+    """
+    Merge feature rows into their shards. Codes without history (None) are
+    stored as {} so they are not recomputed on every load.
+    """
+    from firebase_admin import firestore
+
+    by_shard: Dict[int, Dict] = {}
+    for code, row in rows.items():
+        by_shard.setdefault(feature_shard(code), {})[code] = row or {}
+    batch = db.batch()
+    for shard, features in by_shard.items():
+        batch.set(feature_ref(db, shard), {'features': features, 'updated_at': firestore.SERVER_TIMESTAMP},
+                  merge=True)
+    batch.commit()
+
+
+class Screener:
+    """
+    In-instance feature snapshot. The stored rows are re-read at most every
+    `snapshot_ttl` seconds; codes without a stored row are computed on load.
+    """
+
+    def __init__(self, db, reader: Optional[StockHistoryReader] = None, snapshot_ttl=None):
+        self.db = db
+        self.reader = reader or StockHistoryReader(db)
+        self.snapshot_ttl = float(snapshot_ttl or os.environ.get("SCREENER_SNAPSHOT_TTL", 60))
+        self._lock = threading.Lock()
+        self._snapshot: Optional[FeatureSnapshot] = None
+        self._loaded_at = 0.0
+
+    def compute(self, stock_codes: List[str], as_of: Optional[date] = None) -> Dict[str, Optional[Dict]]:
+        """Feature rows for `stock_codes` from Firestore (stocks docs in one get_all, batched history)."""
+        end = as_of or today_kst()
+        refs = [self.db.collection('stocks').document(code) for code in stock_codes]
+        stocks = {
+            snapshot.id: snapshot.to_dict() if snapshot.exists else None
+            for snapshot in self.db.get_all(refs, field_paths=['name', 'period', 'dividends'])
+        }
+        histories = self.reader.read_many(stock_codes, end - timedelta(days=HISTORY_DAYS), end)
+        return {code: compute_features(stocks.get(code), histories[code]) for code in stock_codes}
+
+    def refresh(self, stock_codes: Iterable[str], reread=False) -> int:
+        """
+        Recompute and store the rows of codes whose data changed. `reread`
+        drops memoized months first (after history was rewritten).
+        """
+        stock_codes = list(dict.fromkeys(stock_codes))
+        if not stock_codes:
+            return 0
+        if reread:
+            self.reader.clear()
+        rows = self.compute(stock_codes)
+        write_feature_rows(self.db, rows)
+        with self._lock:
+            if self._snapshot is not None:
+                self._snapshot.upsert({code: row for code, row in rows.items() if row})
+        return len(rows)
+
+    def invalidate(self):
+        """Rebuild the snapshot on the next screen (the universe changed)."""
+        with self._lock:
+            self._snapshot = None
+
+    def snapshot(self, universe: List[str]) -> FeatureSnapshot:
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._loaded_at < self.snapshot_ttl:
+                return self._snapshot
+
+        rows = load_feature_rows(self.db)
+        missing = [code for code in universe if code not in rows]
+        if missing:
+            logger.info("Computing screener features for %d codes without a stored row.", len(missing))
+            computed = self.compute(missing)
+            write_feature_rows(self.db, computed)
+            rows.update({code: row for code, row in computed.items() if row})
+
+        members = set(universe)
+        snapshot = FeatureSnapshot({code: row for code, row in rows.items() if row and code in members})
+        with self._lock:
+            self._snapshot = snapshot
+            self._loaded_at = time.monotonic()
+        return snapshot
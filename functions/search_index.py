@@ -0,0 +1,278 @@
+"""
+Type-ahead search index over stock names and codes.
+
+Firestore has no substring search, so every searchable prefix is
+precomputed into small shard documents searchIndex/{kind}_{shard}:
+
+    {'kind': 'name', 'shard': '테', 'split': False,
+     'terms': {'테': ['475080'], '테슬': ['475080'], ...},
+     'stocks': {'475080': 'KODEX 테슬라커버드콜채권혼합액티브'}}
+
+kinds: name (prefixes of the whole name and of each word, plus in-word
+substrings of MIN_INFIX_LENGTH or more characters), chosung
+(the same over initial consonants, e.g. ㅌㅅㄹ) and code (code prefixes).
+A shard is keyed by the first character of its terms; a shard with more
+than SHARD_MAX_TERMS terms is split into two-character shards and keeps
+only its one-character terms, marked `split`. A lookup therefore reads
+one document, or two when the first shard is split (see search()).
+
+The full rebuild (rebuild_search_index) is for the migrator and manual
+reindexing; stock document triggers apply one code's before/after diff
+with apply_stock_change.
+"""
+
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+SEARCH_COLLECTION = 'searchIndex'
+KIND_NAME = 'name'
+KIND_CHOSUNG = 'chosung'
+KIND_CODE = 'code'
+KINDS = (KIND_NAME, KIND_CHOSUNG, KIND_CODE)
+
+MAX_PREFIX_LENGTH = int(os.environ.get("SEARCH_MAX_PREFIX", 12))
+MAX_CODES_PER_TERM = int(os.environ.get("SEARCH_MAX_CODES_PER_TERM", 20))
+SHARD_MAX_TERMS = int(os.environ.get("SEARCH_SHARD_MAX_TERMS", 2000))
+# Also index substrings of at least this many characters starting inside a
+# word, so compound names match on a later part (커버드 in 테슬라커버드콜); 0 disables
+MIN_INFIX_LENGTH = int(os.environ.get("SEARCH_MIN_INFIX", 2))
+
+CHOSUNG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+_HANGUL_FIRST, _HANGUL_LAST = 0xAC00, 0xD7A3
+_SYLLABLES_PER_CHOSUNG = 21 * 28
+# Characters kept after normalization: Latin letters, digits, Hangul syllables and jamo
+_UNSEARCHABLE = re.compile(r"[^0-9a-z가-힣ㄱ-ㅎ]+")
+
+
+def normalize(text: str) -> str:
+    return _UNSEARCHABLE.sub("", (text or "").lower())
+
+
+def words(name: str) -> List[str]:
+    """The whole normalized name plus each of its words."""
+    parts = [normalize(part) for part in re.split(r"[\s()\[\]/·&,.+-]+", name or "")]
+    return list(dict.fromkeys([normalize(name)] + [part for part in parts if part]))
+
+
+def chosung(text: str) -> str:
+    """Replace each Hangul syllable with its initial consonant (테슬라 -> ㅌㅅㄹ)."""
+    chars = []
+    for char in text:
+        code_point = ord(char)
+        if _HANGUL_FIRST <= code_point <= _HANGUL_LAST:
+            chars.append(CHOSUNG[(code_point - _HANGUL_FIRST) // _SYLLABLES_PER_CHOSUNG])
+        else:
+            chars.append(char)
+    return "".join(chars)
+
+
+def is_chosung_query(text: str) -> bool:
+    return bool(text) and all(char in CHOSUNG for char in text)
+
+
+def prefixes(term: str, min_length=1) -> Iterable[str]:
+    for length in range(min_length, min(len(term), MAX_PREFIX_LENGTH) + 1):
+        yield term[:length]
+
+
+def infixes(word: str) -> Iterable[str]:
+    if not MIN_INFIX_LENGTH:
+        return
+    for start in range(1, len(word) - MIN_INFIX_LENGTH + 1):
+        yield from prefixes(word[start:], MIN_INFIX_LENGTH)
+
+
+def stock_terms(stock_code: str, name: str) -> Dict[str, Set[str]]:
+    """{kind: prefixes} under which one stock is found."""
+    name_words = words(name)
+    return {
+        KIND_NAME: {term for word in name_words for term in (*prefixes(word), *infixes(word))},
+        KIND_CHOSUNG: {prefix for word in name_words for prefix in prefixes(chosung(word))},
+        KIND_CODE: set(prefixes(normalize(stock_code))),
+    }
+
+
+def search_doc_id(kind: str, shard: str) -> str:
+    return f"{kind}_{shard}"
+
+
+def _shard_doc(kind, shard, terms, names, split=False):
+    codes = {code for term_codes in terms.values() for code in term_codes}
+    return {
+        'kind': kind,
+        'shard': shard,
+        'split': split,
+        'terms': terms,
+        'stocks': {code: names[code] for code in sorted(codes)},
+    }
+
+
+def build_search_index(names: Dict[str, str]) -> Dict[str, Dict]:
+    """Search shard documents {doc_id: doc} for {code: name}."""
+    matches = {kind: defaultdict(set) for kind in KINDS}
+    for stock_code, name in names.items():
+        for kind, terms in stock_terms(stock_code, name).items():
+            for term in terms:
+                matches[kind][term].add(stock_code)
+
+    def ranked(codes):
+        # Shorter names first: the closest match to what was typed
+        return sorted(codes, key=lambda code: (len(names[code]), code))[:MAX_CODES_PER_TERM]
+
+    docs = {}
+    for kind, term_codes in matches.items():
+        by_first = defaultdict(dict)
+        for term, codes in term_codes.items():
+            by_first[term[0]][term] = ranked(codes)
+
+        for first, terms in by_first.items():
+            if len(terms) <= SHARD_MAX_TERMS:
+                docs[search_doc_id(kind, first)] = _shard_doc(kind, first, terms, names)
+                continue
+            short = {term: codes for term, codes in terms.items() if len(term) == 1}
+            docs[search_doc_id(kind, first)] = _shard_doc(kind, first, short, names, split=True)
+            by_two = defaultdict(dict)
+            for term, codes in terms.items():
+                if len(term) > 1:
+                    by_two[term[:2]][term] = codes
+            for shard, shard_terms in by_two.items():
+                docs[search_doc_id(kind, shard)] = _shard_doc(kind, shard, shard_terms, names)
+    return docs
+
+
+def write_search_index(db, docs: Dict[str, Dict], batch_size=400) -> int:
+    """Replace the search index with `docs`, deleting shards that no longer exist."""
+    from firebase_admin import firestore
+
+    collection = db.collection(SEARCH_COLLECTION)
+    writes = [(collection.document(doc_id), {**doc, 'updated_at': firestore.SERVER_TIMESTAMP})
+              for doc_id, doc in docs.items()]
+    writes += [(ref, None) for ref in collection.list_documents() if ref.id not in docs]
+
+    for start in range(0, len(writes), batch_size):
+        batch = db.batch()
+        for ref, data in writes[start:start + batch_size]:
+            if data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, data)
+        batch.commit()
+    return len(docs)
+
+
+def load_stock_names(db) -> Dict[str, str]:
+    """{code: name} for every stocks/{code} document (name field only)."""
+    return {
+        snapshot.id: (snapshot.to_dict() or {}).get('name') or snapshot.id
+        for snapshot in db.collection('stocks').select(['name']).stream()
+    }
+
+
+def rebuild_search_index(db) -> int:
+    """Rebuild the whole index from the stocks collection; returns the shard count."""
+    return write_search_index(db, build_search_index(load_stock_names(db)))
+
+
+def _ranked(codes, names):
+    return sorted(codes, key=lambda code: (len(names.get(code, code)), code))[:MAX_CODES_PER_TERM]
+
+
+def apply_stock_change(db, stock_code: str, before_name, after_name) -> int:
+    """
+    Move one stock from `before_name` to `after_name` in the index (None for
+    a created or deleted stock): its stale terms lose the code, its current
+    terms gain it, re-ranked and capped. Runs in one transaction over the
+    shards involved, writing only the changed terms (merge, DELETE_FIELD for
+    emptied ones), so concurrent triggers cannot undo each other. Shards are
+    not split here and a capped term does not regain codes it dropped for
+    this one; the next full rebuild settles both. Returns the shards written.
+    """
+    from firebase_admin import firestore
+
+    empty = {kind: set() for kind in KINDS}
+    old_terms = stock_terms(stock_code, before_name) if before_name is not None else empty
+    new_terms = stock_terms(stock_code, after_name) if after_name is not None else empty
+    # Every current term is rewritten too, since a rename changes the code's rank
+    changes = {(kind, term): False for kind in KINDS for term in old_terms[kind] - new_terms[kind]}
+    changes.update({(kind, term): True for kind in KINDS for term in new_terms[kind]})
+    if not changes:
+        return 0
+
+    collection = db.collection(SEARCH_COLLECTION)
+
+    def read(transaction, doc_ids):
+        refs = [collection.document(doc_id) for doc_id in sorted(doc_ids)]
+        return {snap.id: snap.to_dict() for snap in db.get_all(refs, transaction=transaction) if snap.exists}
+
+    @firestore.transactional
+    def _apply(transaction):
+        docs = read(transaction, {search_doc_id(kind, term[0]) for kind, term in changes})
+        split_ids = {search_doc_id(kind, term[:2]) for kind, term in changes
+                     if len(term) > 1 and docs.get(search_doc_id(kind, term[0]), {}).get('split')}
+        docs.update(read(transaction, split_ids))
+
+        updates = defaultdict(lambda: {'terms': {}, 'stocks': {}})
+        for (kind, term), add in changes.items():
+            doc_id = search_doc_id(kind, term[0])
+            if len(term) > 1 and docs.get(doc_id, {}).get('split'):
+                doc_id = search_doc_id(kind, term[:2])
+            doc = docs.get(doc_id, {})
+            codes = [code for code in doc.get('terms', {}).get(term, []) if code != stock_code]
+            if add:
+                codes = _ranked(codes + [stock_code], {**doc.get('stocks', {}), stock_code: after_name})
+            elif len(codes) == len(doc.get('terms', {}).get(term, [])):
+                continue
+            updates[doc_id]['terms'][term] = codes or firestore.DELETE_FIELD
+            if doc_id not in docs:
+                updates[doc_id].update({'kind': kind, 'shard': doc_id[len(kind) + 1:], 'split': False})
+
+        for doc_id, update in updates.items():
+            terms = {**docs.get(doc_id, {}).get('terms', {}), **update['terms']}
+            listed = any(stock_code in codes for codes in terms.values() if isinstance(codes, list))
+            if listed:
+                update['stocks'][stock_code] = after_name
+            elif stock_code in docs.get(doc_id, {}).get('stocks', {}):
+                update['stocks'][stock_code] = firestore.DELETE_FIELD
+            transaction.set(collection.document(doc_id), {**update, 'updated_at': firestore.SERVER_TIMESTAMP},
+                            merge=True)
+        return len(updates)
+
+    return _apply(db.transaction())
+
+
+def search(db, query: str, limit=MAX_CODES_PER_TERM) -> List[Dict[str, str]]:
+    """
+    Resolve a type-ahead query the way clients should: one shard read, plus
+    one more when that shard is split. Returns [{'code', 'name'}].
+    """
+    text = normalize(query)
+    if not text:
+        return []
+    if re.fullmatch(r"[0-9][0-9a-z]{0,5}", text):
+        # Looks like a code; names containing digits (RISE 200...) are the fallback
+        return _lookup(db, KIND_CODE, text, limit) or _lookup(db, KIND_NAME, text, limit)
+    return _lookup(db, KIND_CHOSUNG if is_chosung_query(text) else KIND_NAME, text, limit)
+
+
+def _lookup(db, kind, text, limit):
+    collection = db.collection(SEARCH_COLLECTION)
+    snapshot = collection.document(search_doc_id(kind, text[0])).get()
+    doc = snapshot.to_dict() if snapshot.exists else {}
+    if doc.get('split') and len(text) > 1:
+        snapshot = collection.document(search_doc_id(kind, text[:2])).get()
+        doc = snapshot.to_dict() if snapshot.exists else {}
+
+    term = text[:MAX_PREFIX_LENGTH]
+    names = doc.get('stocks', {})
+    results = []
+    for stock_code in doc.get('terms', {}).get(term, []):
+        name = names.get(stock_code, stock_code)
+        # Beyond the indexed prefix length, finish the match on the full name
+        if len(text) > MAX_PREFIX_LENGTH and not any(
+            text in word or chosung(word).startswith(text) for word in words(name)
+        ):
+            continue
+        results.append({'code': stock_code, 'name': name})
+    return results[:limit]
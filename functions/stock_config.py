@@ -0,0 +1,180 @@
+"""
+Target stock universe resolution.
+Resolves codes from env, metadata/config or the stocks collection, validates
+them, caches the result across warm invocations and notifies listeners when
+the universe changes.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# KRX short codes: 6 digits, or 6 alphanumerics for newer listings (e.g. 0091C0)
+CODE_PATTERN = re.compile(r"^[0-9A-Z]{6}$")
+
+# Legacy key names accepted in metadata/config, in priority order
+CONFIG_CODE_KEYS = ("stockCodes", "targetStockCodes", "stocks")
+
+SOURCE_CONFIG = "config"
+SOURCE_STOCKS = "stocks"
+
+DEFAULT_TTL_SECONDS = 300
+
+
+def parse_codes(raw) -> List[str]:
+    """Normalize a list or comma-separated string into valid, de-duplicated codes."""
+    if isinstance(raw, str):
+        candidates = raw.split(",")
+    elif isinstance(raw, (list, tuple, set)):
+        candidates = list(raw)
+    else:
+        return []
+
+    codes = []
+    seen = set()
+    for candidate in candidates:
+        code = str(candidate).strip().upper()
+        if not code:
+            continue
+        if not CODE_PATTERN.match(code):
+            logger.warning("Ignoring invalid stock code %r.", candidate)
+            continue
+        if code in seen:
+            continue
+        seen.add(code)
+        codes.append(code)
+    return codes
+
+
+def shard_codes(codes: List[str], shard_count: int, shard_index: int) -> List[str]:
+    """
+    Stable slice `shard_index` of `shard_count` for the given codes.
+    Assignment hashes the code, so adding a code never reshuffles the others.
+    """
+    if shard_count <= 1:
+        return list(codes)
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"shard_index must be in [0, {shard_count}), got {shard_index}")
+    return [code for code in codes if zlib.crc32(code.encode()) % shard_count == shard_index]
+
+
+def parse_shard(value: Optional[str]):
+    """Parse an "i/N" shard spec into (index, count); None/empty means no sharding."""
+    if not value:
+        return 0, 1
+    try:
+        index, count = (int(part) for part in str(value).split("/", 1))
+    except ValueError as exc:
+        raise ValueError(f"Invalid shard spec {value!r}; expected 'index/count'.") from exc
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard spec {value!r}.")
+    return index, count
+
+
+class StockUniverse:
+    """
+    Cached resolver for the scheduler's target codes.
+
+    Resolution order:
+      1. TARGET_STOCK_CODES / STOCK_CODES env var
+      2. metadata/config (stockCodes, or legacy targetStockCodes / stocks)
+      3. stocks collection document IDs (the migrated stock_info universe),
+         when STOCK_UNIVERSE_SOURCE=stocks or metadata/config.source == "stocks"
+    """
+
+    def __init__(self, db, ttl_seconds: Optional[float] = None):
+        self.db = db
+        if ttl_seconds is None:
+            ttl_seconds = float(os.environ.get("STOCK_CODES_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._codes: Optional[List[str]] = None
+        self._loaded_at = 0.0
+        self._listeners: List[Callable[[List[str], List[str]], None]] = []
+
+    def subscribe(self, callback: Callable[[List[str], List[str]], None]):
+        """Register callback(old_codes, new_codes), fired when the universe changes."""
+        self._listeners.append(callback)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def get(self, force_refresh=False) -> List[str]:
+        """
+        Cached codes, re-resolved after the TTL. A failed or empty resolution
+        is not cached: the previous universe is kept (or [] before the first
+        success) and the next call tries again.
+        """
+        with self._lock:
+            fresh = self._codes is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+            if fresh and not force_refresh:
+                return list(self._codes)
+
+            codes = self._resolve()
+            if not codes:
+                if self._codes:
+                    logger.warning("Stock universe resolution failed or came back empty; "
+                                   "keeping the previous %d codes.", len(self._codes))
+                    return list(self._codes)
+                return []
+            previous = self._codes
+            self._codes = codes
+            self._loaded_at = time.monotonic()
+
+        if previous is not None and previous != codes:
+            logger.info("Stock universe changed: %d -> %d codes.", len(previous), len(codes))
+            for callback in self._listeners:
+                try:
+                    callback(previous, codes)
+                except Exception as exc:  # pylint: disable=broad-except
+                    logger.warning("Stock universe listener failed: %s", exc)
+        return list(codes)
+
+    def _resolve(self) -> Optional[List[str]]:
+        """Codes from the first configured source; None when a Firestore read failed."""
+        env_value = os.environ.get("TARGET_STOCK_CODES") or os.environ.get("STOCK_CODES")
+        if env_value:
+            codes = parse_codes(env_value)
+            if codes:
+                logger.info("Loaded %d stock codes from environment.", len(codes))
+                return codes
+
+        source = os.environ.get("STOCK_UNIVERSE_SOURCE", SOURCE_CONFIG)
+        try:
+            config_doc = self.db.collection('metadata').document('config').get()
+            data = (config_doc.to_dict() or {}) if config_doc.exists else {}
+            source = data.get('source') or source
+
+            if source != SOURCE_STOCKS:
+                raw_codes = next((data[key] for key in CONFIG_CODE_KEYS if data.get(key)), None)
+                codes = parse_codes(raw_codes)
+                if codes:
+                    logger.info("Loaded %d stock codes from Firestore metadata/config.", len(codes))
+                    return codes
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Failed to load stock codes from Firestore: %s", exc)
+            return None
+
+        if source == SOURCE_STOCKS:
+            return self._list_stock_documents()
+
+        logger.error("No stock codes configured. Set TARGET_STOCK_CODES env var or metadata/config.stockCodes.")
+        return []
+
+    def _list_stock_documents(self) -> Optional[List[str]]:
+        """Key-only listing of stocks/{code}; no document fields are downloaded."""
+        try:
+            refs = self.db.collection('stocks').list_documents(page_size=1000)
+            codes = parse_codes(sorted(ref.id for ref in refs))
+            logger.info("Loaded %d stock codes from the stocks collection.", len(codes))
+            return codes
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Failed to list the stocks collection: %s", exc)
+            return None
@@ -0,0 +1,140 @@
+"""
+Pluggable task queues for fanning collector shards out to workers.
+LocalTaskQueue runs shards in-process (tests, emulator, small universes);
+CloudTasksQueue enqueues each shard for the fetch_stock_shard worker endpoint.
+"""
+
+import abc
+import base64
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+METADATA_TOKEN_URL = (
+    "http://metadata.google.internal/computeMetadata/v1/"
+    "instance/service-accounts/default/token"
+)
+CLOUD_TASKS_API = "https://cloudtasks.googleapis.com/v2"
+
+
+class TaskQueue(abc.ABC):
+    """
+    Dispatches payloads to workers and returns one result dict per payload:
+    the shard's stats, {"error": ...}, or {"queued": True} when the shard
+    runs later elsewhere.
+    """
+
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max(1, max_concurrency)
+
+    def dispatch(self, payloads: List[Dict]) -> List[Dict]:
+        if not payloads:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(payloads))) as pool:
+            return list(pool.map(self._run_safely, payloads))
+
+    def _run_safely(self, payload: Dict) -> Dict:
+        try:
+            return self.run(payload)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Shard %s failed: %s", payload.get("shard"), exc)
+            return {"shard": payload.get("shard"), "error": str(exc)}
+
+    @abc.abstractmethod
+    def run(self, payload: Dict) -> Dict:
+        """Run or enqueue one payload and return its result dict."""
+
+
+class LocalTaskQueue(TaskQueue):
+    """In-process stand-in: calls the worker handler directly."""
+
+    def __init__(self, handler: Callable[[Dict], Dict], max_concurrency: int = 1):
+        super().__init__(max_concurrency)
+        self.handler = handler
+
+    def run(self, payload: Dict) -> Dict:
+        return self.handler(payload)
+
+
+class CloudTasksQueue(TaskQueue):
+    """
+    Enqueues each payload as a Cloud Tasks HTTP task aimed at the worker URL
+    and returns without waiting for the shard to run, so the coordinator is
+    not bound by its own timeout. Cloud Tasks attaches an OIDC token for
+    `service_account` and retries shards that fail; workers record their
+    own results. Uses the Cloud Tasks REST API with the function's default
+    credentials from the metadata server.
+    """
+
+    def __init__(self, queue_path: str, worker_url: str, service_account: str,
+                 max_concurrency: int = 8, dispatch_deadline: int = 600):
+        super().__init__(max_concurrency)
+        self.queue_path = queue_path
+        self.worker_url = worker_url
+        self.service_account = service_account
+        self.dispatch_deadline = dispatch_deadline
+
+    def _access_token(self) -> str:
+        response = requests.get(
+            METADATA_TOKEN_URL,
+            headers={"Metadata-Flavor": "Google"},
+            timeout=5,
+        )
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+    def run(self, payload: Dict) -> Dict:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        task = {
+            "httpRequest": {
+                "url": self.worker_url,
+                "httpMethod": "POST",
+                "headers": {"Content-Type": "application/json"},
+                "body": base64.b64encode(body).decode("ascii"),
+                "oidcToken": {"serviceAccountEmail": self.service_account, "audience": self.worker_url},
+            },
+            "dispatchDeadline": f"{self.dispatch_deadline}s",
+        }
+        response = requests.post(
+            f"{CLOUD_TASKS_API}/{self.queue_path}/tasks",
+            json={"task": task},
+            headers={"Authorization": f"Bearer {self._access_token()}"},
+            timeout=30,
+        )
+        response.raise_for_status()
+        return {"shard": payload.get("shard"), "queued": True, "task": response.json().get("name")}
+
+
+def create_task_queue(local_handler: Callable[[Dict], Dict]) -> TaskQueue:
+    """
+    Select a queue from SHARD_QUEUE_BACKEND ("local" or "cloudtasks").
+    The cloudtasks backend needs SHARD_TASKS_QUEUE
+    (projects/{project}/locations/{location}/queues/{queue}), SHARD_WORKER_URL
+    pointing at fetch_stock_shard, and SHARD_TASKS_SERVICE_ACCOUNT, the
+    account whose OIDC token the worker accepts.
+    """
+    backend = os.environ.get("SHARD_QUEUE_BACKEND", "local").lower()
+    concurrency = int(os.environ.get("SHARD_MAX_CONCURRENCY", "8"))
+
+    if backend == "cloudtasks":
+        settings = {name: os.environ.get(name) for name in
+                    ("SHARD_TASKS_QUEUE", "SHARD_WORKER_URL", "SHARD_TASKS_SERVICE_ACCOUNT")}
+        missing = [name for name, value in settings.items() if not value]
+        if missing:
+            raise ValueError(f"{', '.join(missing)} must be set when SHARD_QUEUE_BACKEND=cloudtasks.")
+        return CloudTasksQueue(
+            settings["SHARD_TASKS_QUEUE"],
+            settings["SHARD_WORKER_URL"],
+            settings["SHARD_TASKS_SERVICE_ACCOUNT"],
+            max_concurrency=concurrency,
+            dispatch_deadline=int(os.environ.get("SHARD_TASK_DEADLINE", "600")),
+        )
+    if backend == "local":
+        return LocalTaskQueue(local_handler, max_concurrency=concurrency)
+    raise ValueError(f"Unknown SHARD_QUEUE_BACKEND {backend!r}.")
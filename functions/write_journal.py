@@ -0,0 +1,252 @@
+"""
+Write-ahead journal for daily bars that were fetched but not stored.
+
+When the Firestore write in collect_stock_codes fails, the bar goes into a
+journal instead of being dropped; the next collection run (or the
+replay_write_journal endpoint) writes it back without calling KIS again.
+Entries are keyed "{code}_{YYYYMMDD}", so journaling the same bar twice
+keeps one entry, and replay is a merge of that single day, so replaying
+an entry that did land after all is harmless.
+
+Backends, selected by WRITE_JOURNAL_BACKEND:
+  firestore (default)  one document, metadata/writeJournal, entries map;
+                       falls back to the file when Firestore rejects the append
+  file                 JSON lines at WRITE_JOURNAL_PATH (local runs, emulator;
+                       /tmp on Cloud Functions does not outlive the instance)
+"""
+
+import abc
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+
+from ohlcv_codec import ENCODING_PACKED, day_update, write_day
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DOCUMENT = ('metadata', 'writeJournal')
+DEFAULT_JOURNAL_PATH = "/tmp/stock_write_journal.jsonl"
+
+
+def entry_key(stock_code: str, date_str: str) -> str:
+    return f"{stock_code}_{date_str}"
+
+
+def journal_entry(stock_code: str, date_str: str, values: Dict[str, int], error: str = "") -> Dict:
+    return {
+        'code': stock_code,
+        'date': date_str,
+        'values': values,
+        'error': error[:500],
+        'journaledAt': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+class WriteJournal(abc.ABC):
+    """Stores pending entries by key; subclasses provide the storage."""
+
+    @abc.abstractmethod
+    def append(self, entry: Dict):
+        """Store one entry, replacing any entry with the same key."""
+
+    @abc.abstractmethod
+    def entries(self) -> Dict[str, Dict]:
+        """Every pending entry by key."""
+
+    @abc.abstractmethod
+    def remove(self, keys: Iterable[str]):
+        """Drop entries that were written back."""
+
+
+class FileWriteJournal(WriteJournal):
+    """JSON lines, fsynced per append; remove() rewrites the file atomically."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _write_line(self, record: Dict):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, entry: Dict):
+        with self._lock:
+            self._write_line(entry)
+
+    def _read(self) -> Dict[str, Dict]:
+        entries = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash mid-append leaves at most one torn last line
+                        logger.warning("Skipping unreadable journal line in %s", self.path)
+                        continue
+                    entries[entry_key(record['code'], record['date'])] = record
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def entries(self) -> Dict[str, Dict]:
+        with self._lock:
+            return self._read()
+
+    def remove(self, keys: Iterable[str]):
+        keys = set(keys)
+        if not keys:
+            return
+        with self._lock:
+            remaining = {key: entry for key, entry in self._read().items() if key not in keys}
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for entry in remaining.values():
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+
+
+class FirestoreWriteJournal(WriteJournal):
+    """Entries map in one document; each append and removal touches only its own keys."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _ref(self):
+        collection, document = JOURNAL_DOCUMENT
+        return self.db.collection(collection).document(document)
+
+    def append(self, entry: Dict):
+        key = entry_key(entry['code'], entry['date'])
+        self._ref().set({'entries': {key: entry}}, merge=True)
+
+    def entries(self) -> Dict[str, Dict]:
+        snapshot = self._ref().get()
+        return dict((snapshot.to_dict() or {}).get('entries') or {}) if snapshot.exists else {}
+
+    def remove(self, keys: Iterable[str]):
+        from firebase_admin import firestore
+
+        removals = {key: firestore.DELETE_FIELD for key in keys}
+        if removals:
+            self._ref().set({'entries': removals}, merge=True)
+
+
+class FallbackWriteJournal(WriteJournal):
+    """
+    Appends to `primary` and, when that fails, to `fallback`. The Firestore
+    journal shares the failure domain of the write it records, so when
+    Firestore is down or throttled the entry goes to the instance's local
+    file instead; if that fails too the full entry is logged so it can be
+    recovered by hand. Reads and removals cover both.
+    """
+
+    def __init__(self, primary: WriteJournal, fallback: WriteJournal):
+        self.primary = primary
+        self.fallback = fallback
+
+    def append(self, entry: Dict):
+        try:
+            self.primary.append(entry)
+            return
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Journal append failed (%s); using fallback journal.", exc)
+        try:
+            self.fallback.append(entry)
+        except Exception:
+            logger.critical("UNJOURNALED BAR %s", json.dumps(entry, ensure_ascii=False, separators=(',', ':')))
+            raise
+
+    def entries(self) -> Dict[str, Dict]:
+        entries = self.fallback.entries()
+        try:
+            entries.update(self.primary.entries())
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Failed to read the primary journal: %s", exc)
+        return entries
+
+    def remove(self, keys: Iterable[str]):
+        keys = list(keys)
+        self.fallback.remove(keys)
+        self.primary.remove(keys)
+
+
+def create_write_journal(db) -> WriteJournal:
+    """
+    Select a journal from WRITE_JOURNAL_BACKEND ("firestore" or "file"). The
+    firestore journal falls back to the file at WRITE_JOURNAL_PATH.
+    """
+    backend = os.environ.get("WRITE_JOURNAL_BACKEND", "firestore").lower()
+    if backend == "firestore":
+        return FallbackWriteJournal(
+            FirestoreWriteJournal(db),
+            FileWriteJournal(os.environ.get("WRITE_JOURNAL_PATH", DEFAULT_JOURNAL_PATH)),
+        )
+    if backend == "file":
+        return FileWriteJournal(os.environ.get("WRITE_JOURNAL_PATH", DEFAULT_JOURNAL_PATH))
+    raise ValueError(f"Unknown WRITE_JOURNAL_BACKEND {backend!r}.")
+
+
+def _monthly_ref(db, entry):
+    date_str = entry['date']
+    return (db.collection('stocks').document(entry['code'])
+            .collection('monthly').document(f"{date_str[:4]}-{date_str[4:6]}"))
+
+
+def replay_journal(db, journal: WriteJournal, encoding, batch_size=400) -> Dict:
+    """
+    Write every journaled bar back as a merge of its single day, in batches.
+    Entries are removed only after their batch commits. Returns
+    {'replayed': {code: latest replayed date}, 'replayed_count', 'failed_count'}.
+    """
+    pending: List[Dict] = sorted(journal.entries().values(), key=lambda entry: (entry['code'], entry['date']))
+    replayed: Dict[str, str] = {}
+    replayed_count = 0
+    failed_count = 0
+
+    def mark_done(done):
+        nonlocal replayed_count
+        journal.remove(entry_key(entry['code'], entry['date']) for entry in done)
+        for entry in done:
+            replayed[entry['code']] = max(replayed.get(entry['code'], ""), entry['date'])
+        replayed_count += len(done)
+
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        if encoding == ENCODING_PACKED:
+            # Packed months need a read-modify-write per day
+            done = []
+            for entry in chunk:
+                try:
+                    write_day(db, _monthly_ref(db, entry), entry['date'][6:], entry['values'], encoding)
+                    done.append(entry)
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.error("Journal replay failed for %s on %s: %s", entry['code'], entry['date'], e)
+                    failed_count += 1
+            mark_done(done)
+            continue
+
+        batch = db.batch()
+        for entry in chunk:
+            batch.set(_monthly_ref(db, entry), day_update(entry['date'][6:], entry['values'], encoding), merge=True)
+        try:
+            batch.commit()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Journal replay batch of %d entries failed: %s", len(chunk), e)
+            failed_count += len(chunk)
+            continue
+        mark_done(chunk)
+
+    if pending:
+        logger.info("Journal replay: %d written, %d still pending.", replayed_count, failed_count)
+    return {'replayed': replayed, 'replayed_count': replayed_count, 'failed_count': failed_count}
@@ -0,0 +1,138 @@
+"""
+Shared MariaDB access for the migration tools.
+
+A small thread-safe connection pool: connections are opened lazily up to
+`size`, checked out per task and returned on exit, so setup cost is paid
+once per connection and concurrent readers never share a socket. The SQL
+used by the tools lives here as named statements.
+
+pymysql has no server-side prepared statements; statements are reused as
+parameterized constants and bound client-side by the driver.
+"""
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import pymysql
+
+# --- Statements ---
+
+SQL_STOCK_INFO = "SELECT Code, Name, Period FROM stock_info ORDER BY Code"
+SQL_STOCK_INFO_BY_CODES = "SELECT Code, Name, Period FROM stock_info WHERE Code IN ({placeholders}) ORDER BY Code"
+SQL_ROW_COUNTS = "SELECT Code, COUNT(*) AS row_count FROM stock GROUP BY Code"
+SQL_DIVIDENDS_BY_CODE = "SELECT Date, Price FROM dividend WHERE Code = %s ORDER BY Date"
+SQL_STOCK_DATA_BY_CODE = """SELECT Date, Open, High, Low, Close, Volume
+                            FROM stock WHERE Code = %s ORDER BY Date"""
+SQL_HORIZONTAL_LINES = """SELECT id, color, created_at, line_style, line_width,
+                                 memo, price, stock_code, updated_at
+                          FROM horizontal ORDER BY id"""
+SQL_DATA_TIME = "SELECT Code, Time FROM data_time"
+SQL_SHOW_TABLES = "SHOW TABLES"
+
+
+def connect_kwargs_from_env():
+    """pymysql.connect() arguments from the DB_* environment variables"""
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 3306)),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD'),
+        'database': os.getenv('DB_NAME'),
+        'cursorclass': pymysql.cursors.DictCursor,
+    }
+
+
+class ConnectionPool:
+    """Lazily filled pool of at most `size` pymysql connections"""
+
+    def __init__(self, size=4, timeout=30.0, **connect_kwargs):
+        self.size = size
+        self.timeout = timeout
+        self.connect_kwargs = connect_kwargs
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._all = set()
+        self.connections_opened = 0
+
+    @classmethod
+    def from_env(cls, size=None):
+        return cls(
+            size=size or int(os.getenv('DB_POOL_SIZE', 4)),
+            timeout=float(os.getenv('DB_POOL_TIMEOUT', 30)),
+            **connect_kwargs_from_env(),
+        )
+
+    def _open(self):
+        connection = pymysql.connect(**self.connect_kwargs)
+        with self._lock:
+            self._all.add(connection)
+            self.connections_opened += 1
+        return connection
+
+    def _discard(self, connection):
+        with self._lock:
+            self._all.discard(connection)
+        try:
+            connection.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+    @contextmanager
+    def checkout(self):
+        """Borrow a connection; it goes back to the pool unless it broke"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No MariaDB connection free after {self.timeout}s (pool size {self.size})")
+        connection = None
+        try:
+            try:
+                connection = self._idle.get_nowait()
+                connection.ping(reconnect=True)
+            except queue.Empty:
+                connection = self._open()
+            yield connection
+        except pymysql.err.OperationalError:
+            if connection is not None:
+                self._discard(connection)
+                connection = None
+            raise
+        finally:
+            if connection is not None:
+                self._idle.put(connection)
+            self._slots.release()
+
+    def warm(self):
+        """Open one connection now so configuration errors surface early"""
+        with self.checkout():
+            pass
+
+    def fetch_all(self, sql, params=None):
+        with self.checkout() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+    def stream(self, sql, params=None):
+        """
+        Yield rows from a server-side cursor. The connection stays checked
+        out until the generator is exhausted or closed.
+        """
+        with self.checkout() as connection:
+            with connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+                cursor.execute(sql, params)
+                for row in cursor:
+                    yield row
+
+    def close(self):
+        with self._lock:
+            connections = list(self._all)
+            self._all.clear()
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+        while not self._idle.empty():
+            self._idle.get_nowait()
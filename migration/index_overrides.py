@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Firestore Index Exemption Generator
+Derives single-field index exemptions (fieldOverrides) from the document
+shapes the migrator and the Cloud Functions actually write.
+
+Map fields whose keys are data (days, years, stock codes, dates) grow with
+history and are never queried by sub-field, so indexing every sub-field only
+slows writes and adds storage. Large blobs cannot be indexed usefully either.
+
+Usage:
+    python index_overrides.py            # print the generated overrides
+    python index_overrides.py --write    # update ../firestore.indexes.json
+    python index_overrides.py --check    # exit 1 if the file is out of date
+    python index_overrides.py --benchmark 200 --project my-staging   # with vs without exemptions
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+from migrate import FirestoreMigration  # also puts ../functions on sys.path
+from dividend_calendar import build_calendar_docs
+from history_reader import to_columns
+from line_index import build_line_index_docs
+from screener import compute_features
+from search_index import build_search_index
+from ohlcv_codec import ENCODINGS, encode_month
+from write_journal import journal_entry
+
+INDEXES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'firestore.indexes.json')
+
+# Keys that look like data rather than schema: days ("02"), years ("2025"),
+# month-days ("01-24"), stock codes ("475080", "0091C0"), YYYYMMDD dates
+DATA_KEY_PATTERN = re.compile(r"^[0-9][0-9A-Z_-]*$")
+
+# Maps keyed by document IDs, which the key pattern cannot recognise
+ID_KEYED_FIELDS = {('lineIndex', 'lines'), ('searchIndex', 'terms')}
+
+# Throwaway collections for --benchmark: the same monthly documents go to both,
+# but only BENCH_EXEMPT gets the monthly exemptions, applied by the benchmark
+# itself on the project it runs against (never part of firestore.indexes.json)
+BENCH_EXEMPT = 'indexBenchExempt'
+BENCH_INDEXED = 'indexBenchIndexed'
+FIRESTORE_ADMIN_URL = "https://firestore.googleapis.com/v1"
+
+
+def _sample_rows(year, month):
+    """stock-table rows for every weekday of a month, as pymysql returns them"""
+    rows = []
+    day = date(year, month, 1)
+    while day.month == month:
+        if day.weekday() < 5:
+            rows.append({'Date': day, 'Open': 9895, 'High': 9920, 'Low': 9800,
+                         'Close': 9860, 'Volume': 402903})
+        day += timedelta(days=1)
+    return rows
+
+
+def document_shapes():
+    """
+    (collectionGroup, sample document) pairs built with the same transforms
+    migrate.py uses, plus the fields functions/main.py merges into
+    metadata/system after each run and the write journal document.
+    """
+    migration = FirestoreMigration()
+    dividends = migration.transform_dividends_to_map([
+        {'Date': date(2024, 12, 27), 'Price': 120},
+        {'Date': date(2025, 1, 24), 'Price': 124},
+    ])
+    monthly = migration.transform_stock_data_to_monthly(_sample_rows(2025, 1))['2025-01']
+
+    shapes = [
+        ('stocks', {
+            'name': 'KODEX 테슬라커버드콜채권혼합액티브',
+            'period': '월말',
+            'dividends': dividends,
+            'updated_at': None,
+        }),
+        ('metadata', {
+            'lastUpdate': None,
+            'updateStatus': 'success',
+            'stocks': {'475080': None, '475720': None},
+            'latestDates': {'475080': '20251106', '475720': '20251106'},
+            'lastRunStats': {'success_count': 7, 'error_count': 0},
+            'stats': {'totalStocks': 7},
+            'lastJournalReplay': None,
+            'lastShardUpdate': None,
+            'shardRuns': {'0': {'success_count': 250, 'error_count': 0, 'finishedAt': None}},
+        }),
+        # metadata/writeJournal (functions/write_journal.py)
+        ('metadata', {
+            'entries': {'475080_20251106': journal_entry('475080', '20251106', monthly['03'], 'DEADLINE_EXCEEDED')},
+        }),
+    ]
+    for encoding in ENCODINGS:
+        shapes.append(('monthly', encode_month(monthly, encoding)))
+
+    stock = {'name': 'KODEX 테슬라커버드콜채권혼합액티브', 'period': '월말', 'dividends': dividends}
+    shapes.append(('dividendCalendar', build_calendar_docs({'475080': stock})['2025-01']))
+
+    shapes.append(('searchIndex', build_search_index({'475080': stock['name']})['name_k']))
+
+    history = to_columns('475080', {'2025-01': monthly})
+    shapes.append(('screener', {'features': {'475080': compute_features(stock, history)}}))
+
+    line = {'stockCode': '475080', 'price': 10000.0, 'color': '#FF0000', 'style': 'solid', 'width': 1, 'memo': ''}
+    shapes.append(('lineIndex', build_line_index_docs([('line_17', line)])['475080']))
+    return shapes
+
+
+def _looks_like_data_keys(mapping):
+    return bool(mapping) and all(DATA_KEY_PATTERN.match(str(key)) for key in mapping)
+
+
+def _exempt_paths(collection_group, document, prefix=""):
+    """Yield field paths under `document` that should not be indexed."""
+    for key, value in document.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if (collection_group, path) in ID_KEYED_FIELDS or _looks_like_data_keys(value):
+                yield path
+            else:
+                yield from _exempt_paths(collection_group, value, prefix=f"{path}.")
+        elif isinstance(value, (bytes, bytearray)):
+            # Packed blobs are never filtered on
+            yield path
+
+
+def generate_field_overrides():
+    overrides = {}
+    for collection_group, document in document_shapes():
+        for path in _exempt_paths(collection_group, document):
+            overrides[(collection_group, path)] = {
+                'collectionGroup': collection_group,
+                'fieldPath': path,
+                'indexes': [],
+            }
+    return [overrides[key] for key in sorted(overrides)]
+
+
+def merged_index_config(existing):
+    """
+    Keep composite indexes and hand-written overrides; replace generated ones
+    and drop any for the benchmark collections.
+    """
+    generated = generate_field_overrides()
+    generated_keys = {(o['collectionGroup'], o['fieldPath']) for o in generated}
+    kept = [
+        override for override in existing.get('fieldOverrides', [])
+        if (override.get('collectionGroup'), override.get('fieldPath')) not in generated_keys
+        and override.get('collectionGroup') not in (BENCH_EXEMPT, BENCH_INDEXED)
+    ]
+    return {
+        'indexes': existing.get('indexes', []),
+        'fieldOverrides': kept + generated,
+    }
+
+
+def benchmark_overrides():
+    """The generated `monthly` exemptions, retargeted at BENCH_EXEMPT."""
+    return [
+        {**override, 'collectionGroup': BENCH_EXEMPT}
+        for override in generate_field_overrides() if override['collectionGroup'] == 'monthly'
+    ]
+
+
+def apply_field_overrides(project_id, overrides, poll_seconds=5, timeout=600):
+    """
+    Apply single-field exemptions directly through the Firestore Admin API
+    and wait for them to take effect. Used for the benchmark collection on a
+    staging project, so it never has to go through firestore.indexes.json.
+    """
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+
+    credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/datastore"])
+    session = AuthorizedSession(credentials)
+    operations = []
+    for override in overrides:
+        name = (f"projects/{project_id}/databases/(default)/collectionGroups/"
+                f"{override['collectionGroup']}/fields/{override['fieldPath']}")
+        response = session.patch(f"{FIRESTORE_ADMIN_URL}/{name}", params={'updateMask': 'indexConfig'},
+                                 json={'indexConfig': {'indexes': override['indexes']}})
+        response.raise_for_status()
+        operations.append(response.json()['name'])
+
+    deadline = time.monotonic() + timeout
+    for operation in operations:
+        while True:
+            response = session.get(f"{FIRESTORE_ADMIN_URL}/{operation}")
+            response.raise_for_status()
+            status = response.json()
+            if status.get('done'):
+                if 'error' in status:
+                    raise RuntimeError(f"Index exemption failed: {status['error']}")
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Index exemption still pending after {timeout}s: {operation}")
+            time.sleep(poll_seconds)
+
+
+def _delete_documents(db, refs, batch_size=400):
+    for start in range(0, len(refs), batch_size):
+        batch = db.batch()
+        for ref in refs[start:start + batch_size]:
+            batch.delete(ref)
+        batch.commit()
+
+
+def benchmark_writes(count, project=None):
+    """
+    Write `count` monthly documents to each of BENCH_EXEMPT and BENCH_INDEXED
+    (alternating, so both see the same conditions), report both write rates,
+    and delete everything written. On a real project the `monthly`
+    exemptions are first applied to BENCH_EXEMPT there; the emulator does not
+    model index fan-out, so there both rates are a baseline.
+    """
+    import firebase_admin
+    from firebase_admin import firestore
+
+    if not os.getenv('FIRESTORE_EMULATOR_HOST') and not project:
+        print("⚠️  Set FIRESTORE_EMULATOR_HOST or pass --project for a staging project.")
+        return None
+
+    project_id = project or os.getenv('GCLOUD_PROJECT', 'demo-stockchart')
+    if not os.getenv('FIRESTORE_EMULATOR_HOST'):
+        overrides = benchmark_overrides()
+        print(f"  ⏳ Exempting {len(overrides)} fields on {BENCH_EXEMPT} in {project_id}")
+        apply_field_overrides(project_id, overrides)
+    firebase_admin.initialize_app(options={'projectId': project_id})
+    db = firestore.client()
+    monthly = FirestoreMigration().transform_stock_data_to_monthly(_sample_rows(2025, 1))['2025-01']
+    payload = encode_month(monthly)
+
+    run_id = uuid.uuid4().hex[:8]
+    elapsed = {BENCH_EXEMPT: 0.0, BENCH_INDEXED: 0.0}
+    written = []
+    try:
+        for idx in range(count):
+            order = (BENCH_EXEMPT, BENCH_INDEXED) if idx % 2 == 0 else (BENCH_INDEXED, BENCH_EXEMPT)
+            for collection in order:
+                ref = db.collection(collection).document(f"{run_id}-{idx:05d}")
+                started = time.perf_counter()
+                ref.set(payload)
+                elapsed[collection] += time.perf_counter() - started
+                written.append(ref)
+    finally:
+        _delete_documents(db, written)
+        print(f"  🧹 Deleted {len(written)} benchmark documents")
+
+    for label, collection in (("with exemptions", BENCH_EXEMPT), ("without exemptions", BENCH_INDEXED)):
+        seconds = elapsed[collection]
+        print(f"  ✓ {label:<19} {count} writes in {seconds:.2f}s ({count / seconds:.1f} docs/s)")
+    if os.getenv('FIRESTORE_EMULATOR_HOST'):
+        print("  ℹ️  The emulator does not index; compare on a staging project after deploying the indexes.")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Firestore single-field index exemptions.")
+    parser.add_argument('--write', action='store_true', help='Update firestore.indexes.json in place.')
+    parser.add_argument('--check', action='store_true', help='Exit 1 if firestore.indexes.json is stale.')
+    parser.add_argument('--benchmark', type=int, metavar='N',
+                        help='Time N monthly writes with and without exemptions, then delete them.')
+    parser.add_argument('--project', help='Staging project ID for --benchmark outside the emulator.')
+    args = parser.parse_args()
+
+    with open(INDEXES_PATH, encoding='utf-8') as handle:
+        existing = json.load(handle)
+    config = merged_index_config(existing)
+
+    if args.benchmark:
+        benchmark_writes(args.benchmark, project=args.project)
+        return 0
+
+    rendered = json.dumps(config, indent=2, ensure_ascii=False) + "\n"
+    if args.check:
+        if config != existing:
+            print("❌ firestore.indexes.json is out of date. Run: python index_overrides.py --write")
+            return 1
+        print("✅ firestore.indexes.json is up to date")
+        return 0
+
+    if args.write:
+        with open(INDEXES_PATH, 'w', encoding='utf-8') as handle:
+            handle.write(rendered)
+        print(f"✅ Wrote {len(config['fieldOverrides'])} field overrides to {os.path.abspath(INDEXES_PATH)}")
+    else:
+        print(rendered, end="")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,13 +7,18 @@ Copy this file to: migration/migrate.py
 """
 
 import argparse
+import csv
+import json
 import logging
+import multiprocessing
 import os
+import sys
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
 import firebase_admin
-import pymysql
 from dotenv import load_dotenv
 from firebase_admin import credentials, firestore
 
@@ -24,6 +29,26 @@ logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 ENV_PATH = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(dotenv_path=ENV_PATH, override=True)
 
+from db import (  # noqa: E402
+    SQL_DATA_TIME,
+    SQL_DIVIDENDS_BY_CODE,
+    SQL_HORIZONTAL_LINES,
+    SQL_ROW_COUNTS,
+    SQL_STOCK_DATA_BY_CODE,
+    SQL_STOCK_INFO,
+    SQL_STOCK_INFO_BY_CODES,
+    ConnectionPool,
+)
+
+# Document-shape helpers are shared with the Cloud Functions source
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions'))
+from dividend_calendar import build_calendar_docs, write_calendar_docs  # noqa: E402
+from history_reader import StockHistoryReader, to_columns  # noqa: E402
+from line_index import build_line_index_docs, line_index_ref  # noqa: E402
+from ohlcv_codec import ENCODED_FIELDS, ENCODING_MAP, ENCODINGS, decode_month, encode_month  # noqa: E402
+from planner import MigrationPlan, record_throughput  # noqa: E402
+from search_index import build_search_index, rebuild_search_index  # noqa: E402
+
 # Line style mapping
 LINE_STYLE_MAP = {
     0: "solid",
@@ -38,6 +63,18 @@ PERIOD_MAP = {
     'Non': '비해당'
 }
 
+# Keep at most this many distinct error messages (workers can produce thousands)
+MAX_RECORDED_ERRORS = 200
+
+COUNTER_FIELDS = (
+    'stocks_migrated',
+    'monthly_docs_created',
+    'dividends_migrated',
+    'lines_migrated',
+    'total_daily_records',
+    'monthly_docs_reencoded',
+)
+
 class MigrationStats:
     """Track migration statistics"""
     def __init__(self):
@@ -46,7 +83,34 @@ class MigrationStats:
         self.dividends_migrated = 0
         self.lines_migrated = 0
         self.total_daily_records = 0
+        self.monthly_docs_reencoded = 0
         self.errors = []
+        self.errors_dropped = 0
+
+    def add_error(self, message):
+        """Record an error message, de-duplicated and capped at MAX_RECORDED_ERRORS"""
+        if message in self.errors:
+            return
+        if len(self.errors) >= MAX_RECORDED_ERRORS:
+            self.errors_dropped += 1
+            return
+        self.errors.append(message)
+
+    def merge(self, other):
+        """Fold another MigrationStats (or its to_dict()) into this one"""
+        data = other.to_dict() if isinstance(other, MigrationStats) else other
+        for field in COUNTER_FIELDS:
+            setattr(self, field, getattr(self, field) + data.get(field, 0))
+        for message in data.get('errors', []):
+            self.add_error(message)
+        self.errors_dropped += data.get('errors_dropped', 0)
+
+    def to_dict(self):
+        """Plain-dict form, picklable across worker processes"""
+        data = {field: getattr(self, field) for field in COUNTER_FIELDS}
+        data['errors'] = list(self.errors)
+        data['errors_dropped'] = self.errors_dropped
+        return data
 
     def print_summary(self):
         print("\n" + "="*60)
@@ -57,10 +121,14 @@ class MigrationStats:
         print(f"Total daily records: {self.total_daily_records}")
         print(f"Dividends migrated: {self.dividends_migrated}")
         print(f"Horizontal lines migrated: {self.lines_migrated}")
+        if self.monthly_docs_reencoded:
+            print(f"Monthly documents re-encoded: {self.monthly_docs_reencoded}")
         if self.errors:
-            print(f"\n⚠️  Errors: {len(self.errors)}")
+            print(f"\n⚠️  Errors: {len(self.errors) + self.errors_dropped}")
             for error in self.errors[:5]:  # Show first 5 errors
                 print(f"  - {error}")
+            if self.errors_dropped:
+                print(f"  ({self.errors_dropped} further errors not recorded)")
         else:
             print("\n✅ No errors!")
         print("="*60)
@@ -69,13 +137,19 @@ class MigrationStats:
 class FirestoreMigration:
     """Handle migration from SQL to Firestore"""
 
-    def __init__(self, limit=None, offset=None, verbose=False):
+    def __init__(self, limit=None, offset=None, verbose=False, encoding=ENCODING_MAP, stream=False,
+                 codes=None, line_index=False, line_user_map_path=None):
         self.stats = MigrationStats()
-        self.db_connection = None
+        self.db_pool = None
         self.firestore_db = None
         self.limit = limit
         self.offset = offset
         self.verbose = verbose
+        self.encoding = encoding
+        self.stream = stream
+        self.codes = codes
+        self.line_index = line_index
+        self.line_user_map_path = line_user_map_path or os.getenv('LINE_USER_MAP_PATH')
         self.logger = logging.getLogger(self.__class__.__name__)
         if verbose:
             self.logger.setLevel(logging.DEBUG)
@@ -84,19 +158,19 @@ class FirestoreMigration:
         """Connect to MariaDB database"""
         print("🔌 Connecting to MariaDB...")
         try:
-            self.db_connection = pymysql.connect(
-                host=os.getenv('DB_HOST', 'localhost'),
-                port=int(os.getenv('DB_PORT', 3306)),
-                user=os.getenv('DB_USER'),
-                password=os.getenv('DB_PASSWORD'),
-                database=os.getenv('DB_NAME'),
-                cursorclass=pymysql.cursors.DictCursor
-            )
+            self.db_pool = ConnectionPool.from_env()
+            self.db_pool.warm()
             print("✅ Connected to MariaDB")
         except Exception as e:
             print(f"❌ Failed to connect to MariaDB: {e}")
             raise
 
+    def close_mariadb(self):
+        if self.db_pool:
+            self.db_pool.close()
+            self.db_pool = None
+            print("\n🔌 Closed MariaDB connection")
+
     def connect_firestore(self):
         """Initialize Firebase Admin SDK"""
         print("🔥 Connecting to Firestore...")
@@ -115,7 +189,17 @@ class FirestoreMigration:
 
     def fetch_stock_info(self):
         """Fetch stock info from SQL, with optional limit and offset"""
-        query = "SELECT Code, Name, Period FROM stock_info ORDER BY Code"
+        if self.codes is not None:
+            # Worker partition: the parent already applied limit/offset
+            if not self.codes:
+                return []
+            placeholders = ", ".join(["%s"] * len(self.codes))
+            return self.db_pool.fetch_all(
+                SQL_STOCK_INFO_BY_CODES.format(placeholders=placeholders),
+                tuple(self.codes)
+            )
+
+        query = SQL_STOCK_INFO
         
         # Safely convert limit and offset to integers
         limit_val = int(self.limit) if self.limit is not None else None
@@ -126,45 +210,32 @@ class FirestoreMigration:
         if offset_val is not None:
             query += f" OFFSET {offset_val}"
         
-        with self.db_connection.cursor() as cursor:
-            print(f"  Executing query: {query}")
-            cursor.execute(query)
-            return cursor.fetchall()
+        print(f"  Executing query: {query}")
+        return self.db_pool.fetch_all(query)
+
+    def fetch_row_counts(self):
+        """Daily row count per stock code, used to balance worker partitions"""
+        return {row['Code']: int(row['row_count']) for row in self.db_pool.fetch_all(SQL_ROW_COUNTS)}
 
     def fetch_dividends_by_code(self, code):
         """Fetch dividends for a specific stock"""
-        with self.db_connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT Date, Price FROM dividend WHERE Code = %s ORDER BY Date",
-                (code,)
-            )
-            return cursor.fetchall()
+        return self.db_pool.fetch_all(SQL_DIVIDENDS_BY_CODE, (code,))
 
     def fetch_stock_data_by_code(self, code):
         """Fetch daily stock data for a specific stock"""
-        with self.db_connection.cursor() as cursor:
-            cursor.execute(
-                """SELECT Date, Open, High, Low, Close, Volume
-                   FROM stock WHERE Code = %s ORDER BY Date""",
-                (code,)
-            )
-            return cursor.fetchall()
-
-    def fetch_horizontal_lines(self):
-        """Fetch all horizontal lines"""
-        with self.db_connection.cursor() as cursor:
-            cursor.execute(
-                """SELECT id, color, created_at, line_style, line_width,
-                          memo, price, stock_code, updated_at
-                   FROM horizontal"""
-            )
-            return cursor.fetchall()
+        return self.db_pool.fetch_all(SQL_STOCK_DATA_BY_CODE, (code,))
+
+    def iter_stock_data_by_code(self, code):
+        """Stream daily stock data for a stock in date order (server-side cursor)"""
+        return self.db_pool.stream(SQL_STOCK_DATA_BY_CODE, (code,))
+
+    def iter_horizontal_lines(self):
+        """Stream horizontal lines in id order (server-side cursor)"""
+        return self.db_pool.stream(SQL_HORIZONTAL_LINES)
 
     def fetch_data_time(self):
         """Fetch data time records"""
-        with self.db_connection.cursor() as cursor:
-            cursor.execute("SELECT Code, Time FROM data_time")
-            return cursor.fetchall()
+        return self.db_pool.fetch_all(SQL_DATA_TIME)
 
     def transform_dividends_to_map(self, dividends):
         """
@@ -200,10 +271,7 @@ class FirestoreMigration:
         logger = self.logger
 
         for row in stock_data:
-            date_str = row['Date'].strftime('%Y-%m-%d') if hasattr(row['Date'], 'strftime') else str(row['Date'])
-
-            year, month, day = date_str.split('-')
-            year_month = f"{year}-{month}"
+            year_month, day = self._split_row_date(row)
 
             # Create day data
             if day in monthly_data[year_month]:
@@ -212,22 +280,84 @@ class FirestoreMigration:
                     year_month,
                     day,
                 )
-            monthly_data[year_month][day] = {
-                'close': int(row['Close']),
-                'volume': int(row['Volume']),
-                'open': int(row['Open']),
-                'low': int(row['Low']),
-                'high': int(row['High'])
-            }
+            monthly_data[year_month][day] = self._row_to_day(row)
 
         return dict(monthly_data)
 
+    def iter_monthly_chunks(self, rows, integrity):
+        """
+        Group date-ordered rows into (year_month, days) pairs, yielding each
+        month as soon as the first row of the next one arrives.
+
+        `integrity` is updated in place: rows, distinct_dates, mapped_days,
+        first_date, last_date.
+        """
+        current_month = None
+        days = {}
+        previous_date = None
+
+        for row in rows:
+            integrity['rows'] += 1
+            if row['Date'] != previous_date:
+                integrity['distinct_dates'] += 1
+                previous_date = row['Date']
+            if integrity['first_date'] is None:
+                integrity['first_date'] = row['Date']
+            integrity['last_date'] = row['Date']
+
+            year_month, day = self._split_row_date(row)
+            if year_month != current_month:
+                if current_month is not None:
+                    integrity['mapped_days'] += len(days)
+                    yield current_month, days
+                current_month = year_month
+                days = {}
+
+            if day in days:
+                self.logger.warning(
+                    "Duplicate record detected for %s on %s; overwriting previous entry.",
+                    year_month,
+                    day,
+                )
+            days[day] = self._row_to_day(row)
+
+        if current_month is not None:
+            integrity['mapped_days'] += len(days)
+            yield current_month, days
+
+    @staticmethod
+    def _split_row_date(row):
+        date_str = row['Date'].strftime('%Y-%m-%d') if hasattr(row['Date'], 'strftime') else str(row['Date'])
+        year, month, day = date_str.split('-')
+        return f"{year}-{month}", day
+
+    @staticmethod
+    def _row_to_day(row):
+        return {
+            'close': int(row['Close']),
+            'volume': int(row['Volume']),
+            'open': int(row['Open']),
+            'low': int(row['Low']),
+            'high': int(row['High'])
+        }
+
+    @staticmethod
+    def stock_document(name, period, dividend_map):
+        return {
+            'name': name,
+            'period': period,
+            'dividends': dividend_map,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }
+
     def migrate_stocks(self):
         """Migrate stock_info and dividends to stocks/{code}"""
         print("\n📈 Migrating stocks and dividends...")
 
         stock_infos = self.fetch_stock_info()
         total = len(stock_infos)
+        # Stock docs as written, for the dividend calendar built at the end
+        calendar_stocks = {}
 
         for idx, stock_info in enumerate(stock_infos, 1):
             code = stock_info['Code']
@@ -244,12 +374,9 @@ class FirestoreMigration:
 
                 # Create stock document
                 stock_doc_ref = self.firestore_db.collection('stocks').document(code)
-                stock_doc_ref.set({
-                    'name': name,
-                    'period': period,
-                    'dividends': dividend_map,
-                    'updated_at': firestore.SERVER_TIMESTAMP
-                })
+                stock_doc = self.stock_document(name, period, dividend_map)
+                stock_doc_ref.set(stock_doc)
+                calendar_stocks[code] = stock_doc
 
                 self.stats.stocks_migrated += 1
                 self.logger.debug("      ✓ %s dividends=%d", code, len(dividends))
@@ -257,7 +384,29 @@ class FirestoreMigration:
             except Exception as e:
                 error_msg = f"Error migrating stock {code}: {e}"
                 self.logger.error("      ✗ %s", error_msg)
-                self.stats.errors.append(error_msg)
+                self.stats.add_error(error_msg)
+
+        self.write_dividend_calendar(calendar_stocks)
+
+    def write_dividend_calendar(self, stocks):
+        """Merge these stocks' ex-dates into dividendCalendar/{YYYY-MM}"""
+        try:
+            months = write_calendar_docs(self.firestore_db, build_calendar_docs(stocks))
+            print(f"  ✓ Dividend calendar: {months} months updated")
+        except Exception as e:
+            error_msg = f"Error writing dividend calendar: {e}"
+            print(f"  ✗ {error_msg}")
+            self.stats.add_error(error_msg)
+
+    def update_search_index(self):
+        """Rebuild searchIndex from every stock now in Firestore (covers chunked runs)"""
+        try:
+            shards = rebuild_search_index(self.firestore_db)
+            print(f"  ✓ Search index: {shards} shard documents")
+        except Exception as e:
+            error_msg = f"Error building search index: {e}"
+            print(f"  ✗ {error_msg}")
+            self.stats.add_error(error_msg)
 
     def migrate_monthly_data(self):
         """Migrate stock table to stocks/{code}/monthly/{YYYY-MM}"""
@@ -273,159 +422,344 @@ class FirestoreMigration:
             self.logger.info("  [%d/%d] Processing %s - %s", idx, total, code, name)
 
             try:
-                # Fetch all stock data
-                stock_data = self.fetch_stock_data_by_code(code)
-                self.stats.total_daily_records += len(stock_data)
+                if self.stream:
+                    self._migrate_monthly_streaming(code)
+                else:
+                    self._migrate_monthly_buffered(code)
 
-                # Transform to monthly Map structure
-                monthly_data = self.transform_stock_data_to_monthly(stock_data)
+            except Exception as e:
+                error_msg = f"Error migrating monthly data for {code}: {e}"
+                self.logger.error("      ✗ %s", error_msg)
+                self.stats.add_error(error_msg)
+
+    def _migrate_monthly_buffered(self, code):
+        """Load every row for a stock, then write its monthly documents"""
+        # Fetch all stock data
+        stock_data = self.fetch_stock_data_by_code(code)
+        self.stats.total_daily_records += len(stock_data)
+
+        # Transform to monthly Map structure
+        monthly_data = self.transform_stock_data_to_monthly(stock_data)
+
+        total_days = sum(len(days) for days in monthly_data.values())
+        distinct_dates = len({row['Date'] for row in stock_data})
+        first_date = stock_data[0]['Date'] if stock_data else None
+        last_date = stock_data[-1]['Date'] if stock_data else None
+
+        if self.verbose:
+            self.logger.debug(
+                "      • %s date range %s → %s, rows=%d, distinct_dates=%d, mapped_days=%d",
+                code,
+                first_date,
+                last_date,
+                len(stock_data),
+                distinct_dates,
+                total_days,
+            )
+
+            for year_month, days in sorted(monthly_data.items()):
+                self._log_month(year_month, days)
+
+        if total_days != distinct_dates:
+            self.logger.warning(
+                "      ⚠️ %s has row/day mismatch: rows=%d distinct=%d mapped=%d",
+                code,
+                len(stock_data),
+                distinct_dates,
+                total_days,
+            )
+
+        months_written = self._write_monthly_docs(code, monthly_data.items())
+
+        self.logger.info(
+            "      ✓ Created %d monthly documents (%d daily records)",
+            months_written,
+            len(stock_data),
+        )
 
-                total_days = sum(len(days) for days in monthly_data.values())
-                distinct_dates = len({row['Date'] for row in stock_data})
-                first_date = stock_data[0]['Date'] if stock_data else None
-                last_date = stock_data[-1]['Date'] if stock_data else None
+    def _migrate_monthly_streaming(self, code):
+        """Write each month as soon as its rows have been read; O(one month) memory"""
+        integrity = {'rows': 0, 'distinct_dates': 0, 'mapped_days': 0,
+                     'first_date': None, 'last_date': None}
 
+        def logged_months():
+            for year_month, days in self.iter_monthly_chunks(self.iter_stock_data_by_code(code), integrity):
                 if self.verbose:
-                    self.logger.debug(
-                        "      • %s date range %s → %s, rows=%d, distinct_dates=%d, mapped_days=%d",
-                        code,
-                        first_date,
-                        last_date,
-                        len(stock_data),
-                        distinct_dates,
-                        total_days,
-                    )
-
-                    for year_month, days in sorted(monthly_data.items()):
-                        self.logger.debug(
-                            "        – %s: %d days (%s … %s)",
-                            year_month,
-                            len(days),
-                            min(days.keys()),
-                            max(days.keys()),
-                        )
-
-                if total_days != distinct_dates:
-                    self.logger.warning(
-                        "      ⚠️ %s has row/day mismatch: rows=%d distinct=%d mapped=%d",
-                        code,
-                        len(stock_data),
-                        distinct_dates,
-                        total_days,
-                    )
-
-                # Create monthly documents
+                    self._log_month(year_month, days)
+                yield year_month, days
+
+        months_written = self._write_monthly_docs(code, logged_months())
+        self.stats.total_daily_records += integrity['rows']
+
+        self.logger.debug(
+            "      • %s date range %s → %s, rows=%d, distinct_dates=%d, mapped_days=%d",
+            code,
+            integrity['first_date'],
+            integrity['last_date'],
+            integrity['rows'],
+            integrity['distinct_dates'],
+            integrity['mapped_days'],
+        )
+        if integrity['mapped_days'] != integrity['distinct_dates']:
+            self.logger.warning(
+                "      ⚠️ %s has row/day mismatch: rows=%d distinct=%d mapped=%d",
+                code,
+                integrity['rows'],
+                integrity['distinct_dates'],
+                integrity['mapped_days'],
+            )
+
+        self.logger.info(
+            "      ✓ Created %d monthly documents (%d daily records, streamed)",
+            months_written,
+            integrity['rows'],
+        )
+
+    def _log_month(self, year_month, days):
+        self.logger.debug(
+            "        – %s: %d days (%s … %s)",
+            year_month,
+            len(days),
+            min(days.keys()),
+            max(days.keys()),
+        )
+
+    def _write_monthly_docs(self, code, months):
+        """Batch-write (year_month, days) pairs to stocks/{code}/monthly; returns the count"""
+        batch = self.firestore_db.batch()
+        batch_count = 0
+        written = 0
+
+        for year_month, days in months:
+            monthly_ref = (self.firestore_db.collection('stocks')
+                          .document(code)
+                          .collection('monthly')
+                          .document(year_month))
+
+            batch.set(monthly_ref, encode_month(days, self.encoding))
+            batch_count += 1
+            written += 1
+            self.stats.monthly_docs_created += 1
+
+            # Firestore batch limit is 500, commit if near limit
+            if batch_count >= 400:
+                batch.commit()
                 batch = self.firestore_db.batch()
                 batch_count = 0
 
-                for year_month, days in monthly_data.items():
-                    monthly_ref = (self.firestore_db.collection('stocks')
-                                  .document(code)
-                                  .collection('monthly')
-                                  .document(year_month))
+        # Commit remaining
+        if batch_count > 0:
+            batch.commit()
+
+        return written
+
+    def reencode_monthly_data(self):
+        """Rewrite existing stocks/{code}/monthly docs in place using self.encoding"""
+        print(f"\n♻️  Re-encoding monthly data as '{self.encoding}'...")
+
+        stock_refs = list(self.firestore_db.collection('stocks').list_documents())
+        total = len(stock_refs)
 
-                    batch.set(monthly_ref, {'days': days})
+        for idx, stock_ref in enumerate(stock_refs, 1):
+            self.logger.info("  [%d/%d] Re-encoding %s", idx, total, stock_ref.id)
+            try:
+                batch = self.firestore_db.batch()
+                batch_count = 0
+                for monthly_doc in stock_ref.collection('monthly').stream():
+                    data = monthly_doc.to_dict() or {}
+                    encoded = encode_month(decode_month(data), self.encoding)
+                    current = {key: data[key] for key in ENCODED_FIELDS if key in data}
+                    if current == encoded:
+                        continue
+
+                    # Merge so unrelated fields survive; drop fields of the old encoding
+                    payload = dict(encoded)
+                    for key in current:
+                        if key not in encoded:
+                            payload[key] = firestore.DELETE_FIELD
+                    batch.set(monthly_doc.reference, payload, merge=True)
                     batch_count += 1
-                    self.stats.monthly_docs_created += 1
+                    self.stats.monthly_docs_reencoded += 1
 
-                    # Firestore batch limit is 500, commit if near limit
                     if batch_count >= 400:
                         batch.commit()
                         batch = self.firestore_db.batch()
                         batch_count = 0
 
-                # Commit remaining
                 if batch_count > 0:
                     batch.commit()
 
-                self.logger.info(
-                    "      ✓ Created %d monthly documents (%d daily records)",
-                    len(monthly_data),
-                    len(stock_data),
-                )
-
             except Exception as e:
-                error_msg = f"Error migrating monthly data for {code}: {e}"
+                error_msg = f"Error re-encoding monthly data for {stock_ref.id}: {e}"
                 self.logger.error("      ✗ %s", error_msg)
-                self.stats.errors.append(error_msg)
+                self.stats.add_error(error_msg)
+
+    def load_line_user_map(self):
+        """
+        Legacy line id -> Firebase UID mapping from LINE_USER_MAP_PATH.
+        Accepts a JSON object ({"17": "uid"}) or a CSV file with line_id,uid columns.
+        """
+        path = self.line_user_map_path
+        if not path:
+            return {}
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Line user map not found at: {path}")
+
+        with open(path, encoding='utf-8', newline='') as handle:
+            if path.lower().endswith('.json'):
+                raw = json.load(handle)
+            else:
+                raw = {row['line_id']: row['uid'] for row in csv.DictReader(handle)}
+        # Accept both "17" and "line_17" as keys
+        return {str(key).removeprefix('line_'): str(uid) for key, uid in raw.items() if uid}
+
+    def transform_horizontal_line(self, line):
+        """Transform a horizontal table row to a users/{uid}/lines document"""
+        return {
+            'stockCode': line['stock_code'],
+            'price': float(line['price']),
+            'color': line['color'],
+            'style': LINE_STYLE_MAP.get(line['line_style'], 'solid'),
+            'width': int(line['line_width']),
+            'memo': line['memo'],
+            'created_at': line['created_at'],
+            'updated_at': line['updated_at']
+        }
 
     def migrate_horizontal_lines(self):
         """Migrate horizontal lines to users/{userId}/lines/{lineId}"""
         print("\n📏 Migrating horizontal lines...")
 
         default_user_id = os.getenv('DEFAULT_USER_ID', 'default_user')
-        lines = self.fetch_horizontal_lines()
+        user_map = self.load_line_user_map()
+        if user_map:
+            print(f"  ℹ️  Loaded {len(user_map)} line → user mappings")
 
-        if not lines:
-            print("  ℹ️  No horizontal lines to migrate")
-            return
+        # (line_id, doc) per user, kept only when building the per-stock index
+        lines_by_user = defaultdict(list)
+        per_user_counts = defaultdict(int)
 
-        for line in lines:
-            line_id = f"line_{line['id']}"
+        batch = self.firestore_db.batch()
+        batch_count = 0
+        pending = []
 
+        def commit():
             try:
-                line_ref = (self.firestore_db.collection('users')
-                           .document(default_user_id)
-                           .collection('lines')
-                           .document(line_id))
-
-                line_ref.set({
-                    'stockCode': line['stock_code'],
-                    'price': float(line['price']),
-                    'color': line['color'],
-                    'style': LINE_STYLE_MAP.get(line['line_style'], 'solid'),
-                    'width': int(line['line_width']),
-                    'memo': line['memo'],
-                    'created_at': line['created_at'],
-                    'updated_at': line['updated_at']
-                })
+                batch.commit()
+                self.stats.lines_migrated += len(pending)
+            except Exception as e:
+                error_msg = f"Error committing {len(pending)} lines ({pending[0]} … {pending[-1]}): {e}"
+                print(f"  ✗ {error_msg}")
+                self.stats.add_error(error_msg)
 
-                self.stats.lines_migrated += 1
-                print(f"  ✓ Migrated line {line_id} for stock {line['stock_code']}")
+        for line in self.iter_horizontal_lines():
+            line_id = f"line_{line['id']}"
+            user_id = user_map.get(str(line['id']), default_user_id)
 
+            try:
+                line_doc = self.transform_horizontal_line(line)
             except Exception as e:
                 error_msg = f"Error migrating line {line_id}: {e}"
                 print(f"  ✗ {error_msg}")
-                self.stats.errors.append(error_msg)
+                self.stats.add_error(error_msg)
+                continue
+
+            line_ref = (self.firestore_db.collection('users')
+                       .document(user_id)
+                       .collection('lines')
+                       .document(line_id))
+            batch.set(line_ref, line_doc)
+            batch_count += 1
+            pending.append(line_id)
+            per_user_counts[user_id] += 1
+            if self.line_index:
+                lines_by_user[user_id].append((line_id, line_doc))
+
+            if batch_count >= 400:
+                commit()
+                batch = self.firestore_db.batch()
+                batch_count = 0
+                pending = []
+
+        if batch_count > 0:
+            commit()
+
+        if not per_user_counts:
+            print("  ℹ️  No horizontal lines to migrate")
+            return
+
+        for user_id, count in sorted(per_user_counts.items()):
+            print(f"  ✓ users/{user_id}: {count} lines")
+
+        if self.line_index:
+            self.write_line_index(lines_by_user)
+
+    def write_line_index(self, lines_by_user):
+        """Write users/{uid}/lineIndex/{stockCode} docs (one read per chart overlay)"""
+        batch = self.firestore_db.batch()
+        batch_count = 0
+        index_docs = 0
+
+        for user_id, lines in lines_by_user.items():
+            for stock_code, doc in build_line_index_docs(lines).items():
+                batch.set(line_index_ref(self.firestore_db, user_id, stock_code), {
+                    **doc,
+                    'updated_at': firestore.SERVER_TIMESTAMP,
+                })
+                batch_count += 1
+                index_docs += 1
+                if batch_count >= 400:
+                    batch.commit()
+                    batch = self.firestore_db.batch()
+                    batch_count = 0
+
+        if batch_count > 0:
+            batch.commit()
+        print(f"  ✓ Wrote {index_docs} per-stock line index documents")
+
+    @staticmethod
+    def metadata_document(data_times):
+        """Build metadata/system from data_time rows"""
+        # Create stocks timestamp map
+        stocks_map = {}
+        latest_time = None
+
+        for dt in data_times:
+            code = dt['Code']
+            data_time = dt['Time']
+            stocks_map[code] = data_time
+
+            if latest_time is None or data_time > latest_time:
+                latest_time = data_time
+
+        return {
+            'lastUpdate': latest_time,
+            'lastSuccessfulUpdate': latest_time,
+            'updateStatus': 'success',
+            'stocks': stocks_map,
+            'stats': {
+                'totalStocks': len(stocks_map),
+                'lastCalculated': firestore.SERVER_TIMESTAMP
+            }
+        }
 
     def migrate_metadata(self):
         """Migrate data_time to metadata/system"""
         print("\n🔧 Migrating metadata...")
 
         try:
-            data_times = self.fetch_data_time()
-
-            # Create stocks timestamp map
-            stocks_map = {}
-            latest_time = None
-
-            for dt in data_times:
-                code = dt['Code']
-                time = dt['Time']
-                stocks_map[code] = time
-
-                if latest_time is None or time > latest_time:
-                    latest_time = time
+            metadata_doc = self.metadata_document(self.fetch_data_time())
 
             # Create metadata document
             metadata_ref = self.firestore_db.collection('metadata').document('system')
-            metadata_ref.set({
-                'lastUpdate': latest_time,
-                'lastSuccessfulUpdate': latest_time,
-                'updateStatus': 'success',
-                'stocks': stocks_map,
-                'stats': {
-                    'totalStocks': len(stocks_map),
-                    'lastCalculated': firestore.SERVER_TIMESTAMP
-                }
-            })
+            metadata_ref.set(metadata_doc)
 
-            print(f"  ✓ Created metadata with {len(stocks_map)} stock timestamps")
+            print(f"  ✓ Created metadata with {len(metadata_doc['stocks'])} stock timestamps")
 
         except Exception as e:
             error_msg = f"Error migrating metadata: {e}"
             print(f"  ✗ {error_msg}")
-            self.stats.errors.append(error_msg)
+            self.stats.add_error(error_msg)
 
     def verify_migration(self):
         """Verify migration data"""
@@ -446,10 +780,16 @@ class FirestoreMigration:
                     print(f"      - Period: {stock_data.get('period')}")
                     print(f"      - Dividends: {len(stock_data.get('dividends', {}))} years")
 
-                    # Check monthly data
-                    monthly_docs = self.firestore_db.collection('stocks').document(stock.id).collection('monthly').stream()
-                    monthly_count = len(list(monthly_docs))
-                    print(f"      - Monthly docs: {monthly_count}")
+                    # Check monthly data: list IDs, then read them in batched get_all calls
+                    monthly_ids = [ref.id for ref in self.firestore_db.collection('stocks')
+                                   .document(stock.id).collection('monthly').list_documents()]
+                    reader = StockHistoryReader(self.firestore_db)
+                    months = reader.read_months((stock.id, month_id) for month_id in monthly_ids)
+                    columns = to_columns(stock.id, {month_id: days for (_, month_id), days in months.items()})
+                    print(f"      - Monthly docs: {len(monthly_ids)} ({reader.rpc_count} batched reads)")
+                    if columns['dates']:
+                        print(f"      - Daily records: {len(columns['dates'])} "
+                              f"({columns['dates'][0]} → {columns['dates'][-1]})")
 
             # Verify metadata
             metadata = self.firestore_db.collection('metadata').document('system').get()
@@ -464,12 +804,167 @@ class FirestoreMigration:
         except Exception as e:
             print(f"⚠️  Verification error: {e}")
 
+    def plan(self, workers=1):
+        """
+        Dry run: read and transform everything from MariaDB exactly as run()
+        would, but only tally documents, sizes and index entries.
+        """
+        print("="*60)
+        print("🧮 Planning SQL to Firestore Migration (no Firestore writes)")
+        print("="*60)
+
+        plan = MigrationPlan()
+        try:
+            self.connect_mariadb()
+
+            stock_infos = self.fetch_stock_info()
+            total = len(stock_infos)
+            calendar_stocks = {}
+            for idx, stock_info in enumerate(stock_infos, 1):
+                code = stock_info['Code']
+                self.logger.info("  [%d/%d] Planning %s - %s", idx, total, code, stock_info['Name'])
+                dividend_map = self.transform_dividends_to_map(self.fetch_dividends_by_code(code))
+                period = PERIOD_MAP.get(stock_info['Period'], stock_info['Period'])
+                calendar_stocks[code] = self.stock_document(stock_info['Name'], period, dividend_map)
+                plan.add(f"stocks/{code}", calendar_stocks[code])
+
+                integrity = {'rows': 0, 'distinct_dates': 0, 'mapped_days': 0,
+                             'first_date': None, 'last_date': None}
+                for year_month, days in self.iter_monthly_chunks(self.iter_stock_data_by_code(code), integrity):
+                    plan.add(f"stocks/{code}/monthly/{year_month}", encode_month(days, self.encoding))
+
+            default_user_id = os.getenv('DEFAULT_USER_ID', 'default_user')
+            user_map = self.load_line_user_map()
+            lines_by_user = defaultdict(list)
+            for line in self.iter_horizontal_lines():
+                line_id = f"line_{line['id']}"
+                user_id = user_map.get(str(line['id']), default_user_id)
+                line_doc = self.transform_horizontal_line(line)
+                plan.add(f"users/{user_id}/lines/{line_id}", line_doc)
+                if self.line_index:
+                    lines_by_user[user_id].append((line_id, line_doc))
+            for user_id, lines in lines_by_user.items():
+                for stock_code, doc in build_line_index_docs(lines).items():
+                    plan.add(f"users/{user_id}/lineIndex/{stock_code}",
+                             {**doc, 'updated_at': firestore.SERVER_TIMESTAMP})
+
+            for month_id, doc in build_calendar_docs(calendar_stocks).items():
+                plan.add(f"dividendCalendar/{month_id}", {**doc, 'updated_at': firestore.SERVER_TIMESTAMP})
+            names = {code: stock['name'] for code, stock in calendar_stocks.items()}
+            for doc_id, doc in build_search_index(names).items():
+                plan.add(f"searchIndex/{doc_id}", {**doc, 'updated_at': firestore.SERVER_TIMESTAMP})
+
+            plan.add("metadata/system", self.metadata_document(self.fetch_data_time()))
+
+            plan.print_report(workers)
+            return plan
+
+        except Exception as e:
+            print(f"\n❌ Planning failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+
+        finally:
+            self.close_mariadb()
+
+    def record_run(self, started, workers=1):
+        """Store this run's write throughput for future --plan projections"""
+        stats = self.stats
+        writes = stats.stocks_migrated + stats.monthly_docs_created + stats.lines_migrated
+        try:
+            record_throughput(writes, time.perf_counter() - started, workers=workers, encoding=self.encoding)
+        except OSError as e:
+            self.logger.warning("Could not record migration throughput: %s", e)
+
+    def run_reencode(self):
+        """Re-encode existing monthly documents without touching MariaDB"""
+        print("="*60)
+        print("♻️  Starting monthly document re-encode")
+        print("="*60)
+
+        try:
+            self.connect_firestore()
+            self.reencode_monthly_data()
+            self.stats.print_summary()
+            return True
+
+        except Exception as e:
+            print(f"\n❌ Re-encode failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+    def partition_codes(self, workers):
+        """
+        Split the selected codes into `workers` groups with similar row counts
+        (largest stocks first, each to the currently lightest group).
+        """
+        codes = [info['Code'] for info in self.fetch_stock_info()]
+        row_counts = self.fetch_row_counts()
+        groups = [[] for _ in range(workers)]
+        loads = [0] * workers
+        for code in sorted(codes, key=lambda c: row_counts.get(c, 0), reverse=True):
+            lightest = loads.index(min(loads))
+            groups[lightest].append(code)
+            loads[lightest] += row_counts.get(code, 0) + 1
+        return [group for group in groups if group]
+
+    def run_parallel(self, workers):
+        """Run stock/monthly migration across worker processes, then the rest here"""
+        print("="*60)
+        print(f"🚀 Starting SQL to Firestore Migration ({workers} worker processes)")
+        print("="*60)
+
+        started = time.perf_counter()
+        try:
+            self.connect_mariadb()
+            partitions = self.partition_codes(workers)
+            self.connect_firestore()
+
+            options = {'verbose': self.verbose, 'encoding': self.encoding, 'stream': self.stream}
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=len(partitions), mp_context=context) as pool:
+                futures = {
+                    pool.submit(_migrate_partition, codes, options): idx
+                    for idx, codes in enumerate(partitions, 1)
+                }
+                for future in as_completed(futures):
+                    idx = futures[future]
+                    try:
+                        worker_stats = future.result()
+                    except Exception as e:
+                        self.stats.add_error(f"Worker {idx} crashed: {e}")
+                        continue
+                    self.stats.merge(worker_stats)
+                    print(f"  ✓ Worker {idx}/{len(partitions)} finished "
+                          f"({worker_stats['stocks_migrated']} stocks, "
+                          f"{worker_stats['monthly_docs_created']} monthly docs)")
+
+            self.update_search_index()
+            self.migrate_horizontal_lines()
+            self.migrate_metadata()
+            self.record_run(started, workers)
+            self.verify_migration()
+            self.stats.print_summary()
+            return True
+
+        except Exception as e:
+            print(f"\n❌ Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+        finally:
+            self.close_mariadb()
+
     def run(self):
         """Run the complete migration"""
         print("="*60)
         print("🚀 Starting SQL to Firestore Migration")
         print("="*60)
 
+        started = time.perf_counter()
         try:
             # Connect to databases
             self.connect_mariadb()
@@ -477,9 +972,11 @@ class FirestoreMigration:
 
             # Run migration steps
             self.migrate_stocks()
+            self.update_search_index()
             self.migrate_monthly_data()
             self.migrate_horizontal_lines()
             self.migrate_metadata()
+            self.record_run(started)
 
             # Verify
             self.verify_migration()
@@ -497,9 +994,22 @@ class FirestoreMigration:
 
         finally:
             # Clean up connections
-            if self.db_connection:
-                self.db_connection.close()
-                print("\n🔌 Closed MariaDB connection")
+            self.close_mariadb()
+
+
+def _migrate_partition(codes, options):
+    """Worker process entry: own MariaDB connection and Firestore client"""
+    logging.basicConfig(level=logging.DEBUG if options['verbose'] else logging.INFO,
+                        format="[%(processName)s %(levelname)s] %(message)s")
+    migration = FirestoreMigration(codes=codes, **options)
+    try:
+        migration.connect_mariadb()
+        migration.connect_firestore()
+        migration.migrate_stocks()
+        migration.migrate_monthly_data()
+    finally:
+        migration.close_mariadb()
+    return migration.stats.to_dict()
 
 
 def main():
@@ -508,6 +1018,19 @@ def main():
     parser.add_argument('--limit', type=int, help='Number of stock records to process.')
     parser.add_argument('--offset', type=int, help='Offset to start processing stock records from.')
     parser.add_argument('--verbose', action='store_true', help='Enable verbose logging output.')
+    parser.add_argument('--encoding', choices=ENCODINGS, default=os.getenv('MONTHLY_ENCODING', ENCODING_MAP),
+                        help='Encoding for daily OHLCV entries in monthly documents.')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream daily rows month by month instead of loading each stock at once.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Migrate stocks and monthly data in this many worker processes.')
+    parser.add_argument('--line-index', action='store_true',
+                        help='Also write users/{uid}/lineIndex/{stockCode} docs for horizontal lines.')
+    parser.add_argument('--line-user-map', help='JSON/CSV mapping legacy line ids to Firebase UIDs.')
+    parser.add_argument('--plan', action='store_true',
+                        help='Dry run: report writes, document sizes, index entries and projected time.')
+    parser.add_argument('--reencode', action='store_true',
+                        help='Only rewrite existing monthly documents in --encoding (no SQL access).')
     args = parser.parse_args()
 
     # Adjust global logging level based on verbosity
@@ -519,6 +1042,10 @@ def main():
 
     # Check environment variables
     required_vars = ['DB_USER', 'DB_PASSWORD', 'DB_NAME', 'FIREBASE_CREDENTIALS_PATH']
+    if args.reencode:
+        required_vars = ['FIREBASE_CREDENTIALS_PATH']
+    elif args.plan:
+        required_vars = ['DB_USER', 'DB_PASSWORD', 'DB_NAME']
     missing_vars = [var for var in required_vars if not os.getenv(var)]
 
     if missing_vars:
@@ -526,9 +1053,22 @@ def main():
         print("Please create a .env file based on .env.example")
         return
 
+    migration = FirestoreMigration(limit=args.limit, offset=args.offset, verbose=args.verbose,
+                                   encoding=args.encoding, stream=args.stream,
+                                   line_index=args.line_index, line_user_map_path=args.line_user_map)
+    if args.plan:
+        migration.plan(workers=args.workers)
+        return
+    if args.reencode:
+        if migration.run_reencode():
+            print("\n🎉 Re-encode completed successfully!")
+        return
+
     # Run migration
-    migration = FirestoreMigration(limit=args.limit, offset=args.offset, verbose=args.verbose)
-    success = migration.run()
+    if args.workers > 1:
+        success = migration.run_parallel(args.workers)
+    else:
+        success = migration.run()
 
     if success:
         print("\n🎉 Migration completed successfully!")
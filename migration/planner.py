@@ -0,0 +1,190 @@
+"""
+Dry-run planning helpers for migrate.py --plan.
+
+Document sizes follow Firestore's storage size rules
+(https://firebase.google.com/docs/firestore/storage-size); index entries
+count the automatic single-field indexes, minus the fieldOverrides in
+firestore.indexes.json. Wall time is projected from the throughput that
+earlier real runs recorded in THROUGHPUT_PATH.
+"""
+
+import json
+import os
+import statistics
+from collections import defaultdict
+from datetime import datetime
+
+MAX_DOCUMENT_BYTES = 1024 * 1024
+# Warn when a document reaches this share of the 1 MiB limit
+SIZE_ALERT_RATIO = float(os.getenv('PLAN_SIZE_ALERT_RATIO', 0.8))
+# Spark plan daily write quota (continuity/COST_ANALYSIS.md)
+FREE_TIER_DAILY_WRITES = 20000
+
+INDEXES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'firestore.indexes.json')
+THROUGHPUT_PATH = os.getenv(
+    'MIGRATION_THROUGHPUT_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.migration_throughput.json'),
+)
+# Keep this many recent runs in the throughput history
+THROUGHPUT_HISTORY = 20
+
+
+# --- Sizes ---
+
+def _string_size(value):
+    return len(value.encode('utf-8')) + 1
+
+
+def value_size(value):
+    """Storage size of a field value in bytes"""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return _string_size(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_string_size(str(key)) + value_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(value_size(item) for item in value)
+    # Dates, sentinels such as SERVER_TIMESTAMP
+    return 8
+
+
+def document_size(path, fields):
+    """Size of a document at `path` ('stocks/475080/monthly/2025-01') with `fields`"""
+    name_size = sum(_string_size(segment) for segment in path.split('/')) + 16
+    return name_size + value_size(fields) + 32
+
+
+# --- Index entries ---
+
+def load_exempt_paths(path=INDEXES_PATH):
+    """{collectionGroup: {fieldPath}} with single-field indexing disabled"""
+    exempt = defaultdict(set)
+    if not os.path.exists(path):
+        return exempt
+    with open(path, encoding='utf-8') as handle:
+        config = json.load(handle)
+    for override in config.get('fieldOverrides', []):
+        if not override.get('indexes'):
+            exempt[override['collectionGroup']].add(override['fieldPath'])
+    return exempt
+
+
+def index_entries(fields, exempt=(), prefix=''):
+    """
+    Automatic single-field index entries for one document: ascending and
+    descending per scalar (map sub-fields included), array-contains per
+    array element. Exempt paths and their sub-fields are skipped.
+    """
+    count = 0
+    for key, value in fields.items():
+        path = f"{prefix}{key}"
+        if path in exempt:
+            continue
+        if isinstance(value, dict):
+            count += index_entries(value, exempt, prefix=f"{path}.")
+        elif isinstance(value, (list, tuple)):
+            count += len(set(map(repr, value)))
+        else:
+            count += 2
+    return count
+
+
+# --- Throughput history ---
+
+def load_throughput(path=THROUGHPUT_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle).get('runs', [])
+
+
+def record_throughput(writes, seconds, workers=1, encoding=None, path=THROUGHPUT_PATH):
+    """Append a finished run to the throughput history used by --plan"""
+    if writes <= 0 or seconds <= 0:
+        return
+    runs = load_throughput(path)
+    runs.append({
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'writes': writes,
+        'seconds': round(seconds, 2),
+        'workers': workers,
+        'encoding': encoding,
+    })
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump({'runs': runs[-THROUGHPUT_HISTORY:]}, handle, indent=2)
+
+
+def writes_per_second(workers=1, path=THROUGHPUT_PATH):
+    """Median measured writes/s, preferring runs with the same worker count"""
+    runs = load_throughput(path)
+    matching = [run for run in runs if run.get('workers', 1) == workers] or runs
+    rates = [run['writes'] / run['seconds'] for run in matching if run.get('seconds')]
+    return statistics.median(rates) if rates else None
+
+
+# --- Plan ---
+
+class MigrationPlan:
+    """Accumulates the documents a run would write, per collection group"""
+
+    def __init__(self, exempt=None):
+        self.exempt = load_exempt_paths() if exempt is None else exempt
+        self.writes = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.index_entries = defaultdict(int)
+        self.largest = {}
+        self.alerts = []
+
+    def add(self, path, fields):
+        group = path.split('/')[-2]
+        size = document_size(path, fields)
+        self.writes[group] += 1
+        self.bytes[group] += size
+        self.index_entries[group] += index_entries(fields, self.exempt.get(group, ()))
+        if size > self.largest.get(group, (0, None))[0]:
+            self.largest[group] = (size, path)
+        if size >= MAX_DOCUMENT_BYTES * SIZE_ALERT_RATIO:
+            self.alerts.append((path, size))
+
+    @property
+    def total_writes(self):
+        return sum(self.writes.values())
+
+    def print_report(self, workers=1):
+        print("\n" + "="*60)
+        print("🧮 Migration Plan (dry run, nothing written)")
+        print("="*60)
+        print(f"{'collection':<16} {'writes':>9} {'bytes':>12} {'avg':>8} {'max':>9} {'index entries':>14}")
+        for group in sorted(self.writes):
+            writes = self.writes[group]
+            print(f"{group:<16} {writes:>9,} {self.bytes[group]:>12,} "
+                  f"{self.bytes[group] // writes:>8,} {self.largest[group][0]:>9,} "
+                  f"{self.index_entries[group]:>14,}")
+        total_bytes = sum(self.bytes.values())
+        print(f"{'total':<16} {self.total_writes:>9,} {total_bytes:>12,} "
+              f"{'':>8} {'':>9} {sum(self.index_entries.values()):>14,}")
+
+        if self.alerts:
+            print(f"\n⚠️  {len(self.alerts)} documents at or above {SIZE_ALERT_RATIO:.0%} of the 1 MiB limit:")
+            for path, size in sorted(self.alerts, key=lambda item: -item[1])[:10]:
+                print(f"  - {path}: {size:,} bytes")
+        else:
+            largest = max(self.largest.values(), default=(0, None))
+            print(f"\n✅ Largest document {largest[1]} is {largest[0]:,} bytes "
+                  f"({largest[0] / MAX_DOCUMENT_BYTES:.1%} of the 1 MiB limit)")
+
+        rate = writes_per_second(workers)
+        if rate:
+            seconds = self.total_writes / rate
+            print(f"⏱️  Projected wall time: {seconds:,.0f}s ({seconds / 60:.1f} min) at {rate:.1f} writes/s "
+                  f"(median of recorded runs, workers={workers})")
+        else:
+            print("⏱️  No recorded runs yet; projected wall time is available after the first real migration.")
+        days = -(-self.total_writes // FREE_TIER_DAILY_WRITES)
+        print(f"📅 Free-tier write quota: {days} day(s) at {FREE_TIER_DAILY_WRITES:,} writes/day")
+        print("="*60)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Data-quality scan over stored daily histories.
+
+Reads every code's history from MariaDB (--source sql) or from Firestore
+monthly documents (--source firestore), runs the column-wise checks in
+functions/data_quality.py per code across worker processes and prints a
+compact report (optionally written as JSON with --output).
+
+    python quality_scan.py --source firestore --workers 4 --output report.json
+
+Exit status: 0 clean, 1 issues found (--fail-on-issues), 2 missing settings,
+3 a worker crashed and part of the universe was not scanned.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+ENV_PATH = os.path.join(os.path.dirname(__file__), '.env')
+load_dotenv(dotenv_path=ENV_PATH, override=True)
+
+from db import SQL_STOCK_DATA_BY_CODE, SQL_STOCK_INFO, ConnectionPool  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions'))
+from data_quality import (  # noqa: E402
+    CHECKS,
+    JUMP_THRESHOLD,
+    ZERO_VOLUME_STREAK,
+    scan_columns,
+    summarize,
+)
+from history_reader import StockHistoryReader, to_columns  # noqa: E402
+from ohlcv_codec import FIELDS  # noqa: E402
+
+SOURCE_SQL = 'sql'
+SOURCE_FIRESTORE = 'firestore'
+
+
+def connect_firestore():
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
+    if not cred_path or not os.path.exists(cred_path):
+        raise FileNotFoundError(f"Firebase credentials not found at: {cred_path}")
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app(credentials.Certificate(cred_path))
+    return firestore.client()
+
+
+def sql_columns(stock_code, rows):
+    """Columns straight from SQL rows, keeping duplicate dates so they can be flagged"""
+    columns = {"code": stock_code, "dates": []}
+    for field in FIELDS:
+        columns[field] = []
+    for row in rows:
+        day = row['Date']
+        columns["dates"].append(day.strftime('%Y%m%d') if hasattr(day, 'strftime') else str(day).replace('-', ''))
+        for field in FIELDS:
+            columns[field].append(int(row[field.capitalize()]))
+    return columns
+
+
+def list_codes(source, limit=None, offset=None):
+    if source == SOURCE_SQL:
+        pool = ConnectionPool.from_env(size=1)
+        try:
+            codes = [row['Code'] for row in pool.fetch_all(SQL_STOCK_INFO)]
+        finally:
+            pool.close()
+    else:
+        codes = sorted(ref.id for ref in connect_firestore().collection('stocks').list_documents())
+    codes = codes[offset or 0:]
+    return codes[:limit] if limit is not None else codes
+
+
+def scan_sql(codes, options):
+    pool = ConnectionPool.from_env(size=1)
+    try:
+        return [
+            scan_columns(sql_columns(code, pool.stream(SQL_STOCK_DATA_BY_CODE, (code,))), **options)
+            for code in codes
+        ]
+    finally:
+        pool.close()
+
+
+def scan_firestore(codes, options):
+    db = connect_firestore()
+    reader = StockHistoryReader(db)
+    results = []
+    for code in codes:
+        monthly = db.collection('stocks').document(code).collection('monthly')
+        month_ids = sorted(ref.id for ref in monthly.list_documents())
+        months = reader.read_months((code, month_id) for month_id in month_ids)
+        columns = to_columns(code, {month_id: days for (_, month_id), days in months.items()})
+        results.append(scan_columns(columns, **options))
+        # Each code is read once; keep the memo from growing across the universe
+        reader.clear()
+    return results
+
+
+def _scan_partition(source, codes, options):
+    """Worker process entry: own MariaDB connection or Firestore client"""
+    logging.basicConfig(level=logging.INFO, format="[%(processName)s %(levelname)s] %(message)s")
+    if source == SOURCE_SQL:
+        return scan_sql(codes, options)
+    return scan_firestore(codes, options)
+
+
+def run_scan(source, codes, workers, options):
+    """
+    Returns (results, failures). A crashed worker's partition is not
+    rescanned; it is listed in failures ({'worker', 'error', 'codes'}) so the
+    report shows what was not checked.
+    """
+    if workers <= 1:
+        return _scan_partition(source, codes, options), []
+
+    partitions = [codes[idx::workers] for idx in range(workers) if codes[idx::workers]]
+    results = []
+    failures = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=len(partitions), mp_context=context) as pool:
+        futures = {pool.submit(_scan_partition, source, part, options): idx
+                   for idx, part in enumerate(partitions, 1)}
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                results.extend(future.result())
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"  ❌ Worker {idx} crashed: {e}")
+                failures.append({'worker': idx, 'error': str(e), 'codes': partitions[idx - 1]})
+                continue
+            print(f"  ✓ Worker {idx}/{len(partitions)} finished")
+    return sorted(results, key=lambda result: result["code"]), sorted(failures, key=lambda f: f['worker'])
+
+
+def print_report(report):
+    print("\n" + "="*60)
+    print("🩺 DATA QUALITY REPORT")
+    print("="*60)
+    print(f"Source: {report['source']} | codes: {report['codes']} | days: {report['days']:,} "
+          f"| {report['seconds']}s")
+    for check in CHECKS:
+        print(f"  {check:<13} {report['totals'][check]:>8,}")
+    print(f"\n{report['flagged']} code(s) flagged")
+    if report['failedPartitions']:
+        print(f"⚠️  {report['unscanned']} code(s) NOT scanned: {len(report['failedPartitions'])} worker(s) crashed")
+        for failure in report['failedPartitions']:
+            print(f"  worker {failure['worker']}: {failure['error']} ({len(failure['codes'])} codes)")
+    for code, issue in report['issues'].items():
+        counts = ", ".join(f"{check}={count}" for check, count in issue['counts'].items())
+        print(f"  {code} ({issue['first']} → {issue['last']}): {counts}")
+        for check, samples in issue['samples'].items():
+            print(f"      {check}: {', '.join(samples)}")
+    print("="*60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan stored daily histories for data-quality issues.")
+    parser.add_argument('--source', choices=(SOURCE_SQL, SOURCE_FIRESTORE), default=SOURCE_FIRESTORE,
+                        help='Scan MariaDB rows or Firestore monthly documents.')
+    parser.add_argument('--workers', type=int, default=1, help='Scan codes in this many worker processes.')
+    parser.add_argument('--limit', type=int, help='Number of stock codes to scan.')
+    parser.add_argument('--offset', type=int, help='Offset into the sorted code list.')
+    parser.add_argument('--jump-threshold', type=float, default=JUMP_THRESHOLD,
+                        help='Flag close-to-close moves larger than this fraction.')
+    parser.add_argument('--zero-volume-streak', type=int, default=ZERO_VOLUME_STREAK,
+                        help='Flag runs of at least this many zero-volume days.')
+    parser.add_argument('--output', help='Also write the report as JSON to this path.')
+    parser.add_argument('--fail-on-issues', action='store_true',
+                        help='Exit with status 1 when any code is flagged (for scheduled runs).')
+    args = parser.parse_args()
+
+    required_vars = (['DB_USER', 'DB_PASSWORD', 'DB_NAME'] if args.source == SOURCE_SQL
+                     else ['FIREBASE_CREDENTIALS_PATH'])
+    missing_vars = [var for var in required_vars if not os.getenv(var)]
+    if missing_vars:
+        print(f"❌ Missing required environment variables: {', '.join(missing_vars)}")
+        print("Please create a .env file based on .env.example")
+        return 2
+
+    started = time.perf_counter()
+    codes = list_codes(args.source, args.limit, args.offset)
+    print(f"🔍 Scanning {len(codes)} codes from {args.source} ({args.workers} worker(s))")
+    options = {'jump_threshold': args.jump_threshold, 'zero_volume_streak': args.zero_volume_streak}
+    results, failures = run_scan(args.source, codes, args.workers, options)
+
+    report = {
+        'source': args.source,
+        'seconds': round(time.perf_counter() - started, 1),
+        **summarize(results),
+        'failedPartitions': failures,
+        'unscanned': sum(len(failure['codes']) for failure in failures),
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, separators=(',', ':'))
+        print(f"📝 Report written to {args.output}")
+
+    if failures:
+        # A partial scan must never pass a scheduled audit
+        return 3
+    return 1 if args.fail_on_issues and report['flagged'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -90,33 +90,18 @@ def check_setup():
     print("\n4. Checking MariaDB connection...")
     if os.path.exists('.env'):
         try:
-            import pymysql
             from dotenv import load_dotenv
+            from db import SQL_SHOW_TABLES, ConnectionPool
             load_dotenv()
 
-            connection = pymysql.connect(
-                host=os.getenv('DB_HOST', 'localhost'),
-                port=int(os.getenv('DB_PORT', 3306)),
-                user=os.getenv('DB_USER'),
-                password=os.getenv('DB_PASSWORD'),
-                database=os.getenv('DB_NAME')
-            )
-            connection.close()
+            # One pooled connection both tests connectivity and lists tables
+            pool = ConnectionPool.from_env(size=1)
+            try:
+                tables = [next(iter(row.values())) for row in pool.fetch_all(SQL_SHOW_TABLES)]
+            finally:
+                pool.close()
             print("   ✅ Successfully connected to MariaDB")
 
-            # Check if tables exist
-            connection = pymysql.connect(
-                host=os.getenv('DB_HOST', 'localhost'),
-                port=int(os.getenv('DB_PORT', 3306)),
-                user=os.getenv('DB_USER'),
-                password=os.getenv('DB_PASSWORD'),
-                database=os.getenv('DB_NAME')
-            )
-            cursor = connection.cursor()
-            cursor.execute("SHOW TABLES")
-            tables = [row[0] for row in cursor.fetchall()]
-            connection.close()
-
             required_tables = ['stock_info', 'stock', 'dividend', 'horizontal', 'data_time']
             missing_tables = [t for t in required_tables if t not in tables]
 
@@ -0,0 +1,123 @@
+"""
+Unit tests for CircuitBreaker state transitions (functions/retry_policy.py),
+driven by a fake clock so nothing actually sleeps.
+
+    python -m pytest test_circuit_breaker.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+
+import retry_policy  # noqa: E402
+from retry_policy import CircuitBreaker, CircuitOpenError  # noqa: E402
+
+
+class FakeTime:
+    """Stands in for the time module: sleep() advances monotonic()."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(retry_policy, "time", fake)
+    return fake
+
+
+def open_breaker(threshold=3, reset_timeout=30.0):
+    breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=reset_timeout)
+    for _ in range(threshold):
+        breaker.record_failure()
+    return breaker
+
+
+def test_stays_closed_below_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.wait_time() == 0.0
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_opens_at_threshold_and_reports_remaining_cool_down(clock):
+    breaker = open_breaker()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.wait_time() == pytest.approx(30.0)
+    clock.now += 10
+    assert breaker.wait_time() == pytest.approx(20.0)
+
+
+def test_admits_a_single_probe_after_cool_down(clock):
+    breaker = open_breaker()
+    clock.now += 30
+    assert breaker.wait_time() == 0.0
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Other callers wait while the probe is in flight
+    assert breaker.wait_time() == pytest.approx(1.0)
+
+
+def test_successful_probe_closes_the_circuit(clock):
+    breaker = open_breaker()
+    clock.now += 30
+    breaker.wait_time()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.wait_time() == 0.0
+
+
+def test_failed_probe_reopens_for_a_full_cool_down(clock):
+    breaker = open_breaker()
+    clock.now += 30
+    breaker.wait_time()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.wait_time() == pytest.approx(30.0)
+    clock.now += 30
+    assert breaker.wait_time() == 0.0
+
+
+def test_before_request_waits_out_the_cool_down(clock):
+    breaker = open_breaker()
+    breaker.before_request(max_wait=60.0)
+    assert sum(clock.slept) == pytest.approx(30.0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_before_request_fails_fast_past_max_wait(clock):
+    breaker = open_breaker()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(max_wait=5.0)
+    assert clock.slept == []
+
+
+def test_before_request_gives_up_while_another_caller_probes(clock):
+    breaker = open_breaker(reset_timeout=2.0)
+    clock.now += 2
+    breaker.wait_time()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(max_wait=3.0)
+    assert sum(clock.slept) <= 3.0
@@ -0,0 +1,117 @@
+"""
+Unit tests for the KRX holiday table and trading-day helpers
+(functions/market_calendar.py).
+
+    python -m pytest test_market_calendar.py
+"""
+
+import logging
+import os
+import sys
+from datetime import date, datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+
+import market_calendar  # noqa: E402
+from market_calendar import (  # noqa: E402
+    KRX_HOLIDAYS,
+    KST,
+    _parse_extra_holidays,
+    covered_years,
+    is_holiday,
+    is_market_open,
+    is_trading_day,
+    latest_trading_day,
+    next_session_open,
+    previous_trading_day,
+    trading_days_between,
+)
+
+
+@pytest.mark.parametrize("year", sorted(KRX_HOLIDAYS))
+def test_holiday_table_entries_are_weekday_dates(year):
+    for month_day in KRX_HOLIDAYS[year]:
+        day = datetime.strptime(f"{year}-{month_day}", "%Y-%m-%d").date()
+        assert day.weekday() < 5, f"{day} falls on a weekend"
+
+
+@pytest.mark.parametrize("year", sorted(KRX_HOLIDAYS))
+def test_year_end_closing_day_is_listed(year):
+    assert "12-31" in KRX_HOLIDAYS[year]
+
+
+def test_covered_years_match_the_table():
+    assert covered_years() == sorted(KRX_HOLIDAYS)
+
+
+@pytest.mark.parametrize("day, trading", [
+    (date(2025, 1, 27), False),  # temporary holiday before 설날
+    (date(2025, 1, 31), True),
+    (date(2025, 6, 3), False),   # presidential election
+    (date(2026, 2, 17), False),  # 설날
+    (date(2026, 3, 2), False),   # substitute for 삼일절 on a Sunday
+    (date(2026, 3, 3), True),
+    (date(2026, 10, 17), False),  # Saturday
+    (date(2027, 2, 8), False),   # substitute for 설날 on a Sunday
+    (date(2027, 12, 27), False),  # substitute for 성탄절 on a Saturday
+])
+def test_is_trading_day(day, trading):
+    assert is_trading_day(day) is trading
+
+
+def test_previous_trading_day_skips_long_holidays():
+    assert previous_trading_day(date(2025, 1, 31)) == date(2025, 1, 24)
+    assert latest_trading_day(date(2025, 1, 29)) == date(2025, 1, 24)
+    assert latest_trading_day(date(2025, 1, 31)) == date(2025, 1, 31)
+
+
+def test_trading_days_between():
+    days = list(trading_days_between(date(2025, 10, 1), date(2025, 10, 12)))
+    assert days == [date(2025, 10, 1), date(2025, 10, 2), date(2025, 10, 10)]
+
+
+def test_parse_extra_holidays_skips_and_logs_bad_entries(caplog):
+    with caplog.at_level(logging.ERROR, logger=market_calendar.logger.name):
+        parsed = _parse_extra_holidays(" 20261020, 2026-10-21,,20261399 ,20261022")
+    assert parsed == frozenset({date(2026, 10, 20), date(2026, 10, 22)})
+    assert len(caplog.records) == 2
+
+
+def test_extra_holidays_close_the_market(monkeypatch):
+    monkeypatch.setattr(market_calendar, "EXTRA_HOLIDAYS", _parse_extra_holidays("20261020"))
+    assert is_holiday(date(2026, 10, 20))
+    assert not is_trading_day(date(2026, 10, 20))
+    assert is_trading_day(date(2026, 10, 21))
+
+
+def test_uncovered_years_warn_once(monkeypatch, caplog):
+    monkeypatch.setattr(market_calendar, "_warned_years", set())
+    year = max(covered_years()) + 1
+    with caplog.at_level(logging.WARNING, logger=market_calendar.logger.name):
+        is_trading_day(date(year, 1, 4))
+        is_trading_day(date(year, 1, 5))
+        is_trading_day(date(max(covered_years()), 1, 4))
+    assert len(caplog.records) == 1
+    assert str(year) in caplog.records[0].getMessage()
+
+
+@pytest.mark.parametrize("moment, open_", [
+    (datetime(2026, 10, 19, 8, 59, tzinfo=KST), False),
+    (datetime(2026, 10, 19, 9, 0, tzinfo=KST), True),
+    (datetime(2026, 10, 19, 15, 30, tzinfo=KST), True),
+    (datetime(2026, 10, 19, 15, 31, tzinfo=KST), False),
+    (datetime(2026, 10, 9, 10, 0, tzinfo=KST), False),  # 한글날
+])
+def test_is_market_open(moment, open_):
+    assert is_market_open(moment) is open_
+
+
+def test_next_session_open():
+    before_open = datetime(2026, 10, 19, 8, 0, tzinfo=KST)
+    assert next_session_open(before_open) == datetime(2026, 10, 19, 9, 0, tzinfo=KST)
+    # Thursday afternoon before the 한글날 long weekend -> the following Monday
+    assert next_session_open(datetime(2026, 10, 8, 16, 0, tzinfo=KST)) == datetime(2026, 10, 12, 9, 0, tzinfo=KST)
+    utc_evening = datetime.fromisoformat("2026-10-19T23:30:00+00:00")  # 08:30 KST on the 20th
+    assert next_session_open(utc_evening) == datetime(2026, 10, 20, 9, 0, tzinfo=KST)
@@ -0,0 +1,86 @@
+"""
+Unit tests for functions/ohlcv_codec.py: every encoding round-trips
+through encode_month/decode_month.
+
+    python -m pytest test_ohlcv_codec.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+
+from ohlcv_codec import (  # noqa: E402
+    ENCODING_ARRAY,
+    ENCODING_MAP,
+    ENCODING_PACKED,
+    ENCODINGS,
+    FIELDS,
+    day_update,
+    decode_month,
+    document_encoding,
+    encode_month,
+)
+
+DAYS = {
+    "02": {"open": 71000, "high": 72500, "low": 70800, "close": 72000, "volume": 15234567},
+    "03": {"open": 72100, "high": 72100, "low": 69900, "close": 70000, "volume": 0},
+    # Volume past 2**32 needs the packed Q column
+    "31": {"open": 1, "high": 4294967295, "low": 0, "close": 2, "volume": 2 ** 40 + 7},
+}
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_round_trip(encoding):
+    doc = encode_month(DAYS, encoding)
+    assert decode_month(doc) == DAYS
+    assert document_encoding(doc) == encoding
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_round_trip_empty_month(encoding):
+    assert decode_month(encode_month({}, encoding)) == {}
+
+
+def test_array_form_is_accepted_as_input():
+    days = {day: [values[field] for field in FIELDS] for day, values in DAYS.items()}
+    assert decode_month(encode_month(days, ENCODING_PACKED)) == DAYS
+
+
+def test_map_documents_have_no_encoding_field():
+    assert set(encode_month(DAYS, ENCODING_MAP)) == {"days"}
+    assert document_encoding({}) == ENCODING_MAP
+
+
+def test_merged_days_overlay_a_packed_blob():
+    doc = encode_month({"02": DAYS["02"]}, ENCODING_PACKED)
+    newer = dict(DAYS["03"], close=70500)
+    doc.update(day_update("03", newer, ENCODING_ARRAY))
+    assert decode_month(doc) == {"02": DAYS["02"], "03": newer}
+
+
+def test_day_updates_mark_their_encoding():
+    from firebase_admin import firestore
+
+    array = day_update("02", DAYS["02"], ENCODING_ARRAY)
+    assert document_encoding(array) == ENCODING_ARRAY
+    assert decode_month(array) == {"02": DAYS["02"]}
+    # A map day written into an array document drops the array marker
+    assert day_update("02", DAYS["02"], ENCODING_MAP)["enc"] is firestore.DELETE_FIELD
+
+
+def test_packed_blob_survives_bytes_like_values():
+    doc = encode_month(DAYS, ENCODING_PACKED)
+    doc["packed"] = bytearray(doc["packed"])
+    assert decode_month(doc) == DAYS
+
+
+def test_unknown_encodings_are_rejected():
+    with pytest.raises(ValueError):
+        encode_month(DAYS, "columnar")
+    with pytest.raises(ValueError):
+        document_encoding({"enc": 9})
+    with pytest.raises(ValueError):
+        day_update("02", DAYS["02"], ENCODING_PACKED)
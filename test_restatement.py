@@ -0,0 +1,94 @@
+"""
+Unit tests for functions/restatement.py: adjustment-factor detection and
+column restatement.
+
+    python -m pytest test_restatement.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+
+from restatement import detect_adjustment, restate_columns  # noqa: E402
+
+DATES = ["20250102", "20250103", "20250106", "20250107", "20250108"]
+CLOSES = [50000, 51000, 52000, 26500, 27000]
+
+
+def stored_columns(closes=CLOSES):
+    return {
+        "code": "005930",
+        "dates": list(DATES),
+        "open": [close - 500 for close in closes],
+        "high": [close + 1000 for close in closes],
+        "low": [close - 1000 for close in closes],
+        "close": list(closes),
+        "volume": [1000, 1100, 1200, 2500, 2600],
+    }
+
+
+def kis_series(columns, factor=1.0, volume_factor=1.0, boundary="20250106"):
+    """KIS rows (newest first) for the stored days, adjusted up to `boundary`."""
+    rows = []
+    for idx, date in enumerate(columns["dates"]):
+        scale, volume_scale = (factor, volume_factor) if date <= boundary else (1.0, 1.0)
+        row = {field: round(columns[field][idx] * scale) for field in ("open", "high", "low", "close")}
+        row.update(date=date, volume=round(columns["volume"][idx] * volume_scale))
+        rows.append(row)
+    return rows[::-1]
+
+
+def test_matching_history_needs_no_adjustment():
+    stored = stored_columns()
+    assert detect_adjustment(stored, kis_series(stored)) is None
+
+
+def test_split_is_detected_with_its_boundary_and_factors():
+    stored = stored_columns()
+    result = detect_adjustment(stored, kis_series(stored, factor=0.5, volume_factor=2.0))
+    assert result["boundary"] == "20250106"
+    assert result["factor"] == pytest.approx(0.5)
+    assert result["volume_factor"] == pytest.approx(2.0)
+    assert sorted(result["dates"]) == DATES
+
+
+def test_whole_won_rounding_is_tolerated():
+    # 1:3 adjustment: KIS rounds every price to whole won
+    stored = stored_columns()
+    result = detect_adjustment(stored, kis_series(stored, factor=1 / 3))
+    assert result["factor"] == pytest.approx(1 / 3, rel=1e-3)
+    assert result["volume_factor"] == 1.0
+
+
+def test_inconsistent_factors_are_rejected():
+    stored = stored_columns()
+    series = kis_series(stored, factor=0.5)
+    oldest = series[-1]
+    for field in ("open", "high", "low", "close"):
+        oldest[field] = round(oldest[field] * 0.8)
+    with pytest.raises(ValueError):
+        detect_adjustment(stored, series)
+
+
+def test_days_outside_stored_history_are_ignored():
+    stored = stored_columns()
+    series = [{"date": "20250109", "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1}]
+    series += kis_series(stored)
+    assert detect_adjustment(stored, series) is None
+
+
+def test_restate_columns_rescales_up_to_the_boundary():
+    stored = stored_columns()
+    series = kis_series(stored, factor=0.5, volume_factor=2.0)
+    overrides = {row["date"]: row for row in series if row["date"] == "20250106"}
+    restated = restate_columns(stored, 0.5, 2.0, "20250106", overrides)
+
+    assert restated["dates"] == DATES
+    assert restated["close"] == [25000, 25500, 26000, 26500, 27000]
+    assert restated["volume"] == [2000, 2200, 2400, 2500, 2600]
+    assert restated["open"][2] == overrides["20250106"]["open"]
+    # The stored columns are not modified in place
+    assert stored["close"] == CLOSES
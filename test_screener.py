@@ -0,0 +1,101 @@
+"""
+Unit tests for the screener's expression whitelist and FeatureSnapshot.screen
+(functions/screener.py).
+
+    python -m pytest test_screener.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+
+from screener import FeatureSnapshot, compile_expression  # noqa: E402
+
+ROWS = {
+    "005930": {"name": "삼성전자", "period": "월말", "close": 70000, "ma200": 75000, "ttmYield": 0.021,
+               "avgVolume20": 15000000},
+    "000660": {"name": "SK하이닉스", "period": "월말", "close": 180000, "ma200": 150000, "ttmYield": 0.006,
+               "avgVolume20": 3000000},
+    "088980": {"name": "맥쿼리인프라", "period": "반기", "close": 11000, "ma200": 11500, "ttmYield": 0.068,
+               "avgVolume20": None},
+}
+
+
+@pytest.fixture
+def snapshot():
+    return FeatureSnapshot(ROWS)
+
+
+@pytest.mark.parametrize("expression", [
+    "ttmYield > 0.05 and close < ma200",
+    "(avgVolume20 * close) >= 1e9",
+    "-close < abs(ma200 - close) * 2",
+    "period == '월말' or not close > 100000",
+    "0 < ttmYield <= 0.1",
+])
+def test_whitelisted_expressions_compile(expression):
+    assert callable(compile_expression(expression))
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os').system('true')",
+    "close.__class__",
+    "close[0]",
+    "close ** 99",
+    "close // 2",
+    "[close for close in ma200]",
+    "lambda: close",
+    "max(close)",
+    "abs(close, 1)",
+    "unknown > 1",
+    "True and close > 1",
+    "close >",
+    "close in ma200",
+    "x" * 501,
+])
+def test_unsupported_syntax_is_rejected(expression):
+    with pytest.raises(ValueError):
+        compile_expression(expression)
+
+
+@pytest.mark.parametrize("expression", [
+    "name * 99999999999999",
+    "99999999999999 * name",
+    "'a' * 99999999999999",
+    "period + 'x'",
+    "lastDate - 1",
+    "close + name",
+    "-name",
+    "abs(period)",
+    "(close > 1) * 2",
+])
+def test_arithmetic_on_strings_is_rejected(expression):
+    with pytest.raises(ValueError, match="numeric"):
+        compile_expression(expression)
+
+
+def test_screen_filters_and_sorts(snapshot):
+    result = snapshot.screen(where="close < ma200", sort="-ttmYield", fields=["name", "ttmYield"])
+    assert result["matched"] == 2
+    assert [row["code"] for row in result["results"]] == ["088980", "005930"]
+    assert set(result["results"][0]) == {"code", "name", "ttmYield"}
+
+
+def test_screen_compares_string_fields(snapshot):
+    result = snapshot.screen(where="period == '월말'", sort="close")
+    assert [row["code"] for row in result["results"]] == ["005930", "000660"]
+
+
+def test_missing_values_never_match_and_sort_last(snapshot):
+    assert snapshot.screen(where="avgVolume20 * close >= 1e9")["matched"] == 2
+    result = snapshot.screen(sort="-avgVolume20")
+    assert result["results"][-1]["code"] == "088980"
+
+
+def test_screen_limit_and_unknown_fields(snapshot):
+    assert len(snapshot.screen(limit=1)["results"]) == 1
+    with pytest.raises(ValueError):
+        snapshot.screen(fields=["price"])